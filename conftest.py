@@ -0,0 +1,2 @@
+# Makes pytest put the project root on sys.path, so the contract tests can
+# import the deploy package (`from deploy.artifacts import ...`).
@@ -63,6 +63,26 @@ contract ViewTokenMintage is DSAuth, DSMath {
         TokensMinted(recipient, tokens, categoryId);
     }
 
+    function mintBatch(address[] recipients, uint[] tokens, CategoryId categoryId) public auth {
+        require(recipients.length > 0);
+        require(recipients.length == tokens.length);
+        Category storage category = categories[uint8(categoryId)];
+
+        uint total = 0;
+        for (uint i = 0; i < tokens.length; i++) {
+            require(tokens[i] > 0);
+            total = add(total, tokens[i]);
+        }
+        require(add(total, category.amountMinted) <= category.mintLimit);
+
+        categories[uint8(categoryId)].amountMinted += total;
+        viewToken.mint(this, total);
+        for (i = 0; i < recipients.length; i++) {
+            viewToken.transferFrom(this, recipients[i], tokens[i]);
+            TokensMinted(recipients[i], tokens[i], categoryId);
+        }
+    }
+
     function destruct(address addr) public auth {
         selfdestruct(addr);
     }
@@ -0,0 +1,99 @@
+from hashlib import sha256
+import json
+import os
+import pathlib
+
+import populus
+from populus import Project
+from populus.utils.filesystem import get_latest_mtime
+
+ARTIFACTS_DIR = 'build/artifacts'
+
+def sources_hash(project_dir, source_dirs=('./contracts',)) -> str:
+    """ Hash the Solidity sources of a project, including the
+    ones of submodules (dappsys) under its source dirs.
+
+    Args:
+        project_dir: Project root.
+        source_dirs: Contract source dirs, relative to `project_dir`.
+    """
+    project_dir = pathlib.Path(project_dir)
+    digest = sha256()
+    for source_dir in source_dirs:
+        for path in sorted((project_dir / source_dir).rglob('*.sol')):
+            digest.update(str(path.relative_to(project_dir)).encode() + b'\0')
+            digest.update(path.read_bytes() + b'\0')
+    return digest.hexdigest()
+
+def build_hash(compilation: dict) -> str:
+    """ Hash everything besides the sources that goes into
+    the compiled contracts: the solc version, the compilation
+    settings (backend, optimizer, remappings) and populus' own
+    version, which shapes the compiled contract data.
+    """
+    from solc import get_solc_version_string
+    digest = sha256()
+    digest.update(get_solc_version_string().encode() + b'\0')
+    digest.update(json.dumps(compilation, sort_keys=True).encode() + b'\0')
+    digest.update(populus.__version__.encode())
+    return digest.hexdigest()
+
+def artifact_key(project_dir) -> str:
+    """ The `<sources hash>-<build hash>` key, under which the
+    compiled contracts of a project are cached.
+    """
+    with open(pathlib.Path(project_dir) / 'project.json') as f:
+        compilation = json.load(f)['compilation']
+    return '-'.join([
+        sources_hash(project_dir, compilation['contract_source_dirs']),
+        build_hash(compilation),
+    ])
+
+def artifact_path(project_dir) -> pathlib.Path:
+    return pathlib.Path(project_dir) / ARTIFACTS_DIR / f'{artifact_key(project_dir)}.json'
+
+def load_artifact(contract_name: str, project_dir) -> dict:
+    """ Load a compiled contract (abi, bytecode, bytecode_runtime...)
+    from the artifact cache, without compiling anything.
+
+    Returns:
+        The compiled contract data, or None if the current sources were
+        never compiled with the current solc version and settings.
+    """
+    path = artifact_path(project_dir)
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f).get(contract_name)
+
+
+class CachedProject(Project):
+    """ A populus Project that compiles its contracts at most once for
+    a given set of sources, solc version and compilation settings.
+
+    The compiled contract data is stored in `build/artifacts`, under
+    `<sources hash>-<build hash>.json`, and loaded from there by
+    every later run (deploy scripts, tests, scripts/distribute.py)
+    instead of invoking solc again. Nothing is hashed or loaded
+    until a contract is first needed.
+    """
+
+    @property
+    def compiled_contract_data(self):
+        if self.is_compiled_contract_cache_stale():
+            path = artifact_path(self.project_dir)
+            if path.exists():
+                with open(path) as f:
+                    self.fill_contracts_cache(
+                        json.load(f),
+                        get_latest_mtime(self.get_all_source_file_paths()))
+            else:
+                contracts = super().compiled_contract_data
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+                with open(tmp_path, 'w') as f:
+                    json.dump(contracts, f)
+                # atomic, as parallel test workers may compile at once
+                tmp_path.replace(path)
+                return contracts
+        return super().compiled_contract_data
@@ -1,10 +1,15 @@
+from abc import ABC, abstractmethod
+
 from utils import (
     unlock_wallet,
     check_succesful_tx,
     default_wallet_account,
 )
 
-class BaseDeployer:
+class BaseDeployer(ABC):
+    __target__ = None
+    # Contract instances, by step name, that have to be deployed beforehand.
+    __dependencies__ = []
 
     def __init__(self, chain_name, chain, owner=None):
         """ Initialize the deployer.
@@ -25,6 +30,13 @@ class BaseDeployer:
         if self.chain_name not in ['tester', 'testrpc']:
             unlock_wallet(self.web3, self.owner)
 
+    @classmethod
+    @abstractmethod
+    def plan(cls, **kwargs):
+        """ Steps deploying and setting up `__target__`,
+        to run with a `DeploymentPlanner`.
+        """
+
     def deploy_contract(self, contract_name, args=[], **kwargs):
         tx_props = {'from': self.owner}
         if 'gas' in kwargs:
@@ -46,10 +58,39 @@ class BaseDeployer:
             src_address:  Contract being granted priviliges.
             dest_address: Contract for which priviliges will be granted.
         """
+        return self.authority_permit(
+            authority, src_address, dst_address, authority.call().ANY())
+
+    def authority_permit(self, authority, src_address, dst_address, sig):
+        """  Grant a single function call privilege via authority proxy.
+
+        Args:
+            authority: Address of our authority contract.
+            src_address:  Account or contract being granted the privilege.
+            dest_address: Contract for which the privilege will be granted.
+            sig: Function selector, as a bytes32 value.
+        """
         tx_props = {'from': self.owner}
         tx = authority.transact(tx_props).permit(
             src_address,
             dst_address,
-            authority.call().ANY()
+            sig
+        )
+        return check_succesful_tx(self.web3, tx)
+
+    def authority_forbid(self, authority, src_address, dst_address, sig):
+        """  Revoke a privilege granted with `authority_permit`.
+
+        Args:
+            authority: Address of our authority contract.
+            src_address:  Account or contract losing the privilege.
+            dest_address: Contract for which the privilege was granted.
+            sig: Function selector, as a bytes32 value.
+        """
+        tx_props = {'from': self.owner}
+        tx = authority.transact(tx_props).forbid(
+            src_address,
+            dst_address,
+            sig
         )
         return check_succesful_tx(self.web3, tx)
@@ -0,0 +1,66 @@
+import click
+from artifacts import CachedProject
+from utils import (
+    load_contract,
+    confirm_deployment,
+)
+from token_mintage import TokenMintage
+
+
+def load_deployer(chain_name, chain, owner, view_authority_addr, token_mintage_addr):
+    deps = {
+        'ViewAuthority': load_contract(chain, 'DSGuard', view_authority_addr),
+    }
+    instance = load_contract(chain, 'ViewTokenMintage', token_mintage_addr)
+    deployer = TokenMintage(
+        chain_name, chain, owner=owner, instance=instance, **deps)
+    print(f'Head block is {deployer.web3.eth.blockNumber} '
+          f'on the "{chain_name}" chain')
+    print('Owner address is', deployer.owner)
+    print('ViewAuthority address is', view_authority_addr)
+    print('ViewTokenMintage address is', token_mintage_addr)
+    return deployer
+
+
+@click.group()
+def cli():
+    """ Manage the accounts allowed to mint from ViewTokenMintage,
+    such as the owners `distribute.py payout` shards payouts across.
+    """
+    pass
+
+@cli.command()
+@click.option('--chain', 'chain_name', default='tester',
+              type=str, help='Name of ETH Chain')
+@click.option('--owner', default=None,
+              type=str, help='Owner of ViewAuthority and ViewTokenMintage')
+@click.argument('view-authority-addr', type=str)
+@click.argument('token-mintage-addr', type=str)
+@click.argument('accounts', nargs=-1, required=True)
+def grant(chain_name, owner, view_authority_addr, token_mintage_addr, accounts):
+    """ Permit ACCOUNTS to mint VIEW tokens """
+    with CachedProject().get_chain(chain_name) as chain:
+        deployer = load_deployer(
+            chain_name, chain, owner, view_authority_addr, token_mintage_addr)
+        if confirm_deployment(chain_name, 'mint permissions'):
+            deployer.permit_minters(accounts)
+
+@cli.command()
+@click.option('--chain', 'chain_name', default='tester',
+              type=str, help='Name of ETH Chain')
+@click.option('--owner', default=None,
+              type=str, help='Owner of ViewAuthority')
+@click.argument('view-authority-addr', type=str)
+@click.argument('token-mintage-addr', type=str)
+@click.argument('accounts', nargs=-1, required=True)
+def revoke(chain_name, owner, view_authority_addr, token_mintage_addr, accounts):
+    """ Revoke the mint permission of ACCOUNTS """
+    with CachedProject().get_chain(chain_name) as chain:
+        deployer = load_deployer(
+            chain_name, chain, owner, view_authority_addr, token_mintage_addr)
+        if confirm_deployment(chain_name, 'mint permissions'):
+            deployer.forbid_minters(accounts)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,343 @@
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError, wait, FIRST_COMPLETED
+from typing import Dict, List
+import json
+import os
+import pathlib
+
+import rlp
+import stringcase
+from eth_utils import decode_hex, keccak, to_checksum_address
+from web3 import HTTPProvider, IPCProvider
+from utils import load_contract, check_succesful_tx
+
+# DSGuard's ANY, which permits every function.
+ANY = b'\xff' * 32
+
+
+class Ref:
+    def __init__(self, name: str):
+        """ The address of the contract deployed (or loaded) by another step.
+
+        Args:
+            name: Name of that step (ie. ViewToken).
+        """
+        self.name = name
+
+
+class Step:
+    def __init__(self,
+                 name,
+                 contract=None,
+                 args=(),
+                 target=None,
+                 function=None,
+                 depends=(),
+                 gas=None):
+        """ A single transaction of a deployment plan: either a contract
+        deployment, or a call to an already deployed contract.
+
+        Args:
+            name: Unique name of the step. Deployments are named after the
+                instance they create (ie. ViewToken), for `Ref`s to it.
+            contract: Contract to deploy (ie. DSToken).
+            args: Constructor or function arguments. `Ref`s are replaced
+                by the address of their step's contract.
+            target: Name of the step whose contract is called.
+            function: Function called on `target`.
+            depends: Other steps that have to be mined first.
+            gas: Gas limit, estimated by the node if not set.
+        """
+        assert bool(contract) != bool(target and function), \
+            f'Step {name} should either deploy a contract or call one'
+        self.name = name
+        self.contract = contract
+        self.args = list(args)
+        self.target = target
+        self.function = function
+        self.gas = gas
+        self.dependencies = set(depends) | {
+            x.name for x in self.args if isinstance(x, Ref)}
+        if target:
+            self.dependencies.add(target)
+
+
+def contract_address(sender: str, nonce: int) -> str:
+    """ Address of the contract deployed by `sender` at `nonce`."""
+    return to_checksum_address(keccak(rlp.encode([decode_hex(sender), nonce]))[12:])
+
+def default_manifest(chain_name, target):
+    """ Manifest path of a deployment, or None on the in-process
+    chains, which start afresh on every run.
+    """
+    if chain_name in ['tester', 'testrpc']:
+        return None
+    return f'build/deployments/{chain_name}/{stringcase.snakecase(target)}.json'
+
+
+class DeploymentPlanner:
+
+    def __init__(self, deployer, manifest_path=None, instances=None, timeout=600):
+        """ Deploy contracts and set them up, from the steps planned by
+        deployer classes.
+
+        The steps form a graph, from the contracts they deploy and call,
+        and from the `__dependencies__` of deployers. Every step whose
+        dependencies are mined is broadcast straight away, at the next
+        nonce of the owner, so independent steps are mined together, and
+        their receipts are waited for in parallel. In-process chains
+        (eth-tester) aren't thread-safe, so on them every receipt is
+        waited for in turn, from the thread sending the transactions.
+
+        Progress is written to a JSON manifest as it goes: the nonce,
+        txid and address of every step. Running the same plan again with
+        the manifest picks up where a partial deployment stopped. Mined
+        steps are not sent again, pending ones are waited for, and lost
+        ones are sent again. A lost deployment whose contract exists at
+        its address (from the owner and nonce) was mined all the same.
+        A lost call whose nonce was taken since is not sent again, as it
+        may have been mined: the run stops, for it to be checked.
+        Steps still pending after `timeout` are waited for again by the
+        next run.
+
+        Args:
+            deployer: Deployer of the chain and owner to transact with.
+            manifest_path: JSON manifest file, or None not to keep one.
+            instances: Contract instances already deployed, by step name.
+            timeout: Seconds to wait for a receipt.
+        """
+        self.chain = deployer.chain
+        self.web3 = deployer.web3
+        self.owner = deployer.owner
+        # in-process chains mine every transaction as it is sent,
+        # and don't take explicit nonces
+        self.assign_nonces = deployer.chain_name not in ['tester', 'testrpc']
+        # nodes are reached through HTTP or IPC, in-process chains aren't thread-safe
+        self.wait_in_parallel = isinstance(
+            self.web3.providers[0], (HTTPProvider, IPCProvider))
+        self.manifest_path = manifest_path
+        self.instances = dict(instances or {})
+        self.timeout = timeout
+        self.steps = {}
+        self.manifest = {'owner': self.owner, 'steps': {}}
+
+    def add(self, deployer_class, **kwargs):
+        """ Add the steps of a deployer class to the plan.
+
+        Its `__dependencies__` have to be provided by the steps planned
+        so far, or by the instances already deployed, and every step it
+        plans comes after them.
+
+        Args:
+            deployer_class: A `BaseDeployer` subclass.
+            kwargs: Arguments of its `plan` method.
+        """
+        missing = [
+            x for x in deployer_class.__dependencies__
+            if x not in self.steps and x not in self.instances
+        ]
+        if missing:
+            raise ValueError(
+                f'{deployer_class.__target__} depends on {", ".join(missing)}, '
+                'which are neither planned nor deployed')
+
+        for step in deployer_class.plan(**kwargs):
+            if step.name in self.steps:
+                raise ValueError(f'Step {step.name} is planned twice')
+            step.dependencies.update(deployer_class.__dependencies__)
+            self.steps[step.name] = step
+        return self
+
+    def order(self) -> List[Step]:
+        """ Sort the steps so that each comes after its dependencies."""
+        ordered, marked = [], {}
+
+        def visit(name, path):
+            if marked.get(name) == 'done' or name in self.instances:
+                return
+            if name not in self.steps:
+                raise ValueError(f'{path[-1]} depends on unknown step {name}')
+            if marked.get(name) == 'visiting':
+                raise ValueError(f'Circular dependency: {" -> ".join(path + [name])}')
+            marked[name] = 'visiting'
+            for dependency in sorted(self.steps[name].dependencies):
+                visit(dependency, path + [name])
+            marked[name] = 'done'
+            ordered.append(self.steps[name])
+
+        for name in self.steps:
+            visit(name, [])
+        return ordered
+
+    def load_manifest(self):
+        if not self.manifest_path or not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path) as f:
+            manifest = json.load(f)
+        if manifest['owner'].lower() != self.owner.lower():
+            raise ValueError(
+                f'{self.manifest_path} was deployed by {manifest["owner"]}')
+        self.manifest = manifest
+
+    def save_manifest(self):
+        if not self.manifest_path:
+            return
+        path = pathlib.Path(self.manifest_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            f.write(json.dumps(self.manifest, indent=2))
+        tmp_path.replace(path)
+
+    def record(self, step: Step, **props):
+        self.manifest['steps'].setdefault(step.name, {}).update(props)
+        self.save_manifest()
+
+    def resume(self, step: Step) -> str:
+        """ Reconcile a step with the manifest of a previous run.
+
+        Returns:
+            'done', 'pending' (to be waited for), or None (to be sent).
+        """
+        entry = self.manifest['steps'].get(step.name)
+        if not entry or entry['status'] == 'failed':
+            return None
+        if entry['status'] == 'done':
+            if step.contract:
+                self.instances[step.name] = load_contract(
+                    self.chain, step.contract, entry['address'])
+            return 'done'
+
+        txid = entry.get('txid')
+        if txid and self.web3.eth.getTransaction(txid):
+            return 'pending'
+        address = entry.get('address')
+        if step.contract and address and \
+                self.web3.eth.getCode(address) not in ('0x', '0x0', b''):
+            print(f'{step.name} was deployed at {address} by a lost transaction')
+            self.record(step, status='done')
+            self.instances[step.name] = load_contract(
+                self.chain, step.contract, address)
+            return 'done'
+
+        nonce = entry.get('nonce')
+        if nonce is None:
+            return None
+        if step.contract and \
+                nonce < self.web3.eth.getTransactionCount(self.owner, 'latest'):
+            # mined, without deploying the contract at its address
+            return None
+        if nonce < self.web3.eth.getTransactionCount(self.owner, 'pending'):
+            raise RuntimeError(
+                f'{step.name} was sent at nonce {nonce}, which an unknown '
+                'transaction has taken since. Check whether it was that step, '
+                f'and set its status in {self.manifest_path} to "done", or to '
+                '"failed" to send it again.')
+        return None
+
+    def send(self, step: Step, nonce: int) -> str:
+        """ Broadcast a step's transaction, at `nonce`."""
+        tx_props = {'from': self.owner}
+        if step.gas:
+            tx_props['gas'] = step.gas
+        if self.assign_nonces:
+            tx_props['nonce'] = nonce
+        args = [
+            self.instances[x.name].address if isinstance(x, Ref) else x
+            for x in step.args
+        ]
+
+        if step.contract:
+            address = contract_address(self.owner, nonce) \
+                if self.assign_nonces else None
+            # recorded first, to find the contract if the txid is lost
+            self.record(step, status='sending', nonce=nonce, address=address)
+            factory = self.chain.provider.get_contract_factory(step.contract)
+            txid = factory.deploy(transaction=tx_props, args=args)
+        else:
+            self.record(step, status='sending', nonce=nonce)
+            instance = self.instances[step.target]
+            txid = getattr(instance.transact(tx_props), step.function)(*args)
+
+        self.record(step, status='sent', txid=txid)
+        print(f'Sent {step.name} (nonce {nonce}): {txid}')
+        return txid
+
+    def complete(self, step: Step, receipt: dict):
+        if step.contract:
+            address = receipt['contractAddress']
+            self.instances[step.name] = load_contract(
+                self.chain, step.contract, address)
+            self.record(step, status='done', address=address)
+            print(f'{step.name} address is {address}')
+        else:
+            self.record(step, status='done')
+            print(f'{step.name} is done')
+
+    def run(self) -> Dict[str, object]:
+        """ Run the plan, and wait until every step is mined.
+
+        Returns:
+            Contract instances, by step name.
+        """
+        steps = self.order()
+        self.load_manifest()
+        done, in_flight, failed = set(), {}, {}
+        with ThreadPoolExecutor(max_workers=max(len(steps), 1)) as pool:
+
+            def wait_for(step):
+                txid = self.manifest['steps'][step.name]['txid']
+                if self.wait_in_parallel:
+                    future = pool.submit(
+                        check_succesful_tx, self.web3, txid, self.timeout)
+                else:
+                    future = Future()
+                    try:
+                        future.set_result(
+                            check_succesful_tx(self.web3, txid, self.timeout))
+                    except Exception as e:
+                        future.set_exception(e)
+                in_flight[future] = step
+
+            for step in steps:
+                state = self.resume(step)
+                if state == 'done':
+                    done.add(step.name)
+                elif state == 'pending':
+                    wait_for(step)
+
+            nonce = self.web3.eth.getTransactionCount(self.owner, 'pending')
+            while True:
+                waiting = {x.name for x in in_flight.values()}
+                for step in steps:
+                    if step.name in done or step.name in waiting \
+                            or step.name in failed:
+                        continue
+                    if all(x in done or x in self.instances
+                           for x in step.dependencies):
+                        self.send(step, nonce)
+                        nonce += 1
+                        wait_for(step)
+                if not in_flight:
+                    break
+
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    step = in_flight.pop(future)
+                    try:
+                        self.complete(step, future.result())
+                        done.add(step.name)
+                    except TimeoutError as e:
+                        # still pending, and left as sent for the next run
+                        failed[step.name] = e
+                        print(f'{step.name} is not mined after {self.timeout}s, '
+                              'run again to keep waiting for it')
+                    except Exception as e:
+                        failed[step.name] = e
+                        self.record(step, status='failed')
+                        print(f'{step.name} failed: {e!r}')
+
+        if failed or len(done) < len(steps):
+            blocked = [x.name for x in steps if x.name not in done]
+            raise RuntimeError(
+                f'Deployment incomplete, {", ".join(blocked)} not done')
+        return self.instances
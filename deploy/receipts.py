@@ -0,0 +1,233 @@
+from collections.abc import Mapping
+from concurrent.futures import Future, TimeoutError
+from typing import Iterable, Set, Tuple
+import copy
+import threading
+import time
+import weakref
+
+from web3 import HTTPProvider, IPCProvider, Web3
+
+
+class ReceiptScan:
+
+    def __init__(self):
+        """ What to look up next, to find the receipts of many pending
+        transactions at once, whatever the transport. Shared by the
+        threaded `ReceiptWaiter` below, and its asyncio counterpart
+        (`scripts/receipts.py`).
+
+        Each block mined since the last poll is fetched once, and only
+        the pending transactions it includes are looked up. Transactions
+        are also looked up when first tracked, in case they were mined
+        before, and again after a failed lookup.
+        """
+        self.pending = set()
+        self.new = set()
+        self.next_block = None
+
+    def add(self, txids: Iterable[str]):
+        txids = {x.lower() for x in txids} - self.pending
+        self.pending |= txids
+        self.new |= txids
+
+    def discard(self, txid: str):
+        self.pending.discard(txid.lower())
+        self.new.discard(txid.lower())
+
+    def track(self, txids: Iterable[str]):
+        """ Wait for exactly these transactions, from now on."""
+        txids = {x.lower() for x in txids}
+        self.new = (self.new & txids) | (txids - self.pending)
+        self.pending = txids
+
+    def blocks(self, head: int) -> range:
+        """ Numbers of the blocks to fetch, up to `head`."""
+        start = head + 1 if self.next_block is None else self.next_block
+        return range(start, head + 1)
+
+    def scan(self, blocks: Iterable[dict]) -> Tuple[Set[str], int]:
+        """ Find the pending transactions included in `blocks`, fetched
+        in the order of `self.blocks()`. A missing block ends the scan,
+        and the next poll resumes from it.
+
+        Returns:
+            The txids found, and the next block to fetch.
+        """
+        included, next_block = set(), self.next_block
+        for block in blocks:
+            if not isinstance(block, Mapping) or not block:
+                break
+            for tx in block['transactions']:
+                included.add((tx['hash'] if isinstance(tx, Mapping) else tx).lower())
+            number = block['number']
+            next_block = (int(number, 16) if isinstance(number, str) else number) + 1
+        return included & self.pending, next_block
+
+    def resolve(self, looked_up: Set[str], found: Set[str], retry: Set[str], next_block):
+        """ Record a poll, once its lookups are done: `found` transactions
+        are no longer pending, and `retry` ones are looked up again.
+        """
+        self.pending -= found
+        self.new = (self.new - looked_up - found) | retry
+        self.next_block = next_block
+
+
+class ReceiptWaiter:
+
+    def __init__(self, web3: Web3, poll_interval=1.0):
+        """ Wait for the receipts of many transactions at once.
+
+        A single background thread polls `blockNumber`, and fetches each
+        new block once, with its transactions. Every pending transaction
+        found in it is resolved from that block, and its receipt, so
+        waiting for N transactions costs one block fetch per block,
+        rather than a receipt lookup per transaction per poll.
+
+        Transactions already mined when submitted are looked up once.
+
+        It polls through a web3 of its own, on a copy of the provider of
+        `web3`, rather than the one of the calling threads. In-process
+        chains (eth-tester) aren't thread-safe however, whichever provider
+        they are called through, so for them there is no background
+        thread: `wait` polls from the waiting thread.
+
+        Args:
+            web3: Web3 instance.
+            poll_interval: Seconds between `blockNumber` polls.
+        """
+        provider = copy.copy(web3.providers[0])
+        provider._request_func_cache = (None, None)
+        self.web3 = Web3(provider)
+        self.threaded = isinstance(provider, (HTTPProvider, IPCProvider))
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.poll_lock = threading.Lock()
+        self.pending = {}
+        self.scan = ReceiptScan()
+        self.thread = None
+
+    def submit(self, txid: str) -> Future:
+        """ Start waiting for a transaction.
+
+        Returns:
+            A future of its (receipt, transaction).
+        """
+        txid = txid.lower()
+        with self.lock:
+            if txid not in self.pending:
+                self.pending[txid] = Future()
+                self.scan.add([txid])
+            if self.threaded and not self.thread:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+            return self.pending[txid]
+
+    def wait(self, txid: str, timeout=600) -> Tuple[dict, dict]:
+        """ Wait for a transaction to be mined.
+
+        Returns:
+            Its (receipt, transaction).
+        """
+        future = self.submit(txid)
+        try:
+            if self.threaded:
+                return future.result(timeout)
+            return self._poll_until(future, timeout)
+        except TimeoutError:
+            with self.lock:
+                self.pending.pop(txid.lower(), None)
+                self.scan.discard(txid)
+            raise
+        finally:
+            if not self.threaded:
+                self._release_if_idle()
+
+    def _poll_until(self, future: Future, timeout):
+        deadline = time.time() + timeout
+        while True:
+            with self.poll_lock:
+                if not future.done():
+                    self.poll()
+            if future.done() or time.time() >= deadline:
+                return future.result(0)
+            time.sleep(self.poll_interval)
+
+    def _release_if_idle(self) -> bool:
+        """ Stop polling, and drop out of the shared waiters, once
+        nothing is waited for.
+        """
+        with _waiters_lock, self.lock:
+            if self.pending:
+                return False
+            self.thread = None
+            for web3, waiter in list(_waiters.items()):
+                if waiter is self:
+                    del _waiters[web3]
+            return True
+
+    def _run(self):
+        while True:
+            if self._release_if_idle():
+                return
+            try:
+                self.poll()
+            except Exception as e:
+                print(f'Unable to poll for receipts, retrying: {e!r}')
+            time.sleep(self.poll_interval)
+
+    def poll(self):
+        """ Resolve the pending transactions mined since the last poll."""
+        head = self.web3.eth.blockNumber
+        with self.lock:
+            new = set(self.scan.new)
+            numbers = self.scan.blocks(head)
+        found = {}
+
+        # mined before they were submitted (or before the first poll)
+        for txid in new:
+            tx = self.web3.eth.getTransaction(txid)
+            if tx and tx['blockNumber'] is not None:
+                found[txid] = tx
+
+        blocks = []
+        for number in numbers:
+            blocks.append(self.web3.eth.getBlock(number, True))
+            if not blocks[-1]:
+                # the head moved back
+                break
+        with self.lock:
+            included, next_block = self.scan.scan(blocks)
+        txs = {
+            tx['hash'].lower(): tx
+            for block in blocks if block for tx in block['transactions']}
+        found.update((txid, txs[txid]) for txid in included)
+
+        retry = set()
+        for txid, tx in found.items():
+            receipt = self.web3.eth.getTransactionReceipt(txid)
+            if not receipt:
+                # reorganized away, look it up again
+                retry.add(txid)
+                continue
+            with self.lock:
+                future = self.pending.pop(txid, None)
+            if future:
+                future.set_result((receipt, tx))
+
+        # only once everything was looked up, so a failed poll is retried
+        with self.lock:
+            self.scan.resolve(new | set(found), set(found) - retry, retry, next_block)
+
+
+_waiters = weakref.WeakKeyDictionary()
+_waiters_lock = threading.Lock()
+
+def receipt_waiter(web3: Web3) -> ReceiptWaiter:
+    """ The `ReceiptWaiter` shared by every caller of the same `web3`,
+    for as long as it waits for anything.
+    """
+    with _waiters_lock:
+        if web3 not in _waiters:
+            _waiters[web3] = ReceiptWaiter(web3)
+        return _waiters[web3]
@@ -1,13 +1,13 @@
 import click
 import stringcase
-from populus import Project
+from artifacts import CachedProject
 from utils import (
     write_json,
-    check_succesful_tx,
     ensure_working_dir,
     confirm_deployment,
 )
 from base_deployer import BaseDeployer
+from planner import ANY, DeploymentPlanner, Ref, Step, default_manifest
 
 working_dir = ensure_working_dir()
 
@@ -34,37 +34,46 @@ class SeedSale(BaseDeployer):
         }
 
 
-    def deploy(self, beneficiary: str):
-        # ViewAuthority
-        if not self.instances['ViewAuthority']:
-            self.instances['ViewAuthority'] = \
-                self.deploy_contract('DSGuard', gas=1_340_000)
-            print(f"ViewAuthority address: {self.instances['ViewAuthority'].address}")
-
-        # ViewToken
-        if not self.instances['ViewToken']:
-            self.instances['ViewToken'] = \
-                self.deploy_contract('DSToken', args=['VIEW'], gas=2_000_000)
-
-            tx = self.instances['ViewToken'] \
-                .transact({"from": self.owner}) \
-                .setAuthority(self.instances['ViewAuthority'].address)
-            check_succesful_tx(self.web3, tx)
-            print(f"ViewToken address: {self.instances['ViewToken'].address}")
-
-        # Seed Sale
-        if not self.instances['ViewlySeedSale']:
-            self.instances['ViewlySeedSale'] = \
-                self.deploy_contract(
-                    'ViewlySeedSale',
-                    args=[self.instances['ViewToken'].address, beneficiary])
-
-            self.authority_permit_any(
-                authority = self.instances['ViewAuthority'],
-                src_address = self.instances['ViewlySeedSale'].address,
-                dst_address = self.instances['ViewToken'].address,
-            )
-            print(f"ViewlySeedSale address: {self.instances['ViewlySeedSale'].address}")
+    @classmethod
+    def plan(cls, beneficiary: str, deployed=()):
+        """ Steps deploying the seed sale, along with the VIEW token
+        and its authority, unless already `deployed`.
+
+        The authority and the token are deployed together, and the
+        sale as soon as the token is mined.
+        """
+        steps = []
+        if 'ViewAuthority' not in deployed:
+            steps.append(Step('ViewAuthority', 'DSGuard', gas=1_340_000))
+        if 'ViewToken' not in deployed:
+            steps.append(Step('ViewToken', 'DSToken', args=['VIEW'], gas=2_000_000))
+            steps.append(Step(
+                'ViewToken.setAuthority',
+                target='ViewToken',
+                function='setAuthority',
+                args=[Ref('ViewAuthority')]))
+        if 'ViewlySeedSale' not in deployed:
+            steps.append(Step(
+                'ViewlySeedSale', 'ViewlySeedSale',
+                args=[Ref('ViewToken'), beneficiary]))
+            steps.append(Step(
+                'ViewAuthority.permit(ViewlySeedSale)',
+                target='ViewAuthority',
+                function='permit',
+                args=[Ref('ViewlySeedSale'), Ref('ViewToken'), ANY]))
+        return steps
+
+    def deploy(self, beneficiary: str, manifest_path=None):
+        """ Deploy the seed sale, and the contracts it needs.
+
+        Args:
+            beneficiary: Address receiving the sale's funds.
+            manifest_path: Deployment manifest to resume from, and update.
+        """
+        deployed = {k: v for k, v in self.instances.items() if v}
+        planner = DeploymentPlanner(self, manifest_path, deployed)
+        planner.add(SeedSale, beneficiary=beneficiary, deployed=deployed)
+        self.instances.update(planner.run())
 
     def deprecate(self):
         pass
@@ -82,10 +91,13 @@ class SeedSale(BaseDeployer):
               type=str, help='Name of ETH Chain')
 @click.option('--owner', default=None,
               type=str, help='Account to deploy from')
+@click.option('--manifest', 'manifest_path', default=None, type=click.Path(),
+              help='Deployment manifest to resume from '
+                   '(build/deployments/<chain>/viewly_seed_sale.json)')
 @click.argument('beneficiary', type=str)
-def deploy(chain_name, owner, beneficiary):
+def deploy(chain_name, owner, manifest_path, beneficiary):
     """ Deploy ViewlySeedSale """
-    with Project().get_chain(chain_name) as chain:
+    with CachedProject().get_chain(chain_name) as chain:
         deployer = SeedSale(chain_name, chain, owner=owner)
         print(f'Head block is {deployer.web3.eth.blockNumber} '
               f'on the "{chain_name}" chain')
@@ -93,7 +105,9 @@ def deploy(chain_name, owner, beneficiary):
         print('Beneficiary address is', beneficiary)
 
         if confirm_deployment(chain_name, deployer.__target__):
-            deployer.deploy(beneficiary)
+            deployer.deploy(
+                beneficiary,
+                manifest_path or default_manifest(chain_name, deployer.__target__))
             deployer.dump_abis()
 
 if __name__ == '__main__':
@@ -0,0 +1,53 @@
+import click
+from artifacts import CachedProject
+from utils import (
+    write_json,
+    ensure_working_dir,
+    confirm_deployment,
+)
+from planner import DeploymentPlanner, default_manifest
+from seed_sale import SeedSale
+from token_mintage import TokenMintage
+
+working_dir = ensure_working_dir()
+
+
+@click.command()
+@click.option('--chain', 'chain_name', default='tester',
+              type=str, help='Name of ETH Chain')
+@click.option('--owner', default=None,
+              type=str, help='Account to deploy from')
+@click.option('--manifest', 'manifest_path', default=None, type=click.Path(),
+              help='Deployment manifest to resume from '
+                   '(build/deployments/<chain>/view_system.json)')
+@click.argument('beneficiary', type=str)
+def deploy(chain_name, owner, manifest_path, beneficiary):
+    """ Deploy ViewAuthority, ViewToken, ViewlySeedSale and ViewTokenMintage
+    as a single plan. ViewlySeedSale and ViewTokenMintage are deployed
+    and permitted together, once the token is mined.
+    """
+    with CachedProject().get_chain(chain_name) as chain:
+        seed_sale = SeedSale(chain_name, chain, owner=owner)
+        print(f'Head block is {seed_sale.web3.eth.blockNumber} '
+              f'on the "{chain_name}" chain')
+        print('Owner address is', seed_sale.owner)
+        print('Beneficiary address is', beneficiary)
+
+        if not confirm_deployment(chain_name, 'ViewSystem'):
+            return
+
+        planner = DeploymentPlanner(
+            seed_sale, manifest_path or default_manifest(chain_name, 'ViewSystem'))
+        planner.add(SeedSale, beneficiary=beneficiary)
+        planner.add(TokenMintage)
+        instances = planner.run()
+
+        seed_sale.instances.update(
+            {k: v for k, v in instances.items() if k in seed_sale.instances})
+        seed_sale.dump_abis()
+        write_json(
+            instances['ViewTokenMintage'].abi, 'build/view_token_mintage.abi.json')
+
+
+if __name__ == '__main__':
+    deploy()
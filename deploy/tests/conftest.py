@@ -0,0 +1,6 @@
+import pathlib
+import sys
+
+# The deploy scripts import each other as top-level modules (`from utils import ...`),
+# as they do when run from the deploy directory.
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent))
@@ -0,0 +1,236 @@
+from concurrent.futures import TimeoutError
+from types import SimpleNamespace
+import json
+import threading
+
+import pytest
+from web3 import HTTPProvider
+
+import planner
+from base_deployer import BaseDeployer
+from planner import DeploymentPlanner, Ref, Step, contract_address
+
+OWNER = '0x' + '0a' * 20
+
+
+class FakeTransact:
+
+    def __init__(self, contract, transaction):
+        self.contract = contract
+        self.transaction = transaction
+
+    def __getattr__(self, function):
+        def call(*args):
+            return self.contract.chain.send(
+                self.transaction, to=self.contract.address,
+                function=function, args=list(args))
+        return call
+
+class FakeContract:
+    """ A contract factory, or instance once it has an address."""
+
+    def __init__(self, chain, name, address=None):
+        self.chain = chain
+        self.name = name
+        self.address = address
+
+    def __call__(self, address):
+        return FakeContract(self.chain, self.name, address)
+
+    def deploy(self, transaction, args):
+        return self.chain.send(transaction, contract=self.name, args=list(args))
+
+    def transact(self, transaction):
+        return FakeTransact(self, transaction)
+
+class FakeChain:
+    """ The chain of a single owner, whose transactions are mined as
+    they are sent, unless `automine` is off.
+    """
+
+    def __init__(self):
+        self.provider = self
+        # in-process, like eth-tester
+        self.web3 = SimpleNamespace(eth=self, providers=[object()])
+        self.automine = True
+        self.txs = {}
+        self.nonces = {}
+        self.receipts = {}
+        self.code = {}
+        self.waiting_threads = set()
+
+    def get_contract_factory(self, name):
+        return FakeContract(self, name)
+
+    def send(self, transaction, **tx):
+        nonce = transaction['nonce']
+        txid = '0x' + f'{len(self.nonces):064x}'
+        self.txs[txid] = dict(tx, hash=txid, nonce=nonce)
+        self.nonces[txid] = nonce
+        if self.automine:
+            self.mine(txid)
+        return txid
+
+    def mine(self, txid):
+        tx = self.txs[txid]
+        receipt = {'transactionHash': txid, 'contractAddress': None}
+        if tx.get('contract'):
+            receipt['contractAddress'] = contract_address(OWNER, tx['nonce'])
+            self.code[receipt['contractAddress']] = tx['contract']
+        self.receipts[txid] = receipt
+
+    def forget(self, txid):
+        """ Lose a transaction, as a crashed run would have."""
+        del self.txs[txid]
+
+    def getTransaction(self, txid):
+        return self.txs.get(txid)
+
+    def getCode(self, address):
+        return '0x01' if address in self.code else '0x'
+
+    def getTransactionCount(self, owner, block):
+        nonces = [
+            nonce for txid, nonce in self.nonces.items()
+            if block == 'pending' or txid in self.receipts]
+        return max(nonces, default=-1) + 1
+
+    def sent(self):
+        """ (name or function, nonce) of every transaction sent."""
+        return [
+            (tx.get('contract') or tx['function'], tx['nonce'])
+            for tx in self.txs.values()]
+
+
+class Authority(BaseDeployer):
+    __target__ = 'Token'
+
+    @classmethod
+    def plan(cls):
+        return [
+            Step('Authority', 'DSGuard'),
+            Step('Token', 'DSToken', args=['VIEW']),
+            Step('Token.setAuthority', target='Token', function='setAuthority',
+                 args=[Ref('Authority')]),
+        ]
+
+
+class Sale(BaseDeployer):
+    __target__ = 'Sale'
+    __dependencies__ = ['Token']
+
+    @classmethod
+    def plan(cls):
+        return [Step('Sale', 'Sale')]
+
+
+@pytest.fixture
+def chain(monkeypatch):
+    chain = FakeChain()
+    def check_succesful_tx(web3, txid, timeout):
+        chain.waiting_threads.add(threading.current_thread())
+        if txid not in chain.receipts:
+            raise TimeoutError()
+        return chain.receipts[txid]
+    monkeypatch.setattr(planner, 'check_succesful_tx', check_succesful_tx)
+    return chain
+
+@pytest.fixture
+def manifest_path(tmpdir):
+    return str(tmpdir / 'manifest.json')
+
+def run(chain, manifest_path, *deployer_classes):
+    deployer = SimpleNamespace(
+        chain=chain, web3=chain.web3, owner=OWNER, chain_name='ropsten')
+    planner = DeploymentPlanner(deployer, manifest_path).add(Authority)
+    for deployer_class in deployer_classes:
+        planner.add(deployer_class)
+    return planner.run()
+
+def statuses(manifest_path):
+    with open(manifest_path) as f:
+        return {k: v['status'] for k, v in json.load(f)['steps'].items()}
+
+def write_manifest(manifest_path, steps):
+    with open(manifest_path, 'w') as f:
+        json.dump({'owner': OWNER, 'steps': steps}, f)
+
+def test_plan_is_abstract(chain):
+    class Incomplete(BaseDeployer):
+        pass
+    with pytest.raises(TypeError):
+        Incomplete('tester', chain)
+
+def test_run(chain, manifest_path):
+    instances = run(chain, manifest_path)
+    assert instances['Authority'].address == contract_address(OWNER, 0)
+    assert instances['Token'].address == contract_address(OWNER, 1)
+    assert chain.sent() == [('DSGuard', 0), ('DSToken', 1), ('setAuthority', 2)]
+    assert list(chain.txs.values())[2]['args'] == [contract_address(OWNER, 0)]
+    assert set(statuses(manifest_path).values()) == {'done'}
+
+    # nothing is sent again
+    run(chain, manifest_path)
+    assert len(chain.txs) == 3
+
+def test_in_process_chains_wait_from_the_sending_thread(chain, manifest_path):
+    run(chain, manifest_path)
+    assert chain.waiting_threads == {threading.current_thread()}
+
+def test_nodes_wait_in_parallel(chain, manifest_path):
+    chain.web3.providers = [HTTPProvider('http://127.0.0.1:8545')]
+    run(chain, manifest_path)
+    assert threading.current_thread() not in chain.waiting_threads
+
+def test_deployer_dependencies_order_steps(chain, manifest_path):
+    # Sale has no Ref to the token, but comes after it all the same
+    run(chain, manifest_path, Sale)
+    assert chain.sent() == [
+        ('DSGuard', 0), ('DSToken', 1), ('setAuthority', 2), ('Sale', 3)]
+
+def test_timeout_is_waited_for_by_the_next_run(chain, manifest_path):
+    chain.automine = False
+    with pytest.raises(RuntimeError):
+        run(chain, manifest_path)
+    assert statuses(manifest_path) == {'Authority': 'sent', 'Token': 'sent'}
+
+    for txid in list(chain.txs):
+        chain.mine(txid)
+    chain.automine = True
+    run(chain, manifest_path)
+    assert chain.sent() == [('DSGuard', 0), ('DSToken', 1), ('setAuthority', 2)]
+
+def test_lost_deployment_found_at_its_address(chain, manifest_path):
+    chain.forget(chain.send({'nonce': 0}, contract='DSGuard', args=[]))
+    write_manifest(manifest_path, {'Authority': {
+        'status': 'sending', 'nonce': 0, 'address': contract_address(OWNER, 0)}})
+
+    instances = run(chain, manifest_path)
+    assert instances['Authority'].address == contract_address(OWNER, 0)
+    assert chain.sent() == [('DSToken', 1), ('setAuthority', 2)]
+
+def test_lost_call_not_sent_again_once_its_nonce_is_taken(chain, manifest_path):
+    run(chain, manifest_path)
+    txid = list(chain.txs)[2]
+    chain.forget(txid)
+    with open(manifest_path) as f:
+        steps = json.load(f)['steps']
+    steps['Token.setAuthority'] = {'status': 'sending', 'nonce': 2}
+    write_manifest(manifest_path, steps)
+
+    with pytest.raises(RuntimeError, match='nonce 2'):
+        run(chain, manifest_path)
+    assert len(chain.txs) == 2
+
+def test_lost_call_sent_again_while_its_nonce_is_free(chain, manifest_path):
+    for nonce, contract in enumerate(['DSGuard', 'DSToken']):
+        chain.send({'nonce': nonce}, contract=contract, args=[])
+    write_manifest(manifest_path, {
+        'Authority': {'status': 'done', 'nonce': 0, 'address': contract_address(OWNER, 0)},
+        'Token': {'status': 'done', 'nonce': 1, 'address': contract_address(OWNER, 1)},
+        'Token.setAuthority': {'status': 'sending', 'nonce': 2},
+    })
+
+    run(chain, manifest_path)
+    assert chain.sent()[2:] == [('setAuthority', 2)]
+    assert statuses(manifest_path)['Token.setAuthority'] == 'done'
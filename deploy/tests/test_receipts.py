@@ -0,0 +1,117 @@
+from concurrent.futures import TimeoutError
+import gc
+
+import pytest
+from eth_tester import EthereumTester
+from web3 import Web3
+from web3.providers.eth_tester import EthereumTesterProvider
+
+import receipts
+from receipts import ReceiptScan, receipt_waiter
+
+
+@pytest.fixture
+def w3():
+    return Web3(EthereumTesterProvider(EthereumTester()))
+
+def send(w3):
+    accounts = w3.eth.accounts
+    return w3.eth.sendTransaction(
+        {'from': accounts[0], 'to': accounts[1], 'value': 1, 'gas': 21000})
+
+def test_wait_on_an_in_process_chain(w3):
+    waiter = receipt_waiter(w3)
+    assert receipt_waiter(w3) is waiter
+    # a web3 and provider of its own
+    assert waiter.web3 is not w3
+    assert waiter.web3.providers[0] is not w3.providers[0]
+
+    txid = send(w3)
+    receipt, tx = waiter.wait(txid, timeout=5)
+    assert receipt['transactionHash'] == txid
+    assert tx['hash'] == txid
+    # polled from the waiting thread, and released once done
+    assert waiter.thread is None
+    assert w3 not in receipts._waiters
+
+def test_wait_times_out(w3):
+    waiter = receipt_waiter(w3)
+    waiter.poll_interval = 0.01
+    with pytest.raises(TimeoutError):
+        waiter.wait('0x' + '00' * 32, timeout=0.05)
+    assert waiter.pending == {}
+    assert waiter.scan.pending == set()
+    assert w3 not in receipts._waiters
+
+def test_poll_thread_released_when_idle(w3):
+    waiter = receipt_waiter(w3)
+    # as on a node, through HTTP or IPC
+    waiter.threaded = True
+    waiter.poll_interval = 0.01
+
+    txid = send(w3)
+    future = waiter.submit(txid)
+    thread = waiter.thread
+    assert thread is not None
+    receipt, _ = future.result(5)
+    assert receipt['transactionHash'] == txid
+
+    thread.join(5)
+    assert waiter.thread is None
+    assert w3 not in receipts._waiters
+    assert receipt_waiter(w3) is not waiter
+
+def test_waiters_dropped_with_their_web3():
+    w3 = Web3(EthereumTesterProvider(EthereumTester()))
+    waiter = receipt_waiter(w3)
+    assert receipts._waiters[w3] is waiter
+    del w3
+    gc.collect()
+    assert waiter not in receipts._waiters.values()
+
+
+def block(number, *txids):
+    return {'number': hex(number), 'transactions': list(txids)}
+
+def test_scan_looks_up_new_transactions_once():
+    scan = ReceiptScan()
+    scan.add(['0xA', '0xB'])
+    assert scan.new == {'0xa', '0xb'}
+    assert scan.blocks(5) == range(6, 6)
+
+    # 0xa is mined, the lookup of 0xb failed
+    scan.resolve({'0xa', '0xb'}, {'0xa'}, {'0xb'}, 6)
+    assert scan.pending == {'0xb'}
+    assert scan.new == {'0xb'}
+    scan.resolve({'0xb'}, set(), set(), 6)
+    assert scan.new == set()
+
+def test_scan_finds_pending_transactions_in_new_blocks():
+    scan = ReceiptScan()
+    scan.add(['0xa', '0xb'])
+    scan.resolve({'0xa', '0xb'}, set(), set(), 6)
+
+    assert scan.blocks(8) == range(6, 9)
+    included, next_block = scan.scan([block(6, '0xc'), block(7, '0xA'), block(8)])
+    assert (included, next_block) == ({'0xa'}, 9)
+    # nothing is recorded until the poll is resolved
+    assert scan.next_block == 6
+
+    scan.resolve(included, included, set(), next_block)
+    assert scan.pending == {'0xb'}
+    assert scan.blocks(9) == range(9, 10)
+
+def test_scan_stops_at_a_missing_block():
+    scan = ReceiptScan()
+    scan.add(['0xa'])
+    scan.resolve({'0xa'}, set(), set(), 6)
+    included, next_block = scan.scan([block(6), None, block(8, '0xa')])
+    assert (included, next_block) == (set(), 7)
+
+def test_scan_track():
+    scan = ReceiptScan()
+    scan.add(['0xa', '0xb'])
+    scan.resolve({'0xa', '0xb'}, set(), set(), 6)
+    scan.track(['0xB', '0xc'])
+    assert scan.pending == {'0xb', '0xc'}
+    assert scan.new == {'0xc'}
@@ -1,16 +1,26 @@
 import click
 import stringcase
-from populus import Project
+from eth_utils import function_signature_to_4byte_selector, is_same_address
+from artifacts import CachedProject
 from utils import (
     load_contract,
     write_json,
+    check_succesful_tx,
     ensure_working_dir,
     confirm_deployment,
 )
 from base_deployer import BaseDeployer
+from planner import ANY, DeploymentPlanner, Ref, Step, default_manifest
 
 working_dir = ensure_working_dir()
 
+# Functions that extra minter accounts are permitted to call,
+# as DSGuard bytes32 signatures (left aligned selectors).
+MINT_SIGNATURES = [
+    function_signature_to_4byte_selector(x).ljust(32, b'\0')
+    for x in ['mint(address,uint256,uint8)', 'mintBatch(address[],uint256[],uint8)']
+]
+
 class TokenMintage(BaseDeployer):
     __target__ = 'ViewTokenMintage'
     __dependencies__ = ['ViewAuthority', 'ViewToken']
@@ -40,20 +50,55 @@ class TokenMintage(BaseDeployer):
         }
 
 
-    def deploy(self):
-        """ Deploy this contract and perform setup."""
+    @classmethod
+    def plan(cls):
+        """ Steps deploying this contract, and permitting it to mint."""
+        return [
+            Step('ViewTokenMintage', 'ViewTokenMintage', args=[Ref('ViewToken')]),
+            Step(
+                'ViewAuthority.permit(ViewTokenMintage)',
+                target='ViewAuthority',
+                function='permit',
+                args=[Ref('ViewTokenMintage'), Ref('ViewToken'), ANY]),
+        ]
+
+    def deploy(self, manifest_path=None):
+        """ Deploy this contract and perform setup.
+
+        Args:
+            manifest_path: Deployment manifest to resume from, and update.
+        """
         if self.instance:
             raise ValueError(f"Instance already deployed at {self.instance.address}")
 
-        self.instance = self.deploy_contract(
-            contract_name='ViewTokenMintage',
-            args=[self.dependencies['ViewToken'].address])
-        print(f'{self.__target__} address is', self.instance.address)
+        planner = DeploymentPlanner(self, manifest_path, self.dependencies)
+        planner.add(TokenMintage)
+        self.instance = planner.run()['ViewTokenMintage']
 
-        self.authority_permit_any(
-            authority=self.dependencies['ViewAuthority'],
-            src_address=self.instance.address,
-            dst_address=self.dependencies['ViewToken'].address)
+    def permit_minters(self, accounts):
+        """ Allow `accounts` to call `mint` and `mintBatch`, via the
+        ViewAuthority, which becomes this contract's authority if needed.
+        """
+        authority = self.dependencies['ViewAuthority']
+        if not is_same_address(self.instance.call().authority(), authority.address):
+            tx = self.instance \
+                .transact({'from': self.owner}) \
+                .setAuthority(authority.address)
+            check_succesful_tx(self.web3, tx)
+            print(f'{self.__target__} authority is now {authority.address}')
+
+        for account in accounts:
+            for sig in MINT_SIGNATURES:
+                self.authority_permit(authority, account, self.instance.address, sig)
+            print(f'{account} may now mint')
+
+    def forbid_minters(self, accounts):
+        """ Revoke the `mint` and `mintBatch` permissions of `accounts`."""
+        authority = self.dependencies['ViewAuthority']
+        for account in accounts:
+            for sig in MINT_SIGNATURES:
+                self.authority_forbid(authority, account, self.instance.address, sig)
+            print(f'{account} may no longer mint')
 
     def deprecate(self):
         """ Destroy this contract, and clean up."""
@@ -76,11 +121,14 @@ class TokenMintage(BaseDeployer):
               type=str, help='Name of ETH Chain')
 @click.option('--owner', default=None,
               type=str, help='Account to deploy from')
+@click.option('--manifest', 'manifest_path', default=None, type=click.Path(),
+              help='Deployment manifest to resume from '
+                   '(build/deployments/<chain>/view_token_mintage.json)')
 @click.argument('view-authority-addr', type=str)
 @click.argument('view-token-addr', type=str)
-def deploy(chain_name, owner, view_authority_addr, view_token_addr):
+def deploy(chain_name, owner, manifest_path, view_authority_addr, view_token_addr):
     """ Deploy ViewTokenMintage """
-    with Project().get_chain(chain_name) as chain:
+    with CachedProject().get_chain(chain_name) as chain:
         view_token = load_contract(chain, 'DSToken', view_token_addr)
         view_authority = load_contract(chain, 'DSGuard', view_authority_addr)
         deps = {
@@ -95,7 +143,8 @@ def deploy(chain_name, owner, view_authority_addr, view_token_addr):
         print('ViewToken address is', view_token.address)
 
         if confirm_deployment(chain_name, deployer.__target__):
-            deployer.deploy()
+            deployer.deploy(
+                manifest_path or default_manifest(chain_name, deployer.__target__))
             deployer.dump_abis()
 
 
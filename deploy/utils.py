@@ -1,10 +1,10 @@
 from populus.chain.base import BaseChain
-from populus.utils.wait import wait_for_transaction_receipt
 from web3 import Web3
 import json
 import os
 import pathlib
 import click
+from receipts import receipt_waiter
 
 def ensure_working_dir() -> pathlib.Path:
     """ Ensure that the deployment scripts default to
@@ -27,12 +27,14 @@ def load_contract(chain: BaseChain, contract_name, address):
 def check_succesful_tx(web3: Web3, txid: str, timeout=600) -> dict:
     """See if transaction went through (Solidity code did not throw).
 
+    Waits through the `ReceiptWaiter` shared by all callers, so that
+    concurrent waits poll the chain once per block between them.
+
     :return: Transaction receipt
     """
 
     # http://ethereum.stackexchange.com/q/6007/620
-    receipt = wait_for_transaction_receipt(web3, txid, timeout=timeout)
-    txinfo = web3.eth.getTransaction(txid)
+    receipt, txinfo = receipt_waiter(web3).wait(txid, timeout=timeout)
 
     # Check if tx succeeded (real chain only)
     if 'status' in receipt:
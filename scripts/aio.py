@@ -0,0 +1,336 @@
+import asyncio
+import copy
+import itertools
+import json
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import requests
+import web3
+from requests.adapters import HTTPAdapter
+from toolz import partition_all
+from web3.middleware.pythonic import receipt_formatter, transaction_formatter
+from web3.providers.base import BaseProvider
+from web3.providers.ipc import IPCProvider
+from web3.providers.rpc import HTTPProvider
+
+import metrics
+from provider_pool import PooledProvider
+from rpc import (
+    SEND_ERRORS, RPCError, _post_http, batch_payload, batch_results, by_txid, to_int,
+)
+
+
+class AsyncRPC(ABC):
+    def __init__(self, limit: int):
+        """ Base class of JSON-RPC clients for the asyncio runtime.
+
+        At most `limit` requests (or batches) are in flight to the
+        endpoint at once, however many tasks share the client.
+        """
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit)
+        self.ids = itertools.count()
+
+    @abstractmethod
+    async def _send(self, payload):
+        """ Send a request or batch payload, and return the raw response."""
+
+    async def send(self, payload):
+        if isinstance(payload, list):
+            method = f'{payload[0]["method"]} (batch)' if payload else 'batch'
+        else:
+            method = payload['method']
+        async with self.semaphore:
+            with metrics.rpc_seconds.time(method=method):
+                return await self._send(payload)
+
+    async def request(self, method: str, params: list):
+        payload = {
+            'jsonrpc': '2.0', 'id': next(self.ids), 'method': method, 'params': params,
+        }
+        response = await self.send(payload)
+        if 'error' in response:
+            raise RPCError(response['error'])
+        return response['result']
+
+    async def batch(self, method: str, params_list: List[list], batch_size=100) -> list:
+        """ Call the same method with many sets of params, in JSON-RPC
+        batches of `batch_size` requests sent concurrently.
+
+        Returns:
+            Raw results in the order of `params_list`, or `RPCError`s.
+        """
+        async def call_batch(batch):
+            try:
+                responses = await self.send(batch_payload(method, batch))
+            except SEND_ERRORS as e:
+                responses = e
+            return batch_results(batch, responses)
+
+        requests_ = [(next(self.ids), params) for params in params_list]
+        batches = await asyncio.gather(*[
+            call_batch(x) for x in partition_all(batch_size, requests_)
+        ])
+        return [x for results in batches for x in results]
+
+    async def close(self):
+        pass
+
+
+class AsyncHTTPRPC(AsyncRPC):
+    def __init__(self, endpoint_uri: str, limit=8):
+        """ JSON-RPC over a pooled, keep-alive HTTP session.
+
+        Requests are posted from a pool of `limit` threads, one per
+        pooled connection.
+        """
+        super().__init__(limit)
+        self.endpoint_uri = endpoint_uri
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=limit)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(limit)
+
+    async def _send(self, payload):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self.executor, _post_http, self.session, self.endpoint_uri, payload)
+
+    async def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
+
+
+class AsyncIPCRPC(AsyncRPC):
+    def __init__(self, ipc_path: str, limit=64):
+        """ JSON-RPC over a single persistent IPC socket.
+
+        Requests are written as soon as they are made, and responses are
+        matched back to them by id, so many requests share the socket.
+        """
+        super().__init__(limit)
+        self.ipc_path = ipc_path
+        self.reader = None
+        self.writer = None
+        self.listener = None
+        self.pending = {}
+        self.connecting = asyncio.Lock()
+
+    async def connect(self):
+        async with self.connecting:
+            if self.writer:
+                return
+            self.reader, self.writer = \
+                await asyncio.open_unix_connection(self.ipc_path, limit=1 << 24)
+            self.listener = asyncio.ensure_future(self.listen())
+
+    async def listen(self):
+        decoder = json.JSONDecoder()
+        buffer = ''
+        try:
+            while True:
+                chunk = await self.reader.read(1 << 16)
+                if not chunk:
+                    raise ConnectionError(f'IPC socket {self.ipc_path} closed')
+                buffer += chunk.decode()
+                while True:
+                    buffer = buffer.lstrip()
+                    try:
+                        response, pos = decoder.raw_decode(buffer)
+                    except ValueError:
+                        break
+                    buffer = buffer[pos:]
+                    self.resolve(response)
+        except Exception as e:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(e)
+            self.pending.clear()
+            self.writer = None
+
+    def resolve(self, response):
+        first = response[0] if isinstance(response, list) and response else response
+        future = self.pending.get(first.get('id'))
+        if future is None and len(self.pending) == 1:
+            # an error without an id, for the only outstanding request
+            future = next(iter(self.pending.values()))
+        if future is None:
+            return
+        for key in [k for k, v in self.pending.items() if v is future]:
+            del self.pending[key]
+        if not future.done():
+            future.set_result(response)
+
+    async def _send(self, payload):
+        await self.connect()
+        future = asyncio.get_event_loop().create_future()
+        for x in payload if isinstance(payload, list) else [payload]:
+            self.pending[x['id']] = future
+        self.writer.write(json.dumps(payload).encode())
+        await self.writer.drain()
+        return await future
+
+    async def close(self):
+        if self.listener:
+            self.listener.cancel()
+        if self.writer:
+            self.writer.close()
+
+
+class AsyncProviderRPC(AsyncRPC):
+    def __init__(self, provider: BaseProvider, limit=1):
+        """ Fallback for providers without a raw transport (eth-tester),
+        which relays each request through web3 on a worker thread.
+
+        Web3 providers cache their middleware stack, bound to a web3
+        instance, so requests go through a web3 of its own on a copy
+        of `provider`, rather than the one of the calling thread.
+        """
+        super().__init__(limit)
+        provider = copy.copy(provider)
+        provider._request_func_cache = (None, None)
+        self.w3 = web3.Web3(provider)
+        self.executor = ThreadPoolExecutor(limit)
+
+    def _request_blocking(self, payload):
+        try:
+            result = self.w3.manager.request_blocking(
+                payload['method'], payload['params'])
+            return {'id': payload['id'], 'result': result}
+        except ValueError as e:
+            return {'id': payload['id'], 'error': str(e)}
+
+    def _send_blocking(self, payload):
+        if isinstance(payload, list):
+            return [self._request_blocking(x) for x in payload]
+        return self._request_blocking(payload)
+
+    async def _send(self, payload):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, self._send_blocking, payload)
+
+    async def close(self):
+        self.executor.shutdown(wait=False)
+
+
+def connect(w3: web3.Web3, limit=8) -> AsyncRPC:
+    """ Open an async client to the same endpoint as `w3`'s provider,
+    or the healthiest endpoint of a `PooledProvider`.
+
+    Must be called from the thread that runs the event loop.
+    """
+    provider = w3.providers[0]
+    if isinstance(provider, PooledProvider):
+        provider = provider.best()
+    if isinstance(provider, HTTPProvider):
+        return AsyncHTTPRPC(provider.endpoint_uri, limit)
+    if isinstance(provider, IPCProvider):
+        return AsyncIPCRPC(provider.ipc_path, limit)
+    return AsyncProviderRPC(provider)
+
+
+async def _by_txid(
+    rpc: AsyncRPC,
+    method: str,
+    formatter,
+    txids: List[str],
+    batch_size=100) -> Dict[str, dict]:
+    txids = list(set(txids))
+    return by_txid(
+        txids, await rpc.batch(method, [[x] for x in txids], batch_size), formatter)
+
+async def get_receipts(rpc: AsyncRPC, txids: List[str], **kwargs) -> Dict[str, dict]:
+    """ Async version of `rpc.get_receipts`."""
+    return await _by_txid(
+        rpc, 'eth_getTransactionReceipt', receipt_formatter, txids, **kwargs)
+
+async def get_transactions(rpc: AsyncRPC, txids: List[str], **kwargs) -> Dict[str, dict]:
+    """ Async version of `rpc.get_transactions`."""
+    return await _by_txid(
+        rpc, 'eth_getTransactionByHash', transaction_formatter, txids, **kwargs)
+
+async def block_number(rpc: AsyncRPC) -> int:
+    head = await rpc.request('eth_blockNumber', [])
+    return to_int(head)
+
+async def new_blocks(rpc: AsyncRPC, poll_interval=1.0):
+    """ Yield the number of every new head block, starting with the current one."""
+    last = None
+    while True:
+        head = await block_number(rpc)
+        if head != last:
+            last = head
+            yield head
+        else:
+            await asyncio.sleep(poll_interval)
+
+
+def run(main):
+    """ Run a coroutine function to completion on a new event loop.
+
+    On Ctrl-C the task is cancelled, and allowed to finish its cleanup
+    (committing database writes) before the loop is closed.
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    task = asyncio.ensure_future(main(), loop=loop)
+    try:
+        return loop.run_until_complete(task)
+    except KeyboardInterrupt:
+        task.cancel()
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+        raise
+    finally:
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+
+class BackgroundTask:
+    def __init__(self, main):
+        """ Run a coroutine function on an event loop in its own thread,
+        alongside synchronous code on the main thread.
+        """
+        self.main = main
+        self.loop = None
+        self.task = None
+        self.error = None
+        self.started = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.task = asyncio.ensure_future(self.main(), loop=self.loop)
+        self.started.set()
+        try:
+            self.loop.run_until_complete(self.task)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self.error = e
+        finally:
+            self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+            self.loop.close()
+
+    def start(self):
+        self.thread.start()
+        self.started.wait()
+        return self
+
+    def cancel(self):
+        """ Cancel the task, and wait for its cleanup to finish."""
+        if self.thread.is_alive():
+            self.loop.call_soon_threadsafe(self.task.cancel)
+        self.join()
+
+    def join(self):
+        self.thread.join()
+        if self.error:
+            raise self.error
@@ -0,0 +1,36 @@
+import os
+
+from utils import PROJECT_DIR, load_json
+
+def load_artifact(contract_name: str, project_dir=PROJECT_DIR) -> dict:
+    """ Load a compiled contract (abi, bytecode, bytecode_runtime...)
+    from the artifact cache of `deploy/artifacts.py`, without compiling.
+
+    Only the artifact of the current sources, solc version and
+    compilation settings is considered, so this needs populus and solc.
+
+    Returns:
+        The compiled contract data, or None if it was never compiled
+        (by the deploy scripts or the tests).
+    """
+    from deploy import artifacts
+    return artifacts.load_artifact(contract_name, project_dir)
+
+def compiled_contracts(project_dir=PROJECT_DIR) -> dict:
+    """ Every compiled contract of the project, from the artifact cache,
+    or compiled with populus (and cached) if it's not there yet.
+    """
+    from deploy.artifacts import CachedProject
+    return CachedProject(str(project_dir)).compiled_contract_data
+
+def load_abi(abi_path: str, contract_name='ViewTokenMintage') -> list:
+    """ Load a contract's ABI from `abi_path` (as written by the deploy
+    scripts), or from the artifact cache if there is no such file.
+    """
+    if os.path.exists(abi_path):
+        return load_json(abi_path)
+    contract = load_artifact(contract_name)
+    if contract is None:
+        raise FileNotFoundError(
+            f'{abi_path} not found, and {contract_name} was never compiled')
+    return contract['abi']
@@ -0,0 +1,321 @@
+import click
+import contextlib
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import web3
+
+from datetime import datetime
+from functools import wraps
+from typing import Dict, List
+
+from utils import get_chain, load_json
+from artifacts import compiled_contracts
+from db import TxStore
+import aio
+import distribute
+
+# SeedSale is minted out by the contract's constructor,
+# so synthetic payouts are spread over the other buckets.
+bench_buckets = [x for x in distribute.roles if x != 'SeedSale']
+
+class Counters:
+    def __init__(self):
+        """ RPC round trips and SQLite commits made while a command runs.
+
+        JSON-RPC batches and web3 requests both count as one call each.
+        """
+        self.rpc_calls = 0
+        self.commits = 0
+
+    def reset(self):
+        self.rpc_calls = 0
+        self.commits = 0
+
+    def attach(self, w3: web3.Web3):
+        counters = self
+
+        def counted(fn, field):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                setattr(counters, field, getattr(counters, field) + 1)
+                return fn(*args, **kwargs)
+            return wrapper
+
+        def counted_async(fn):
+            @wraps(fn)
+            async def wrapper(*args, **kwargs):
+                counters.rpc_calls += 1
+                return await fn(*args, **kwargs)
+            return wrapper
+
+        # the provider is shared by every `get_chain` call for this chain
+        provider = w3.providers[0]
+        provider.make_request = counted(provider.make_request, 'rpc_calls')
+        provider._request_func_cache = (None, None)
+        # async clients that post to the node directly, instead of through web3
+        aio.AsyncHTTPRPC._send = counted_async(aio.AsyncHTTPRPC._send)
+        aio.AsyncIPCRPC._send = counted_async(aio.AsyncIPCRPC._send)
+
+        commit = TxStore.commit
+        @wraps(commit)
+        def counted_commit(store):
+            if store.conn.in_transaction:
+                counters.commits += 1
+            return commit(store)
+        TxStore.commit = counted_commit
+
+
+def reset_peak_rss():
+    """ Reset the peak RSS of this process, where the kernel allows it."""
+    with contextlib.suppress(OSError):
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+
+def peak_rss_mb() -> float:
+    """ Peak RSS of this process since the last reset, in MB."""
+    with contextlib.suppress(OSError):
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    # no /proc, ru_maxrss is the peak of the whole run (in bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+
+def write_payout_sheet(filename: str, rows: int, seed=0):
+    """ Write a synthetic .json payout sheet of `rows` payouts to unique
+    recipients, spread evenly across buckets.
+    """
+    rng = random.Random(seed)
+    with open(filename, 'w') as f:
+        f.write('[\n')
+        for i in range(rows):
+            recipient = web3.Web3.toChecksumAddress(
+                '0x' + ''.join(rng.choice('0123456789abcdef') for _ in range(40)))
+            payout = {
+                'name': f'Recipient {i}',
+                'recipient': recipient,
+                'amount': f'{rng.randint(100, 10000) / 100:.2f}',
+                'bucket': bench_buckets[i % len(bench_buckets)],
+            }
+            f.write(('  ' if i == 0 else ', ') + json.dumps(payout) + '\n')
+        f.write(']\n')
+
+def deploy_contract(w3: web3.Web3, owner: str, contract_data: dict, args=[]):
+    """ Deploy a compiled contract, and return its instance."""
+    factory = w3.eth.contract(
+        abi=contract_data['abi'],
+        bytecode=contract_data['bytecode'],
+        bytecode_runtime=contract_data['bytecode_runtime'],
+    )
+    txid = factory.deploy(transaction={'from': owner}, args=args)
+    receipt = w3.eth.getTransactionReceipt(txid)
+    return w3.eth.contract(contract_data['abi'], receipt['contractAddress'])
+
+def deploy_mintage(w3: web3.Web3, owner: str) -> web3.eth.Contract:
+    """ Deploy `ViewTokenMintage` along with the VIEW token it mints.
+
+    The contracts are loaded from the artifact cache, and only compiled
+    with populus if their current sources were never compiled.
+    """
+    compiled = compiled_contracts()
+
+    token = deploy_contract(w3, owner, compiled['DSToken'], args=['VIEW'])
+    instance = deploy_contract(
+        w3, owner, compiled['ViewTokenMintage'], args=[token.address])
+    token.transact({'from': owner}).setOwner(instance.address)
+    return instance
+
+def gas_per_recipient(w3: web3.Web3, db_file: str) -> float:
+    q = """
+    SELECT txid, count(*) FROM txs WHERE txid IS NOT NULL GROUP BY txid;
+    """
+    gas_used, recipients = 0, 0
+    with TxStore(db_file) as store:
+        for txid, count in store.iter_rows(q):
+            gas_used += w3.eth.getTransactionReceipt(txid)['gasUsed']
+            recipients += count
+    return gas_used / recipients if recipients else None
+
+def run_command(counters: Counters, rows: int, args: List[str]) -> dict:
+    """ Run a `distribute.py` command in this process, and measure it."""
+    counters.reset()
+    reset_peak_rss()
+    started = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        distribute.cli.main(args, standalone_mode=False)
+    seconds = time.perf_counter() - started
+    return {
+        'seconds': round(seconds, 3),
+        'rows_per_sec': round(rows / seconds, 2),
+        'rpc_calls': counters.rpc_calls,
+        'rpc_calls_per_row': round(counters.rpc_calls / rows, 3),
+        'commits': counters.commits,
+        'commits_per_row': round(counters.commits / rows, 4),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+def bench_sheet(
+    rows: int,
+    chain_provider: str,
+    payout_options: List[str],
+    work_dir: str) -> dict:
+    """ Run import-txs, payout, verify and export-txs end to end
+    over a synthetic sheet of `rows` payouts.
+    """
+    w3 = get_chain(chain_provider, 'tester')
+    owner = w3.eth.accounts[0]
+    instance = deploy_mintage(w3, owner)
+    abi_path = os.path.join(work_dir, 'view_token_mintage.abi.json')
+    with open(abi_path, 'w') as f:
+        json.dump(instance.abi, f)
+
+    sheet_file = os.path.join(work_dir, f'payouts-{rows}.json')
+    db_file = os.path.join(work_dir, f'payouts-{rows}.db')
+    write_payout_sheet(sheet_file, rows)
+
+    counters = Counters()
+    counters.attach(w3)
+    chain = ['--provider', chain_provider, '--chain', 'tester']
+    commands = {
+        'import-txs': ['import-txs', sheet_file, db_file],
+        'payout': [
+            'payout', *chain,
+            '--contract-address', instance.address,
+            '--abi-path', abi_path,
+            '--owner', owner,
+            *payout_options, db_file,
+        ],
+        'verify': ['verify', *chain, '--finality-depth', '1', db_file],
+        'export-txs': ['export-txs', '--chain', 'tester', db_file],
+    }
+    results = {}
+    for name, args in commands.items():
+        results[name] = run_command(counters, rows, args)
+        print(f'{rows} rows, {name}: {results[name]["rows_per_sec"]} rows/sec',
+              file=sys.stderr)
+
+    q = "SELECT count(*) FROM txs WHERE success = 1;"
+    with TxStore(db_file) as store:
+        verified = store.query_all(q)[0][0]
+    return {
+        'rows': rows,
+        'verified': verified,
+        'gas_per_recipient': gas_per_recipient(w3, db_file),
+        'commands': results,
+    }
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# CLI
+# ---
+context_settings = dict(help_option_names=['-h', '--help'])
+@click.group(context_settings=context_settings)
+def cli():
+    pass
+
+@cli.command(name='run')
+@click.option('--provider', 'chain_provider', default='tester',
+              type=click.Choice(['tester', 'testrpc']),
+              help='In-process chain to benchmark against')
+@click.option('--rows', default='1000,10000,100000', type=str,
+              help='Comma separated payout sheet sizes')
+@click.option('--payout-option', 'payout_options', multiple=True,
+              help='Extra option for the payout command (repeatable), '
+                   'e.g. --payout-option=--pipeline')
+@click.option('--out', default='bench-results.json', type=click.Path(),
+              help='Where to write the JSON results')
+def cli_run(chain_provider, rows, payout_options, out):
+    """Benchmark all commands over synthetic payout sheets.
+
+    Each sheet size runs in its own process, on a fresh chain,
+    so that peak memory is measured per size. Fails if any payouts
+    were left unverified.
+    """
+    results = []
+    for size in [int(x) for x in rows.split(',')]:
+        with tempfile.TemporaryDirectory() as work_dir:
+            result_file = os.path.join(work_dir, 'result.json')
+            subprocess.run([
+                sys.executable, __file__, 'sheet',
+                '--provider', chain_provider,
+                '--rows', str(size),
+                *[f'--payout-option={x}' for x in payout_options],
+                '--work-dir', work_dir,
+                '--out', result_file,
+            ], stdin=subprocess.DEVNULL, check=True)
+            results.append(load_json(result_file))
+
+    unverified = [x for x in results if x['verified'] != x['rows']]
+    report = {
+        'revision': git_revision(),
+        'python': sys.version.split()[0],
+        'provider': chain_provider,
+        'payout_options': list(payout_options),
+        'started': datetime.utcnow().isoformat(timespec='seconds'),
+        'results': results,
+    }
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Wrote results to {out}')
+    if unverified:
+        raise click.ClickException('Not all payouts were verified: ' + ', '.join(
+            f'{x["verified"]} of {x["rows"]}' for x in unverified))
+
+@cli.command(name='sheet')
+@click.option('--provider', 'chain_provider', default='tester', type=str)
+@click.option('--rows', type=int, required=True)
+@click.option('--payout-option', 'payout_options', multiple=True)
+@click.option('--work-dir', type=click.Path(exists=True), required=True)
+@click.option('--out', type=click.Path(), required=True)
+def cli_sheet(chain_provider, rows, payout_options, work_dir, out):
+    """Benchmark a single sheet size (used by `run`)."""
+    result = bench_sheet(rows, chain_provider, list(payout_options), work_dir)
+    with open(out, 'w') as f:
+        json.dump(result, f)
+
+@cli.command(name='compare')
+@click.option('--threshold', default=0.1, type=float,
+              help='Slowdown in rows/sec reported as a regression')
+@click.argument('baseline-file', type=click.Path(exists=True))
+@click.argument('results-file', type=click.Path(exists=True))
+def cli_compare(threshold, baseline_file, results_file):
+    """Compare the rows/sec of two benchmark results."""
+    def by_size(report) -> Dict[int, dict]:
+        return {x['rows']: x['commands'] for x in report['results']}
+
+    baseline = by_size(load_json(baseline_file))
+    current = by_size(load_json(results_file))
+    regressions = []
+    for rows in sorted(set(baseline) & set(current)):
+        for name, result in current[rows].items():
+            if name not in baseline[rows]:
+                continue
+            before = baseline[rows][name]['rows_per_sec']
+            after = result['rows_per_sec']
+            change = (after - before) / before
+            line = f'{rows:>7} rows {name:<11} {before:>10.2f} -> {after:>10.2f} rows/sec ({change:+.1%})'
+            print(line)
+            if change < -threshold:
+                regressions.append(line)
+
+    if regressions:
+        raise click.ClickException('\n'.join(['Regressions:', *regressions]))
+
+
+if __name__ == '__main__':
+    cli()
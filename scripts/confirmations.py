@@ -0,0 +1,97 @@
+from typing import Iterable, List, Tuple
+
+import aio
+import metrics
+from db import TxStore
+from rpc import RPCError, to_int
+
+
+class ConfirmationTracker:
+    def __init__(self, store: TxStore, depth=12, window=None):
+        """ Follow the chain's block headers, and advance the confirmations
+        of mined rows from them, without fetching their receipts again.
+
+        Rows become final (`success = 1`) once `depth` blocks deep. The
+        headers of the last `window` blocks are kept. A new header that
+        doesn't extend the tracked ones is a reorg: the headers after the
+        fork are replaced, rows recorded in a block that is gone go back
+        to unconfirmed, and `verify` looks up their receipts again.
+
+        Args:
+            store: Payouts database.
+            depth: Confirmations for a row to be final (1 for the first receipt).
+            window: Number of recent headers tracked (at least `depth`).
+        """
+        self.store = store
+        self.depth = depth
+        self.window = max(window or 2 * depth, depth, 1)
+
+    async def fetch(self, rpc: aio.AsyncRPC, numbers: Iterable[int]) -> List[Tuple]:
+        """ Fetch block headers as (number, hash, parent_hash)."""
+        blocks = await rpc.batch(
+            'eth_getBlockByNumber', [[hex(x), False] for x in numbers])
+        headers = []
+        for block in blocks:
+            if isinstance(block, RPCError):
+                raise block
+            if not block:
+                # the head moved back while fetching, retry on the next block
+                break
+            headers.append(
+                (to_int(block['number']), block['hash'], block['parentHash']))
+        return headers
+
+    async def find_fork(self, rpc: aio.AsyncRPC, header: tuple) -> int:
+        """ Compare a new header with the tracked ones.
+
+        Returns:
+            The last block shared with the tracked chain, or None
+            if `header` extends it.
+        """
+        number, hash_, parent_hash = header
+        if self.store.header_hash(number) in (None, hash_) and \
+                self.store.header_hash(number - 1) in (None, parent_hash):
+            return None
+
+        number -= 1
+        while True:
+            tracked = self.store.header_hash(number)
+            if tracked is None:
+                # deeper than the tracked window
+                return number
+            chain = await self.fetch(rpc, [number])
+            if chain and chain[0][1] == tracked:
+                return number
+            number -= 1
+
+    async def advance(self, rpc: aio.AsyncRPC, head: int) -> Tuple[int, int]:
+        """ Track the headers up to `head`, and update confirmations.
+
+        Only the new headers are fetched, usually just one per block.
+
+        Returns:
+            (reorganized, finalized) number of rows.
+        """
+        start = max(head - self.window + 1, 0)
+        last = self.store.last_header()
+        if last and last[0] >= start:
+            # also re-checks the head itself when there is no new block
+            start = min(last[0] + 1, head)
+
+        headers = await self.fetch(rpc, range(start, head + 1))
+        if headers:
+            fork = await self.find_fork(rpc, headers[0])
+            if fork is not None:
+                self.store.forget_headers(fork)
+                headers = await self.fetch(rpc, range(fork + 1, head + 1))
+                print(f'Reorg after block {fork}')
+        if headers:
+            self.store.add_headers(headers)
+            head = headers[-1][0]
+        self.store.prune_headers(head - self.window + 1)
+
+        reorged, finalized = self.store.update_confirmations(head, self.depth)
+        if reorged:
+            metrics.reorged.inc(reorged)
+            print(f'{reorged} payouts were reorganized, and are unconfirmed again')
+        return reorged, finalized
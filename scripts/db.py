@@ -1,52 +1,490 @@
+import os
 import sqlite3
-from utils import script_source_dir
+from pathlib import Path
+from typing import Tuple
+from utils import script_source_dir, ether_to_wei
+import metrics
 
 
-def init_db(db_path):
-    with sqlite3.connect(db_path) as conn:
-        db_schema_path = script_source_dir() / 'sql' / 'txs_schema.sql'
-        schema = open(db_schema_path, 'r').read()
-        conn.executescript(schema)
-
-def import_txs(db_path, txs: dict):
-    """ Import pending transactions into their own SQLite database."""
-    q = """
-    INSERT INTO txs (name, recipient, amount, bucket)
-    VALUES (:name, :recipient, :amount, :bucket)
+def migrate(conn: sqlite3.Connection, directory='migrations') -> int:
+    """ Apply all pending schema migrations from sql/<directory>.
+
+    Migrations are numbered .sql files, applied in order, each in its own
+    transaction. The schema version is tracked in `PRAGMA user_version`.
+
+    Returns:
+        The resulting schema version.
     """
-    with sqlite3.connect(db_path) as conn:
-        cur = conn.cursor()
-        cur.executemany(q, txs)
+    # used by migrations that convert legacy FLOAT amounts
+    conn.create_function(
+        'ether_to_wei', 1, lambda x: str(ether_to_wei(repr(x))))
+
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    migrations = sorted((script_source_dir() / 'sql' / directory).glob('*.sql'))
+    for path in migrations:
+        target = int(path.name.split('_')[0])
+        if target <= version:
+            continue
+        try:
+            conn.executescript(
+                f'BEGIN;\n{path.read_text()}\n'
+                f'PRAGMA user_version = {target};\nCOMMIT;')
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        version = target
+    return version
 
-def query_all(db_path, query):
+def remove_db(db_path):
+    """ Delete a payouts database, along with its WAL files."""
+    for suffix in ['', '-wal', '-shm']:
+        if os.path.exists(f'{db_path}{suffix}'):
+            os.remove(f'{db_path}{suffix}')
+
+def init_db(db_path):
+    """ Create a new, fully migrated payouts database."""
+    remove_db(db_path)
     with sqlite3.connect(db_path) as conn:
-        cur = conn.cursor()
-        cur.execute(query)
+        migrate(conn)
+
+
+class TxStore:
+    def __init__(self, db_path, commit_every=500, synchronous='NORMAL'):
+        """ A payouts database connection, kept open for a whole command.
+
+        The database is switched to WAL mode, so each commit is a single
+        append to the write-ahead log instead of a journal rewrite.
+
+        Crash safety:
+            - Every broadcast is preceded by a committed intent
+              (`log_intent`), which is deleted in the same commit that
+              records the broadcast's txid. See `recovery.py`.
+            - Writes that record a broadcast or undo one (`update_txid`,
+              `update_txids`, `update_batch_txid`, `replace_txid`,
+              `set_mined_txid`, `mark_tx_for_retry`)
+              are committed before the method returns. A row is never
+              minted twice because its txid was still sitting in a buffer.
+            - Status updates (`mark_tx_as_successful(s)`, `mark_txs_as_mined`)
+              are buffered and committed once `commit_every` of them are
+              pending, on `commit()` and on `close()`. Losing them in a crash
+              only means that `verify` checks those rows again.
+            - With `synchronous = NORMAL` a commit survives a crash of this
+              process, but an OS crash or power loss can roll back the most
+              recent commits. Use `synchronous='FULL'` where that matters.
+
+        Args:
+            db_path: Path to the SQLite payouts database.
+            commit_every: Number of buffered status updates per commit.
+            synchronous: SQLite `synchronous` pragma (OFF, NORMAL, FULL).
+        """
+        self.db_path = db_path
+        self.commit_every = commit_every
+        self.uncommitted = 0
+
+        self.conn = sqlite3.connect(db_path)
+        migrate(self.conn)
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.execute(f'PRAGMA synchronous = {synchronous}')
+        self._reader = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @metrics.timed(metrics.db_seconds, call='commit')
+    def commit(self):
+        self.conn.commit()
+        self.uncommitted = 0
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+        if self._reader:
+            self._reader.close()
+
+    def _buffered(self, count=1):
+        self.uncommitted += count
+        if self.uncommitted >= self.commit_every:
+            self.commit()
+
+    def query_all(self, query, params=None):
+        cur = self.conn.cursor()
+        cur.execute(query, params or {})
         return cur.fetchall()
 
-def update_txid(db_path, id_, txid):
-    q = """
-    UPDATE txs SET txid = :txid WHERE id = :id
-    """
-    with sqlite3.connect(db_path) as conn:
-        cur = conn.cursor()
-        cur.execute(q, {'id': id_, 'txid': txid})
-        conn.commit()
+    def iter_chunks(self, query, params=None, chunk_size=1000):
+        """ Stream the results of `query` in lists of up to `chunk_size` rows.
 
-def mark_tx_as_successful(db_path, id_):
-    q = """
-    UPDATE txs SET success = 1 WHERE id = :id
-    """
-    with sqlite3.connect(db_path) as conn:
-        cur = conn.cursor()
-        cur.execute(q, {'id': id_})
-        conn.commit()
+        Rows are read lazily through a separate read-only connection. Under
+        WAL it sees a snapshot of the table as of the first fetch, so rows
+        can be updated through this store while the stream is consumed.
+        The WAL file cannot be checkpointed past that snapshot until the
+        stream is exhausted or closed.
+        """
+        if not self._reader:
+            db_uri = Path(self.db_path).resolve().as_uri()
+            self._reader = sqlite3.connect(f'{db_uri}?mode=ro', uri=True)
 
-def mark_tx_for_retry(db_path, id_):
-    q = """
-    UPDATE txs SET success = 0, txid = NULL WHERE id = :id
-    """
-    with sqlite3.connect(db_path) as conn:
-        cur = conn.cursor()
-        cur.execute(q, {'id': id_})
-        conn.commit()
+        cur = self._reader.cursor()
+        try:
+            cur.execute(query, params or {})
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cur.close()
+
+    def iter_rows(self, query, params=None, chunk_size=1000):
+        """ Stream the results of `query` one row at a time."""
+        for rows in self.iter_chunks(query, params, chunk_size):
+            yield from rows
+
+    @metrics.timed(metrics.db_seconds, call='import_txs')
+    def import_txs(self, txs: dict):
+        """ Import pending transactions into their own SQLite database.
+
+        Amounts are integer wei, and are stored unchanged.
+        """
+        q = """
+        INSERT INTO txs (name, recipient, amount, bucket)
+        VALUES (:name, :recipient, :amount, :bucket)
+        """
+        self.conn.executemany(q, (
+            {
+                **x,
+                'recipient': x['recipient'].lower(),
+                'amount': str(x['amount']),
+            }
+            for x in txs
+        ))
+        self.commit()
+
+    def update_txid(self, id_, txid, **kwargs):
+        self.update_txids([(id_, txid)], **kwargs)
+
+    @metrics.timed(metrics.db_seconds, call='update_txids')
+    def update_txids(self, pairs, nonce=None, gas_price=None, submitted_block=None,
+                     owner=None):
+        """ Assign txid's to rows, from an iterable of (id, txid) pairs.
+
+        Every assignment counts as another broadcast attempt of the row,
+        and resolves the row's broadcast intents. The `owner` that
+        broadcast the row is kept unless a new one is given.
+        """
+        q = """
+        UPDATE txs
+           SET txid = :txid,
+               nonce = :nonce,
+               gas_price = :gas_price,
+               submitted_block = :submitted_block,
+               owner = COALESCE(:owner, owner),
+               block_number = NULL,
+               block_hash = NULL,
+               confirmations = 0,
+               attempts = attempts + 1
+         WHERE id = :id
+        """
+        props = dict(
+            nonce=nonce, gas_price=gas_price, submitted_block=submitted_block,
+            owner=owner.lower() if owner else None)
+        pairs = list(pairs)
+        self.conn.executemany(
+            q, ({'id': id_, 'txid': txid, **props} for id_, txid in pairs))
+        # the broadcast is recorded, its intent is resolved in the same commit
+        q = """
+        DELETE FROM intents WHERE tx_id = :id
+        """
+        self.conn.executemany(q, ({'id': id_} for id_, _ in pairs))
+        self.commit()
+
+    def update_batch_txid(self, ids, txid, **kwargs):
+        """ Assign one `mintBatch` txid to all the rows it pays out."""
+        self.update_txids(((id_, txid) for id_ in ids), **kwargs)
+
+    @metrics.timed(metrics.db_seconds, call='log_intent')
+    def log_intent(self, ids, owner, nonce, txid=None, raw_tx=None,
+                   gas_price=None, submitted_block=None):
+        """ Durably record the intent to broadcast a transaction for rows
+        `ids`, before broadcasting it.
+
+        Args:
+            ids: Row ids the transaction pays out.
+            owner: Account the transaction is sent from.
+            nonce: Nonce of the transaction.
+            txid: Hash of the signed transaction, if signed locally.
+            raw_tx: The signed transaction, if signed locally.
+        """
+        q = """
+        INSERT INTO intents
+            (tx_id, owner, nonce, txid, raw_tx, gas_price, submitted_block)
+        VALUES
+            (:id, :owner, :nonce, :txid, :raw_tx, :gas_price, :submitted_block)
+        """
+        props = dict(
+            owner=owner.lower(), nonce=nonce, txid=txid, raw_tx=raw_tx,
+            gas_price=gas_price, submitted_block=submitted_block)
+        self.conn.executemany(q, ({'id': id_, **props} for id_ in ids))
+        self.commit()
+
+    def drop_intents(self, owner, nonce):
+        """ Forget the intents of a nonce that was never broadcast."""
+        q = """
+        DELETE FROM intents WHERE owner = :owner AND nonce = :nonce
+        """
+        self.conn.execute(q, {'owner': owner.lower(), 'nonce': nonce})
+        self.commit()
+
+    def open_intents(self):
+        """ Intents left behind by an interrupted payout, one per broadcast,
+        as (owner, nonce, txid, raw_tx, gas_price, submitted_block, ids).
+        """
+        q = """
+        SELECT owner, nonce, txid, raw_tx, gas_price, submitted_block,
+               group_concat(tx_id)
+          FROM intents
+         GROUP BY owner, nonce, txid
+         ORDER BY owner, nonce, id
+        """
+        return [
+            (*x[:-1], [int(id_) for id_ in x[-1].split(',')])
+            for x in self.query_all(q)
+        ]
+
+    def _keep_replaced(self, id_, txid=None):
+        q = """
+        INSERT INTO replacements (tx_id, txid, nonce, gas_price, submitted_block)
+        SELECT id, txid, nonce, gas_price, submitted_block
+          FROM txs
+         WHERE id = :id AND txid IS NOT NULL AND txid IS NOT :txid
+        """
+        self.conn.execute(q, {'id': id_, 'txid': txid})
+
+    def replace_txid(self, id_, txid, **kwargs):
+        """ Assign the txid of a replacement broadcast at the same nonce,
+        keeping the replaced txid and its details in `replacements`.
+        """
+        self._keep_replaced(id_, txid)
+        self.update_txids([(id_, txid)], **kwargs)
+
+    @metrics.timed(metrics.db_seconds, call='replaced_txids')
+    def replaced_txids(self, ids) -> dict:
+        """ Look up the replaced txid's of rows, by row id."""
+        q = """
+        SELECT tx_id, txid FROM replacements WHERE tx_id = :id ORDER BY id
+        """
+        replaced = {}
+        for id_ in ids:
+            for tx_id, txid in self.conn.execute(q, {'id': id_}):
+                replaced.setdefault(tx_id, []).append(txid)
+        return replaced
+
+    @metrics.timed(metrics.db_seconds, call='set_mined_txid')
+    def set_mined_txid(self, id_, txid):
+        """ Point a row back at one of its replaced txid's,
+        once that one turns out to be mined instead. The current txid
+        is kept in `replacements` in turn.
+        """
+        self._keep_replaced(id_, txid)
+        q = """
+        UPDATE txs
+           SET txid = :txid, block_number = NULL, block_hash = NULL,
+               confirmations = 0
+         WHERE id = :id
+        """
+        self.conn.execute(q, {'id': id_, 'txid': txid})
+        self.commit()
+
+    def mark_tx_as_successful(self, id_):
+        self.mark_txs_as_successful([id_])
+
+    @metrics.timed(metrics.db_seconds, call='mark_txs_as_successful')
+    def mark_txs_as_successful(self, ids):
+        q = """
+        UPDATE txs SET success = 1 WHERE id = :id
+        """
+        ids = list(ids)
+        self.conn.executemany(q, ({'id': id_} for id_ in ids))
+        self._buffered(len(ids))
+        metrics.confirmations.inc(len(ids))
+
+    @metrics.timed(metrics.db_seconds, call='mark_txs_as_mined')
+    def mark_txs_as_mined(self, rows):
+        """ Record the block of successfully mined rows, from an iterable
+        of (id, block_number, block_hash). The rows become final once
+        `update_confirmations` finds them deep enough.
+        """
+        q = """
+        UPDATE txs SET block_number = :block_number, block_hash = :block_hash
+         WHERE id = :id AND success = 0
+        """
+        rows = list(rows)
+        self.conn.executemany(q, (
+            {'id': id_, 'block_number': block_number, 'block_hash': block_hash}
+            for id_, block_number, block_hash in rows
+        ))
+        self._buffered(len(rows))
+
+    @metrics.timed(metrics.db_seconds, call='mark_minted')
+    def mark_minted(self, txid, recipient, amount, bucket,
+                    block_number=None, block_hash=None) -> str:
+        """ Mark the row paid out by a `TokensMinted` event as successful.
+
+        The row is looked up by txid first, including replaced txid's,
+        along with the recipient and amount, as a `mintBatch` txid pays
+        out many rows. Failing that, a row with the same (recipient,
+        amount, bucket) that has no txid yet takes over the event's txid.
+
+        Returns:
+            'txid', 'payout' or None, depending on how the row was matched.
+        """
+        params = dict(
+            txid=txid, recipient=recipient.lower(), amount=str(amount), bucket=bucket,
+            block_number=block_number, block_hash=block_hash)
+        q = """
+        UPDATE txs
+           SET success = 1,
+               block_number = COALESCE(:block_number, block_number),
+               block_hash = COALESCE(:block_hash, block_hash)
+         WHERE txid = :txid AND recipient = :recipient AND amount = :amount
+        """
+        if self.conn.execute(q, params).rowcount:
+            self._buffered()
+            return 'txid'
+
+        q = """
+        UPDATE txs
+           SET txid = :txid, success = 1,
+               block_number = :block_number, block_hash = :block_hash
+         WHERE id IN (SELECT tx_id FROM replacements WHERE txid = :txid)
+           AND recipient = :recipient AND amount = :amount
+        """
+        if self.conn.execute(q, params).rowcount:
+            self._buffered()
+            return 'txid'
+
+        q = """
+        UPDATE txs
+           SET txid = :txid, success = 1,
+               block_number = :block_number, block_hash = :block_hash
+         WHERE recipient = :recipient AND amount = :amount AND bucket = :bucket
+           AND txid IS NULL
+        """
+        if self.conn.execute(q, params).rowcount:
+            self._buffered()
+            return 'payout'
+
+    @metrics.timed(metrics.db_seconds, call='has_minted')
+    def has_minted(self, recipient) -> bool:
+        """ Check whether any payout to `recipient` was already broadcast."""
+        q = """
+        SELECT 1 FROM txs WHERE recipient = :recipient AND txid IS NOT NULL LIMIT 1
+        """
+        params = {'recipient': recipient.lower()}
+        return self.conn.execute(q, params).fetchone() is not None
+
+    def get_checkpoint(self, name):
+        """ Return the last block processed by a named scanner."""
+        q = """
+        SELECT block FROM checkpoints WHERE name = :name
+        """
+        row = self.conn.execute(q, {'name': name}).fetchone()
+        return row[0] if row else None
+
+    def set_checkpoint(self, name, block):
+        """ Record the last processed block, and commit along with it
+        all the updates made since the previous checkpoint.
+        """
+        q = """
+        INSERT OR REPLACE INTO checkpoints (name, block) VALUES (:name, :block)
+        """
+        self.conn.execute(q, {'name': name, 'block': block})
+        self.commit()
+
+    @metrics.timed(metrics.db_seconds, call='mark_tx_for_retry')
+    def mark_tx_for_retry(self, id_):
+        """ Reset a row for another payout attempt. Its current txid is
+        kept in `replacements`, so a late inclusion can still be matched.
+        """
+        self._keep_replaced(id_)
+        q = """
+        UPDATE txs
+           SET success = 0, txid = NULL, nonce = NULL, submitted_block = NULL,
+               owner = NULL, block_number = NULL, block_hash = NULL,
+               confirmations = 0
+         WHERE id = :id
+        """
+        self.conn.execute(q, {'id': id_})
+        self.commit()
+
+    def last_header(self):
+        """ Return the (number, hash) of the latest tracked block header."""
+        q = """
+        SELECT number, hash FROM headers ORDER BY number DESC LIMIT 1
+        """
+        return self.conn.execute(q).fetchone()
+
+    def header_hash(self, number):
+        q = """
+        SELECT hash FROM headers WHERE number = :number
+        """
+        row = self.conn.execute(q, {'number': number}).fetchone()
+        return row[0] if row else None
+
+    def prune_headers(self, before):
+        """ Forget the headers of blocks older than `before`."""
+        q = """
+        DELETE FROM headers WHERE number < :number
+        """
+        self.conn.execute(q, {'number': before})
+
+    def add_headers(self, headers):
+        """ Track block headers, from an iterable of (number, hash, parent_hash)."""
+        q = """
+        INSERT OR REPLACE INTO headers (number, hash, parent_hash)
+        VALUES (?, ?, ?)
+        """
+        self.conn.executemany(q, headers)
+
+    def forget_headers(self, after):
+        """ Forget the headers of blocks after `after`, reorganized away."""
+        q = """
+        DELETE FROM headers WHERE number > :number
+        """
+        self.conn.execute(q, {'number': after})
+
+    @metrics.timed(metrics.db_seconds, call='update_confirmations')
+    def update_confirmations(self, head, depth) -> Tuple[int, int]:
+        """ Bring the confirmations of mined rows up to date with `head`,
+        and mark the rows at least `depth` blocks deep as successful.
+
+        Rows recorded in a block whose hash differs from the tracked
+        header go back to unconfirmed first, so that their receipts are
+        checked again.
+
+        Returns:
+            (reorganized, finalized) number of rows.
+        """
+        q = """
+        UPDATE txs SET block_number = NULL, block_hash = NULL, confirmations = 0
+         WHERE success = 0 AND block_number IS NOT NULL
+           AND block_hash != (SELECT hash FROM headers WHERE number = txs.block_number)
+        """
+        reorged = self.conn.execute(q).rowcount
+        q = """
+        UPDATE txs SET confirmations = MAX(:head - block_number + 1, 0)
+         WHERE success = 0 AND block_number IS NOT NULL
+        """
+        self.conn.execute(q, {'head': head})
+        q = """
+        UPDATE txs SET success = 1
+         WHERE success = 0 AND block_number IS NOT NULL AND confirmations >= :depth
+        """
+        finalized = self.conn.execute(q, {'depth': depth}).rowcount
+        self.commit()
+        metrics.confirmations.inc(finalized)
+        return reorged, finalized
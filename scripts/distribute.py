@@ -1,101 +1,137 @@
+import asyncio
 import click
+import cProfile
 import os
+import threading
 import web3
 
 from web3.utils.validation import validate_address
-from toolz import pipe, keymap
-from eth_utils import to_wei
+from eth_utils import from_wei
 from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from utils import (
-    load_json,
     get_chain,
     default_wallet_account,
     unlock_wallet,
-    load_csv_to_dict,
+    ether_to_wei,
 )
-from db import (
-    init_db,
-    import_txs,
-    query_all,
-    update_txid,
-    mark_tx_as_successful,
-    mark_tx_for_retry,
+from db import init_db, remove_db, TxStore
+from pipeline import PayoutPipeline, NodeSender, NonceManager
+from signer import LocalSigner, LocalSender
+from gas import GasCache, GasKey
+from fees import FeeEngine, gwei_to_wei
+from rpc import RPCError
+from recovery import recover_intents
+from confirmations import ConfirmationTracker
+from receipts import ReceiptWaiter
+from mirror import Mirror, MirrorStore
+from artifacts import load_abi
+import aio
+import metrics
+from logscan import scan_events
+from importer import (
+    SheetImporter,
+    iter_payout_sheet,
+    validated_payout,
+    roles,
+    buckets,
 )
 
-roles = 'Team Supporters Creators Bounties SeedSale MainSale'.split(' ')
-buckets = dict(zip(roles, range(len(roles))))
+# Rough `mintBatch` gas costs, used to size batches below a gas target.
+# The actual gas limit of a batch is still estimated by the node.
+BATCH_BASE_GAS = 80_000
+BATCH_RECIPIENT_GAS = 40_000
 
-def rename_field(field_name):
-    # these are the standard fields
-    if field_name.lower() in ['name', 'amount', 'recipient', 'bucket']:
-        return field_name.lower()
+def bucket_totals(payouts) -> Dict[int, int]:
+    """ Sum up payout amounts per bucket id.
 
-    # these are here for compatibility with Speadsheet headers
-    rename = {
-        'Tokens': 'amount',
-        'Address': 'recipient',
-        'Bucket': 'bucket',
-        'Category': 'bucket',
-    }
-    return rename.get(field_name, '')
-
-def validated_payouts(payouts_in):
-    """
-    This method validates json transactions.
-    It ensures `recipient` addresses are valid ETH addresses,
-    and expands `bucket` aliases into proper bucket_id's.
+    Args:
+        payouts: Iterable of (bucket, amount) pairs.
     """
-    # swap bucket name with matching ID
-    payouts = [
-        {
-            **x,
-            'bucket': buckets[x['bucket']],
-            'amount': float(x['amount'].replace(',', '')),
-        }
-        for x in (keymap(rename_field, y) for y in payouts_in)
-    ]
+    totals = defaultdict(int)
+    for bucket, amount in payouts:
+        totals[bucket] += amount
+    return dict(totals)
 
-    # validate addresses
-    for payout in payouts:
-        validate_address(payout['recipient'])
+def sync_mirror(mirror: Mirror) -> int:
+    """ Sync a mirror up to the head block, resuming from its checkpoint.
+    It has to be initialised beforehand (`mirror.py sync`), from the
+    block the mintage was deployed at, rather than scanned from genesis.
 
-    return payouts
+    Returns:
+        The block it is synced up to.
+    """
+    if not mirror.store.get_checkpoint(mirror.name):
+        raise click.ClickException(
+            f'{mirror.mintage.address} has not been synced to the mirror '
+            'database, run `mirror.py sync` first')
+    return mirror.sync()
 
+def remaining_mint_limits(
+    instance: web3.eth.Contract,
+    mirror: MirrorStore = None,
+    head: int = None) -> Dict[int, int]:
+    """ Query how many tokens (in wei) each bucket can still mint.
 
-def txs_from_file(filename: str) -> dict:
-    """
-    Load a payout sheet that adheres to Google Sheet
-    csv or the standardized json input.
+    With a `mirror`, the totals are read from the local mirror database
+    (see mirror.py) instead of the contract. It has to be synced up to
+    `head` (the head block by default), or it could miss recent mints.
     """
-    extension = filename.split('.')[-1]
-    if extension == 'json':
-        loader_fn = load_json
-    elif extension == 'csv':
-        loader_fn = load_csv_to_dict
-    else:
-        raise ValueError(f'Unsupported file type "{extension}"')
+    if mirror:
+        remaining = mirror.remaining_mint_limits(instance.address)
+        checkpoint = mirror.get_checkpoint(f'mirror:{instance.address.lower()}')
+        if set(remaining) != set(buckets.values()) or not checkpoint:
+            raise click.ClickException(
+                f'{instance.address} has not been synced to the mirror database')
+        if head is None:
+            head = instance.web3.eth.blockNumber
+        if checkpoint[0] < head:
+            raise click.ClickException(
+                f'The mirror database is synced up to block {checkpoint[0]}, '
+                f'behind the head block {head}')
+        return remaining
 
-    return pipe(
-        filename,
-        loader_fn,
-        validated_payouts,
-    )
+    remaining = {}
+    for bucket in buckets.values():
+        mint_limit, amount_minted = instance.call().categories(bucket)
+        remaining[bucket] = mint_limit - amount_minted
+    return remaining
+
+def check_mint_limits(
+    instance: web3.eth.Contract,
+    totals: Dict[int, int],
+    mirror: MirrorStore = None,
+    head: int = None):
+    """ Reject payouts that would exceed a bucket's remaining `mintLimit`."""
+    remaining = remaining_mint_limits(instance, mirror, head)
+    buckets_reverse = {v:k for k, v in buckets.items()}
+    errors = [
+        f'{buckets_reverse[bucket]} payouts total {from_wei(total, "ether")}, '
+        f'but only {from_wei(remaining[bucket], "ether")} can still be minted'
+        for bucket, total in sorted(totals.items())
+        if total > remaining[bucket]
+    ]
+    if errors:
+        raise click.ClickException('\n'.join(['Mint limit exceeded:', *errors]))
 
 def get_token_mintage_instance(
     w3: web3.Web3,
     abi_path: str,
     contract_address: str) -> web3.eth.Contract:
     """ Reconstruct a contract instance from its address and ABI."""
-    abi = load_json(abi_path)
+    abi = load_abi(abi_path)
     return w3.eth.contract(abi, contract_address)
 
 
+@metrics.timed(metrics.phase_seconds, phase='mint')
 def mint_tokens(
     instance: web3.eth.Contract,
     owner: str,
     recipient: str,
-    amount: float,
+    amount: int,
     bucket: int, **kwargs) -> str:
     """ Call `mint` function on target contract.
 
@@ -103,14 +139,14 @@ def mint_tokens(
         instance: A ViewTokenMintage live and initialized contract instance.
         owner: An authorized Ethereum account to call the minting contract from.
         recipient: Address of VIEW Token Recipient.
-        amount: Amount of VIEW Tokens to mint.
+        amount: Amount of VIEW Tokens to mint, in wei.
         bucket: A bucket number of the funding source (Team, Supporters...)
 
     Returns:
         txid: Transaction ID of the function call
     """
     assert bucket in buckets.values(), "Invalid bucket id"
-    assert type(amount) == float, "Invalid amount type"
+    assert type(amount) == int, "Invalid amount type"
     validate_address(recipient)
 
     tx_props = {
@@ -121,61 +157,612 @@ def mint_tokens(
     # w3.eth.estimateGas() is usded
     if 'gas' in kwargs:
         tx_props['gas'] = kwargs['gas']
+    # if nonce is not provided,
+    # the node assigns the next available one
+    if 'nonce' in kwargs:
+        tx_props['nonce'] = kwargs['nonce']
+    # if gas price is not provided,
+    # the node's default price is used
+    if kwargs.get('gas_price'):
+        tx_props['gasPrice'] = kwargs['gas_price']
 
     txid = instance.transact(tx_props).mint(
         recipient,
-        to_wei(amount, 'ether'),
+        amount,
+        bucket
+    )
+    return txid
+
+def build_mint_transaction(
+    instance: web3.eth.Contract,
+    owner: str,
+    recipient: str,
+    amount: int,
+    bucket: int, **kwargs) -> dict:
+    """ Build an unsigned `mint` transaction, for signing it locally.
+
+    Args:
+        instance: A ViewTokenMintage live and initialized contract instance.
+        owner: An authorized Ethereum account to call the minting contract from.
+        recipient: Address of VIEW Token Recipient.
+        amount: Amount of VIEW Tokens to mint, in wei.
+        bucket: A bucket number of the funding source (Team, Supporters...)
+
+    Returns:
+        A transaction dict, without the nonce and gas price.
+    """
+    assert bucket in buckets.values(), "Invalid bucket id"
+    assert type(amount) == int, "Invalid amount type"
+    validate_address(recipient)
+
+    tx = {
+        'to': instance.address,
+        'value': 0,
+        'data': instance.encodeABI('mint', args=[recipient, amount, bucket]),
+    }
+    # if gas limit is not provided,
+    # w3.eth.estimateGas() is usded
+    if 'gas' in kwargs:
+        tx['gas'] = kwargs['gas']
+    else:
+        with metrics.phase_seconds.time(phase='estimate_gas'):
+            tx['gas'] = instance.web3.eth.estimateGas({**tx, 'from': owner})
+    return tx
+
+@metrics.timed(metrics.phase_seconds, phase='mint')
+def mint_tokens_batch(
+    instance: web3.eth.Contract,
+    owner: str,
+    recipients: List[str],
+    amounts: List[int],
+    bucket: int, **kwargs) -> str:
+    """ Call `mintBatch` function on target contract.
+
+    Args:
+        instance: A ViewTokenMintage live and initialized contract instance.
+        owner: An authorized Ethereum account to call the minting contract from.
+        recipients: Addresses of VIEW Token Recipients.
+        amounts: Amounts of VIEW Tokens to mint in wei, one for each recipient.
+        bucket: A bucket number of the funding source (Team, Supporters...)
+
+    Returns:
+        txid: Transaction ID of the function call
+    """
+    assert bucket in buckets.values(), "Invalid bucket id"
+    assert len(recipients) == len(amounts), "Recipients and amounts differ"
+    assert all(type(x) == int for x in amounts), "Invalid amount type"
+    for recipient in recipients:
+        validate_address(recipient)
+
+    tx_props = {
+        'value': 0,
+        'from': owner,
+    }
+    if 'gas' in kwargs:
+        tx_props['gas'] = kwargs['gas']
+    if 'nonce' in kwargs:
+        tx_props['nonce'] = kwargs['nonce']
+
+    txid = instance.transact(tx_props).mintBatch(
+        recipients,
+        amounts,
         bucket
     )
     return txid
 
+def expected_mint_input(
+    instance: web3.eth.Contract,
+    store: TxStore,
+    ids: List[int]) -> str:
+    """ The call data of the `mint` (single row) or `mintBatch`
+    transaction paying out rows `ids`.
+    """
+    q = """
+    SELECT recipient, amount, bucket FROM txs WHERE id = :id
+    """
+    rows = [store.query_all(q, {'id': id_})[0] for id_ in ids]
+    recipients, amounts, buckets_ = zip(*rows)
+    amounts = [int(x) for x in amounts]
+    if len(rows) == 1:
+        return instance.encodeABI(
+            'mint', args=[recipients[0], amounts[0], buckets_[0]])
+    return instance.encodeABI(
+        'mintBatch', args=[list(recipients), amounts, buckets_[0]])
+
+def mint_gas_limits(
+    instance: web3.eth.Contract,
+    owner: str,
+    store: TxStore,
+    cache: GasCache,
+    payouts,
+    limits: dict):
+    """ Look up the `mint` gas limit of payout rows in a gas cache,
+    as they are being streamed.
+
+    A recipient counts as minted to for the first time unless one of its
+    rows was broadcast before, in this run or an earlier one.
+
+    Args:
+        limits: Filled with a (GasKey, gas limit) pair per row id.
+    """
+    minted = set()
+    for payout in payouts:
+        id_, recipient, amount, bucket = payout
+        first_mint = recipient not in minted and not store.has_minted(recipient)
+        minted.add(recipient)
+
+        key = GasKey(instance.address.lower(), 'mint', bucket, first_mint)
+        def estimate():
+            with metrics.phase_seconds.time(phase='estimate_gas'):
+                return instance.estimateGas({'from': owner}) \
+                    .mint(recipient, amount, bucket)
+        limits[id_] = key, cache.gas_limit(key, estimate)
+        yield payout
+
+def until_stopped(payouts, stopped: threading.Event):
+    """ Stream payout rows until `stopped` is set."""
+    for payout in payouts:
+        if stopped.is_set():
+            return
+        yield payout
+
+def run_workers(owners: List[str], worker: Callable):
+    """ Run `worker(owner, shard, stopped)` for every owner account,
+    each on its own thread (or the calling one, for a single owner).
+
+    When a worker fails, or on Ctrl-C, `stopped` is set so that the other
+    workers stop taking new rows, and the error is raised once they have
+    finished with their in-flight transactions.
+    """
+    stopped = threading.Event()
+    if len(owners) == 1:
+        return worker(owners[0], 0, stopped)
+
+    with ThreadPoolExecutor(len(owners)) as pool:
+        futures = [
+            pool.submit(worker, owner, shard, stopped)
+            for shard, owner in enumerate(owners)
+        ]
+        try:
+            for future in as_completed(futures):
+                future.result()
+        except BaseException:
+            stopped.set()
+            raise
+
+def wei_payouts(rows):
+    """ Convert the wei amounts of (id, recipient, amount, bucket) rows,
+    stored as TEXT in SQLite, back into integers.
+    """
+    for id_, recipient, amount, bucket in rows:
+        yield id_, recipient, int(amount), bucket
+
+def pack_batches(payouts, max_gas: int):
+    """ Group payout rows (id, recipient, amount, bucket) into
+    single-bucket batches that fit within `max_gas`.
+
+    Rows are expected to be sorted by bucket.
+    """
+    max_size = max(1, (max_gas - BATCH_BASE_GAS) // BATCH_RECIPIENT_GAS)
+    batch = []
+    for payout in payouts:
+        if batch and (batch[0][3] != payout[3] or len(batch) == max_size):
+            yield batch
+            batch = []
+        batch.append(payout)
+    if batch:
+        yield batch
+
+def is_receipt_successful(receipt: dict) -> bool:
+    return bool(receipt['blockNumber'] and receipt['status'])
+
+def is_receipt_out_of_gas(tx: dict, receipt: dict) -> bool:
+    return receipt['status'] == 0 and tx['gas'] == receipt['gasUsed']
+
+@metrics.timed(metrics.phase_seconds, phase='verify_tx')
 def is_tx_successful(w3: web3.Web3, txid: str) -> bool:
     """ Check whether an Ethereum transaction was successful."""
     receipt = w3.eth.getTransactionReceipt(txid)
-    return receipt['blockNumber'] and receipt['status']
+    return is_receipt_successful(receipt)
 
 def is_tx_out_of_gas(w3: web3.Web3, txid: str) -> bool:
     """ Check whether an Ethereum transaction failed by running out of gas."""
-    tx = w3.eth.getTransaction()
+    tx = w3.eth.getTransaction(txid)
     receipt = w3.eth.getTransactionReceipt(txid)
-    return receipt['status'] == 0 and tx['gas'] == receipt['gasUsed']
+    return is_receipt_out_of_gas(tx, receipt)
+
+def verify_from_logs(
+    w3: web3.Web3,
+    instance: web3.eth.Contract,
+    store: TxStore,
+    from_block: Optional[int],
+    to_block: int):
+    """ Mark rows as successful from the contract's `TokensMinted` events.
+
+    Unless `from_block` is given, scanning resumes from the last
+    checkpointed block (or the genesis block), so reruns only look at
+    new blocks.
+    """
+    checkpoint_name = f'TokensMinted:{instance.address.lower()}'
+    if from_block is None:
+        checkpoint = store.get_checkpoint(checkpoint_name)
+        from_block = 0 if checkpoint is None else checkpoint + 1
+
+    matches = {'txid': 0, 'payout': 0, None: 0}
+    for last_block, events in scan_events(
+            w3, instance, 'TokensMinted', from_block, to_block):
+        match_events(store, events, matches)
+        store.set_checkpoint(checkpoint_name, last_block)
+        print(f'Scanned up to block {last_block}')
+
+    print(f'Matched {matches["txid"]} events by txid, '
+          f'{matches["payout"]} by payout, {matches[None]} unmatched.')
+
+def verify_from_mirror(
+    contract_address: str,
+    store: TxStore,
+    mirror: MirrorStore,
+    confirmations: int):
+    """ Mark rows as successful from the `TokensMinted` events in
+    the local mirror database, without querying the node.
+
+    Events of the most recent `confirmations` synced blocks are left out,
+    as the mirror may still roll them back.
+    """
+    checkpoint = mirror.get_checkpoint(f'mirror:{contract_address.lower()}')
+    if not checkpoint:
+        raise click.ClickException(
+            f'{contract_address} has not been synced to the mirror database')
+    to_block = checkpoint[0] - confirmations
+
+    matches = {'txid': 0, 'payout': 0, None: 0}
+    match_events(
+        store, mirror.iter_events(contract_address, 'TokensMinted', to_block), matches)
+    store.commit()
+    print(f'Matched {matches["txid"]} events by txid, '
+          f'{matches["payout"]} by payout, {matches[None]} unmatched '
+          f'(mirrored up to block {to_block}).')
+
+def match_events(store: TxStore, events, matches: dict):
+    """ Mark the rows paid out by `TokensMinted` events as successful,
+    and count them by how they were matched.
+    """
+    for event in events:
+        txid = event['transactionHash']
+        args = event['args']
+        match = store.mark_minted(
+            txid,
+            args['recipient'],
+            args['tokens'],
+            args['category'],
+            block_number=event['blockNumber'],
+            block_hash=event['blockHash'],
+        )
+        matches[match] += 1
+        if match:
+            metrics.confirmations.inc()
+        if not match:
+            print(f'{txid} does not match any payout.')
+
+
+@metrics.timed(metrics.phase_seconds, phase='verify_chunk')
+async def verify_chunk(
+    rpc: aio.AsyncRPC,
+    store: TxStore,
+    chunk: List[tuple],
+    batch_size=100,
+    verbose=True,
+    receipts=None) -> List[tuple]:
+    """ Verify a chunk of (id, txid) rows from their receipts.
+
+    The block of successful rows is recorded, and a `ConfirmationTracker`
+    marks them as successful once deep enough. Rows whose latest txid is
+    not mined are also checked against their replaced txid's, and point
+    to the one that was mined successfully, if any.
+
+    Args:
+        receipts: Receipts already fetched (ie. by a `ReceiptWaiter`),
+            by txid, instead of looking them up.
+
+    Returns:
+        Failed rows, as (id, txid, reason).
+    """
+    rpc_kwargs = dict(batch_size=batch_size)
+    if receipts is None:
+        receipts = await aio.get_receipts(
+            rpc, [x[1] for x in chunk], **rpc_kwargs)
+    failed = [
+        txid for txid, receipt in receipts.items()
+        if isinstance(receipt, dict) and
+        not is_receipt_successful(receipt)
+    ]
+    # a replaced broadcast may have been mined instead
+    replaced = store.replaced_txids(
+        id_ for id_, txid in chunk if receipts[txid] is None)
+    txs, replaced_receipts = await asyncio.gather(
+        aio.get_transactions(rpc, failed, **rpc_kwargs),
+        aio.get_receipts(
+            rpc, [x for txids in replaced.values() for x in txids],
+            **rpc_kwargs),
+    )
+
+    successful, failures = [], []
+    for id_, txid in chunk:
+        receipt = receipts[txid]
+        for replaced_txid in replaced.get(id_, []):
+            # failed ones may be from an earlier attempt, at another nonce
+            if isinstance(replaced_receipts[replaced_txid], dict) and \
+                    is_receipt_successful(replaced_receipts[replaced_txid]):
+                txid, receipt = \
+                    replaced_txid, replaced_receipts[replaced_txid]
+                store.set_mined_txid(id_, txid)
+                break
+        if not receipt or isinstance(receipt, RPCError):
+            if verbose:
+                print(f'Unable to verify {txid}. Try again later.')
+            continue
+        if is_receipt_successful(receipt):
+            successful.append((id_, receipt['blockNumber'], receipt['blockHash']))
+            if verbose:
+                print(f'{txid} is OK.')
+        else:
+            tx = txs.get(txid)
+            out_of_gas = isinstance(tx, dict) and \
+                is_receipt_out_of_gas(tx, receipt)
+            failures.append((id_, txid, 'Out of Gas' if out_of_gas else 'Fail'))
+    store.mark_txs_as_mined(successful)
+    return failures
+
+async def verify_txs(
+    rpc: aio.AsyncRPC,
+    store: TxStore,
+    batch_size=100,
+    workers=8,
+    verbose=True) -> List[tuple]:
+    """ Verify all rows that are not known to be mined yet, with up to
+    `workers` chunks in flight.
+
+    Chunks are read from the database only as fast as they are verified.
+
+    Returns:
+        Failed rows, as (id, txid, reason).
+    """
+    q = """
+    SELECT id, txid
+     FROM txs
+     WHERE success = 0 AND txid IS NOT NULL AND block_number IS NULL
+     ORDER BY id;
+    """
+    chunks = asyncio.Queue(maxsize=workers)
+    failures = []
+
+    async def worker():
+        while True:
+            chunk = await chunks.get()
+            if chunk is None:
+                return
+            failures.extend(
+                await verify_chunk(rpc, store, chunk, batch_size, verbose))
+
+    tasks = [asyncio.ensure_future(worker()) for _ in range(workers)]
+    try:
+        for chunk in store.iter_chunks(q, chunk_size=batch_size):
+            await chunks.put(chunk)
+        for _ in tasks:
+            await chunks.put(None)
+        await asyncio.gather(*tasks)
+    finally:
+        # let cancelled workers finish their current database write
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return failures
+
+def count_unverified(store: TxStore) -> int:
+    q = """
+    SELECT count(*) FROM txs WHERE success = 0 AND txid IS NOT NULL;
+    """
+    return store.query_all(q)[0][0]
+
+def count_unfinal(store: TxStore) -> int:
+    """ Count the rows mined, but not deep enough to be final yet."""
+    q = """
+    SELECT count(*) FROM txs WHERE success = 0 AND block_number IS NOT NULL;
+    """
+    return store.query_all(q)[0][0]
+
+async def watch_txs(
+    rpc: aio.AsyncRPC,
+    store: TxStore,
+    batch_size=100,
+    poll_interval=5.0,
+    done=lambda: True,
+    finality_depth=12,
+    on_receipt=None):
+    """ Verify unverified rows on every new block, until all of them are
+    final or have failed, and `done()` returns True.
+
+    A `ReceiptWaiter` finds the txid's (and replaced txid's) of rows that
+    are not mined yet in the new blocks, so only the receipts of rows
+    mined in them are fetched. Confirmations are then advanced from the
+    block headers.
+
+    Args:
+        on_receipt: Called with the (txid, receipt) of every mined txid.
+    """
+    q = """
+    SELECT id, txid
+     FROM txs
+     WHERE success = 0 AND txid IS NOT NULL AND block_number IS NULL
+     ORDER BY id;
+    """
+    tracker = ConfirmationTracker(store, finality_depth)
+    waiter = ReceiptWaiter(rpc, batch_size)
+    reported, failed_txids = set(), set()
+    async for block in aio.new_blocks(rpc, poll_interval):
+        rows = dict(store.iter_rows(q))
+        # rows of a `mintBatch` share their txid
+        row_ids = defaultdict(list)
+        for id_, txid in rows.items():
+            row_ids[txid.lower()].append(id_)
+        for id_, txids in store.replaced_txids(rows).items():
+            for txid in txids:
+                row_ids[txid.lower()].append(id_)
+        waiter.track(set(row_ids) - failed_txids)
+
+        receipts = await waiter.poll(block)
+        if on_receipt:
+            for txid, receipt in receipts.items():
+                on_receipt(txid, receipt)
+        mined = sorted({id_ for txid in receipts for id_ in row_ids[txid]})
+        failures = await verify_chunk(
+            rpc, store, [(x, rows[x]) for x in mined], batch_size,
+            verbose=False,
+            receipts={rows[x]: receipts.get(rows[x].lower()) for x in mined},
+        ) if mined else []
+        failed_txids.update(txid.lower() for _, txid, _ in failures)
+        await tracker.advance(rpc, block)
+        for id_, txid, reason in failures:
+            if id_ not in reported:
+                reported.add(id_)
+                print(f'{txid} has failed ({reason}). Run verify to retry.')
+
+        unverified = count_unverified(store) - len(reported)
+        print(f'Block {block}: {unverified} payouts awaiting confirmation '
+              f'({count_unfinal(store)} mined)')
+        if not unverified and done():
+            return
 
 
 # CLI
 # ---
 context_settings = dict(help_option_names=['-h', '--help'])
 @click.group(context_settings=context_settings)
-def cli():
-    pass
+@click.option('--metrics-port', default=None, type=int,
+              help='Serve Prometheus metrics on this port while running')
+@click.option('--metrics-file', default=None, type=click.Path(),
+              help='Append JSON metrics snapshots to this file')
+@click.option('--metrics-interval', default=10.0, type=float,
+              help='Seconds between JSON metrics snapshots')
+@click.option('--profile', 'profile_file', default=None, type=click.Path(),
+              help='Write a cProfile dump (.pstats) of the command to this file')
+@click.pass_context
+def cli(ctx, metrics_port, metrics_file, metrics_interval, profile_file):
+    if metrics_port:
+        server = metrics.serve(metrics_port)
+        def stop_server():
+            server.shutdown()
+            server.server_close()
+        ctx.call_on_close(stop_server)
+        print(f'Serving metrics on http://127.0.0.1:{metrics_port}/metrics')
+    if metrics_file:
+        writer = metrics.SnapshotWriter(metrics_file, metrics_interval).start()
+        ctx.call_on_close(writer.stop)
+    if profile_file:
+        profiler = cProfile.Profile()
+        def dump_profile():
+            profiler.disable()
+            profiler.dump_stats(profile_file)
+            print(f'Wrote profile to {profile_file}')
+        profiler.enable()
+        ctx.call_on_close(dump_profile)
 
 @cli.command(name='import-txs')
+@click.option('--provider', 'chain_provider', default='parity', type=str,
+              help='Chain Provider (parity, geth, tester...), or a comma separated pool')
+@click.option('--chain', 'chain_name', default='mainnet', type=str,
+              help='Name of ETH Chain (mainnet, kovan, rinkeby...)')
+@click.option('--contract-address', default=None, type=str,
+              help='Check totals against this ViewTokenMintage contract')
+@click.option('--abi-path', default='build/view_token_mintage.abi.json',
+              type=click.Path(),
+              help='ABI of the token minting contract')
+@click.option('--chunk-size', default=5000, type=int,
+              help='Rows per validation task and database transaction')
+@click.option('--workers', default=None, type=int,
+              help='Number of validation processes (default: CPU count)')
+@click.option('--reject-file', default=None, type=click.Path(),
+              help='Where to write rejected rows (default: <db-file>.rejects.csv)')
 @click.argument('payout-sheet-file', type=click.Path(exists=True))
 @click.argument('db-file', required=False, type=click.Path(exists=False))
-def cli_import_txs(payout_sheet_file, db_file):
+def cli_import_txs(
+    chain_provider,
+    chain_name,
+    contract_address,
+    abi_path,
+    chunk_size,
+    workers,
+    reject_file,
+    payout_sheet_file,
+    db_file):
     """Import transactions from json file to a new database for processing."""
-    txs = txs_from_file(payout_sheet_file)
-
     db_file = db_file or f'{Path(payout_sheet_file).stem}.db'
+    reject_file = reject_file or f'{db_file}.rejects.csv'
     if os.path.exists(db_file):
         click.confirm(f'Database {db_file} already exists. Overwrite?',
                       abort=True)
 
     init_db(db_file)
-    import_txs(db_file, txs)
-    print(f'Imported {len(txs)} transactions into {db_file}')
+    with TxStore(db_file) as store:
+        importer = SheetImporter(
+            store, validated_payout, reject_file,
+            chunk_size=chunk_size, workers=workers)
+        importer.run(iter_payout_sheet(payout_sheet_file))
+
+    if contract_address:
+        w3 = get_chain(chain_provider, chain_name)
+        instance = get_token_mintage_instance(w3, abi_path, contract_address)
+        try:
+            check_mint_limits(instance, importer.totals)
+        except click.ClickException:
+            remove_db(db_file)
+            raise
+
+    print(f'Imported {importer.imported} transactions into {db_file}')
+    if importer.rejected:
+        print(f'Rejected {importer.rejected} rows, see {reject_file}')
 
 @cli.command(name='payout')
 @click.option('--provider', 'chain_provider', default='parity', type=str,
-              help='Chain Provider (parity, geth, tester...)')
+              help='Chain Provider (parity, geth, tester...), or a comma separated pool')
 @click.option('--chain', 'chain_name', default='mainnet', type=str,
               help='Name of ETH Chain (mainnet, kovan, rinkeby...)')
-@click.option('--owner', default=None, type=str,
-              help='Account to call the contract from')
+@click.option('--owner', multiple=True, type=str,
+              help='Account to call the contract from (repeat to shard across owners)')
 @click.option('--contract-address', prompt=True, type=str,
               help='Address of ViewTokenMintage contract')
 @click.option('--abi-path', default='build/view_token_mintage.abi.json',
-              type=click.Path(exists=True),
+              type=click.Path(),
               help='ABI of the token minting contract')
+@click.option('--pipeline', is_flag=True,
+              help='Assign nonces locally and keep many txs in flight')
+@click.option('--window', default=64, type=int,
+              help='Max. in-flight transactions in --pipeline mode')
+@click.option('--gas', default=None, type=int,
+              help='Fixed gas limit per mint (learned from estimates by default)')
+@click.option('--gas-price', default=None, type=str,
+              help='Fixed gas price in gwei (sampled from recent blocks by default)')
+@click.option('--confirm-within', default=3, type=int,
+              help='Target confirmation time in blocks, for picking gas prices')
+@click.option('--max-gas-price', default=None, type=str,
+              help='Never pay more than this gas price, in gwei')
+@click.option('--stuck-blocks', default=12, type=int,
+              help='Replace txs pending for this many blocks (--pipeline)')
+@click.option('--gas-cache', default=None, type=click.Path(),
+              help='Load and save learned gas limits in this file')
+@click.option('--keyfile', multiple=True, type=click.Path(exists=True),
+              help='Sign txs locally with this keystore (implies --pipeline, '
+                   'repeat to shard across owners)')
+@click.option('--watch', is_flag=True,
+              help='Verify txs as they are mined, until all are confirmed')
+@click.option('--finality-depth', default=12, type=int,
+              help='Confirmations for a payout to count as final')
+@click.option('--batch', is_flag=True,
+              help='Mint many recipients per tx via mintBatch')
+@click.option('--batch-gas', default=3_000_000, type=int,
+              help='Target gas usage of a single --batch transaction')
+@click.option('--mirror-db', default=None, type=click.Path(exists=True),
+              help='Check mint limits against this mirror database (see mirror.py)')
 @click.argument('db-file', type=click.Path(exists=True))
 def cli_payout(
     chain_provider,
@@ -183,60 +770,347 @@ def cli_payout(
     owner,
     contract_address,
     abi_path,
+    pipeline,
+    window,
+    gas,
+    gas_price,
+    confirm_within,
+    max_gas_price,
+    stuck_blocks,
+    gas_cache,
+    keyfile,
+    watch,
+    finality_depth,
+    batch,
+    batch_gas,
+    mirror_db,
     db_file):
-    """Payout pending tx's in the specified database."""
+    """Payout pending tx's in the specified database.
+
+    With several --owner (or --keyfile) accounts, pending rows are sharded
+    across them, and each owner mints its share on its own nonce sequence.
+    """
 
     w3 = get_chain(chain_provider, chain_name)
-    if not owner:
-        owner = default_wallet_account(w3)
-    if chain_name not in ['tester', 'testrpc']:
-        unlock_wallet(w3, owner)
+    signers = {}
+    if keyfile:
+        if batch:
+            raise click.UsageError('--keyfile does not support --batch')
+        chain_id = None
+        if chain_name not in ['tester', 'testrpc']:
+            chain_id = int(w3.version.network)
+        for x in keyfile:
+            signer = LocalSigner(x, chain_id=chain_id)
+            signers[signer.address] = signer
+        owners = list(signers)
+        pipeline = True
+    else:
+        owners = list(owner) or [default_wallet_account(w3)]
+        if chain_name not in ['tester', 'testrpc']:
+            for x in owners:
+                unlock_wallet(w3, x)
+    if len(set(x.lower() for x in owners)) != len(owners):
+        raise click.UsageError('Owner accounts must be unique')
 
     instance = get_token_mintage_instance(w3, abi_path, contract_address)
     assert instance.address.lower() == contract_address.lower()
 
+    with TxStore(db_file) as store:
+        # settle broadcasts left unrecorded by an interrupted payout,
+        # rows of still pending ones are held back
+        if recover_intents(
+                w3, store, lambda ids: expected_mint_input(instance, store, ids)):
+            print('Run payout again once the pending nonces are mined.')
+
+        # reject over-limit payouts before spending any gas
+        q = """
+        SELECT bucket, amount
+         FROM txs
+         WHERE txid IS NULL AND success = 0
+           AND id NOT IN (SELECT tx_id FROM intents);
+        """
+        totals = bucket_totals(
+            (bucket, int(amount)) for bucket, amount in store.iter_rows(q))
+        if mirror_db:
+            with MirrorStore(mirror_db) as mirror:
+                head = sync_mirror(Mirror(w3, mirror, instance))
+                check_mint_limits(instance, totals, mirror, head)
+        else:
+            check_mint_limits(instance, totals)
+
+    # every owner takes the rows of its own shard
     q = """
     SELECT id, recipient, amount, bucket
      FROM txs
-     WHERE txid IS NULL AND success = 0;
+     WHERE txid IS NULL AND success = 0
+       AND id NOT IN (SELECT tx_id FROM intents)
+       AND id % :shards = :shard
+     ORDER BY bucket, id;
     """
-    for payout in query_all(db_file, q):
-        id_, recipient, amount, bucket = payout
-        txid = mint_tokens(
-            instance, owner, recipient, amount, bucket,
+
+    if batch:
+        def batch_worker(owner, shard, stopped):
+            nonces = NonceManager(w3, owner)
+            head = w3.eth.blockNumber
+            params = {'shards': len(owners), 'shard': shard}
+            with TxStore(db_file) as store:
+                payouts = wei_payouts(store.iter_rows(q, params))
+                for rows in pack_batches(until_stopped(payouts, stopped), batch_gas):
+                    ids, recipients, amounts, buckets_ = zip(*rows)
+                    nonce = nonces.next()
+                    store.log_intent(ids, owner, nonce, submitted_block=head)
+                    try:
+                        txid = mint_tokens_batch(
+                            instance, owner, list(recipients), list(amounts), buckets_[0],
+                            nonce=nonce,
+                        )
+                    except ValueError:
+                        store.drop_intents(owner, nonce)
+                        raise
+                    store.update_batch_txid(ids, txid, nonce=nonce, owner=owner)
+                    metrics.broadcasts.inc()
+                    print(f'Minted {from_wei(sum(amounts), "ether")} tokens '
+                          f'to {len(rows)} recipients')
+        run_workers(owners, batch_worker)
+        return
+
+    # unless --gas is fixed, gas limits come from the gas cache
+    cache = GasCache()
+    if gas_cache:
+        cache.load(gas_cache)
+    limits, sent_limits = {}, {}
+    def tx_kwargs(payout):
+        return {'gas': gas or limits[payout[0]][1]}
+
+    def on_mined(payout, receipt):
+        if payout[0] in limits:
+            key, gas_limit = limits.pop(payout[0])
+            cache.observe(key, receipt['gasUsed'], gas_limit)
+
+    # without --pipeline, the watcher sees the receipts (if --watch)
+    def on_sent(id_, txid):
+        if id_ in limits:
+            limit = limits.pop(id_)
+            if watch:
+                sent_limits[txid.lower()] = limit
+
+    def on_receipt(txid, receipt):
+        if txid in sent_limits:
+            key, gas_limit = sent_limits.pop(txid)
+            cache.observe(key, receipt['gasUsed'], gas_limit)
+
+    def payout_worker(owner, shard, stopped):
+        fees = FeeEngine(
+            w3,
+            confirm_within=confirm_within,
+            gas_price=gwei_to_wei(gas_price) if gas_price else None,
+            max_gas_price=gwei_to_wei(max_gas_price) if max_gas_price else None,
         )
-        update_txid(db_file, id_, txid)
-        print(f'Minted {amount} tokens to {recipient}')
+        params = {'shards': len(owners), 'shard': shard}
+        with TxStore(db_file) as store:
+            payouts = until_stopped(wei_payouts(store.iter_rows(q, params)), stopped)
+            if not gas:
+                payouts = mint_gas_limits(
+                    instance, owner, store, cache, payouts, limits)
+
+            if pipeline:
+                if owner in signers:
+                    def build(payout):
+                        _, recipient, amount, bucket = payout
+                        return build_mint_transaction(
+                            instance, owner, recipient, amount, bucket,
+                            **tx_kwargs(payout),
+                        )
+                    sender = LocalSender(w3, signers[owner], build)
+                else:
+                    def send(payout, nonce, gas_price):
+                        _, recipient, amount, bucket = payout
+                        return mint_tokens(
+                            instance, owner, recipient, amount, bucket,
+                            nonce=nonce, gas_price=gas_price, **tx_kwargs(payout),
+                        )
+                    sender = NodeSender(send)
+                PayoutPipeline(
+                    w3, owner, store, sender,
+                    window=window,
+                    on_mined=on_mined,
+                    fees=fees,
+                    stuck_blocks=stuck_blocks,
+                ).run(payouts)
+                return
+
+            nonces = NonceManager(w3, owner)
+            head = w3.eth.blockNumber
+            for payout in payouts:
+                id_, recipient, amount, bucket = payout
+                price = fees.gas_price()
+                nonce = nonces.next()
+                store.log_intent(
+                    [id_], owner, nonce, gas_price=price, submitted_block=head)
+                try:
+                    txid = mint_tokens(
+                        instance, owner, recipient, amount, bucket,
+                        nonce=nonce, gas_price=price, **tx_kwargs(payout),
+                    )
+                except ValueError:
+                    store.drop_intents(owner, nonce)
+                    raise
+                store.update_txid(
+                    id_, txid, nonce=nonce, gas_price=price, owner=owner)
+                on_sent(id_, txid)
+                metrics.broadcasts.inc()
+                print(f'Minted {from_wei(amount, "ether")} tokens to {recipient}')
+
+    # verify mined txs on the side, in the asyncio runtime
+    payout_done = threading.Event()
+    async def watch_payouts():
+        with TxStore(db_file) as watch_store:
+            rpc = aio.connect(w3)
+            try:
+                await watch_txs(
+                    rpc, watch_store, done=payout_done.is_set,
+                    finality_depth=finality_depth, on_receipt=on_receipt)
+            finally:
+                await rpc.close()
+    watcher = aio.BackgroundTask(watch_payouts).start() if watch else None
+
+    try:
+        run_workers(owners, payout_worker)
+        if watcher:
+            payout_done.set()
+            watcher.join()
+    except BaseException:
+        if watcher:
+            watcher.cancel()
+        raise
+    finally:
+        # once the watcher is done learning from receipts
+        if gas_cache:
+            cache.save(gas_cache)
 
 
 @cli.command(name='verify')
 @click.option('--provider', 'chain_provider', default='parity', type=str,
-              help='Chain Provider (parity, geth, tester...)')
+              help='Chain Provider (parity, geth, tester...), or a comma separated pool')
 @click.option('--chain', 'chain_name', default='mainnet', type=str,
               help='Name of ETH Chain (mainnet, kovan, rinkeby...)')
+@click.option('--commit-every', default=500, type=int,
+              help='Number of verified rows per database commit')
+@click.option('--batch-size', default=100, type=int,
+              help='Number of receipts per JSON-RPC batch request')
+@click.option('--workers', default=8, type=int,
+              help='Number of concurrent batch requests')
+@click.option('--from-logs', is_flag=True,
+              help='Verify from TokensMinted events instead of receipts')
+@click.option('--contract-address', default=None, type=str,
+              help='Address of ViewTokenMintage contract (--from-logs)')
+@click.option('--abi-path', default='build/view_token_mintage.abi.json',
+              type=click.Path(),
+              help='ABI of the token minting contract (--from-logs)')
+@click.option('--from-block', default=None, type=int,
+              help='First block to scan (--from-logs), '
+                   'instead of resuming from the last checkpoint')
+@click.option('--confirmations', default=12, type=int,
+              help='Leave the most recent blocks unscanned (--from-logs, --mirror-db)')
+@click.option('--mirror-db', default=None, type=click.Path(exists=True),
+              help='Verify from the TokensMinted events of this mirror database')
+@click.option('--finality-depth', default=12, type=int,
+              help='Confirmations for a payout to count as final')
 @click.argument('db-file', type=click.Path(exists=True))
-def cli_verify(chain_provider, chain_name, db_file):
+def cli_verify(
+    chain_provider,
+    chain_name,
+    commit_every,
+    batch_size,
+    workers,
+    from_logs,
+    contract_address,
+    abi_path,
+    from_block,
+    confirmations,
+    mirror_db,
+    finality_depth,
+    db_file):
     """Verify paid tx's in the specified database."""
+    if mirror_db:
+        if not contract_address:
+            raise click.UsageError('--mirror-db requires --contract-address')
+        with TxStore(db_file, commit_every=commit_every) as store, \
+                MirrorStore(mirror_db) as mirror:
+            verify_from_mirror(contract_address, store, mirror, confirmations)
+        return
+
     w3 = get_chain(chain_provider, chain_name)
 
-    q = """
-    SELECT id, txid
-     FROM txs
-     WHERE success = 0 AND txid IS NOT NULL;
-    """
-    for id_, txid in query_all(db_file, q):
+    if from_logs:
+        if not contract_address:
+            raise click.UsageError('--from-logs requires --contract-address')
+        instance = get_token_mintage_instance(w3, abi_path, contract_address)
+        with TxStore(db_file, commit_every=commit_every) as store:
+            verify_from_logs(
+                w3, instance, store,
+                from_block=from_block,
+                to_block=w3.eth.blockNumber - confirmations,
+            )
+        return
+
+    async def main():
+        rpc = aio.connect(w3, workers)
         try:
-            success = is_tx_successful(w3, txid)
-        except:
-            print(f'Unable to verify {txid}. Try again later.')
-            continue
-        if success:
-            mark_tx_as_successful(db_file, id_)
-            print(f'{txid} is OK.')
-        else:
-            reason = 'Out of Gas' if is_tx_out_of_gas(w3, txid) else 'Fail'
+            failures = await verify_txs(rpc, store, batch_size, workers)
+            tracker = ConfirmationTracker(store, finality_depth)
+            await tracker.advance(rpc, await aio.block_number(rpc))
+            return failures
+        finally:
+            await rpc.close()
+
+    with TxStore(db_file, commit_every=commit_every) as store:
+        failures = aio.run(main)
+        unfinal = count_unfinal(store)
+        if unfinal:
+            print(f'{unfinal} payouts are mined, but not final yet '
+                  f'({finality_depth} confirmations). Run verify again later.')
+        for id_, txid, reason in failures:
             if click.confirm(f'{txid} has failed ({reason}). Retry?'):
-                mark_tx_for_retry(db_file, id_)
+                store.mark_tx_for_retry(id_)
+                metrics.retries.inc(reason='failed')
+
+@cli.command(name='watch')
+@click.option('--provider', 'chain_provider', default='parity', type=str,
+              help='Chain Provider (parity, geth, tester...), or a comma separated pool')
+@click.option('--chain', 'chain_name', default='mainnet', type=str,
+              help='Name of ETH Chain (mainnet, kovan, rinkeby...)')
+@click.option('--batch-size', default=100, type=int,
+              help='Number of receipts per JSON-RPC batch request')
+@click.option('--workers', default=8, type=int,
+              help='Number of concurrent batch requests')
+@click.option('--poll-interval', default=5.0, type=float,
+              help='Seconds between checks for a new block')
+@click.option('--finality-depth', default=12, type=int,
+              help='Confirmations for a payout to count as final')
+@click.argument('db-file', type=click.Path(exists=True))
+def cli_watch(
+    chain_provider,
+    chain_name,
+    batch_size,
+    workers,
+    poll_interval,
+    finality_depth,
+    db_file):
+    """Verify paid tx's on every new block, until all are confirmed."""
+    w3 = get_chain(chain_provider, chain_name)
+
+    async def main():
+        rpc = aio.connect(w3, workers)
+        try:
+            await watch_txs(
+                rpc, store, batch_size, poll_interval,
+                finality_depth=finality_depth)
+        finally:
+            await rpc.close()
+
+    with TxStore(db_file) as store:
+        aio.run(main)
 
 @cli.command(name='export-txs')
 @click.option('--chain', 'chain_name', default='mainnet', type=str,
@@ -248,12 +1122,16 @@ def cli_export_txs(chain_name, db_file):
     SELECT name, recipient, amount, bucket, txid, success FROM txs;
     """
     click.echo('Name,Address,Amount,Category,Tx,Success')
-    for name, recipient, amount, bucket, txid, success in query_all(db_file, q):
-        subdomain = '' if chain_name == 'mainnet' else f'{chain_name}.'
-        buckets_reverse = {v:k for k, v in buckets.items()}
-        click.echo(
-            f'{name},{recipient},{amount},{buckets_reverse[bucket]},'
-            f'https://{subdomain}etherscan.io/tx/{txid},{success}')
+    subdomain = '' if chain_name == 'mainnet' else f'{chain_name}.'
+    buckets_reverse = {v:k for k, v in buckets.items()}
+    with TxStore(db_file) as store:
+        for chunk in store.iter_chunks(q):
+            click.echo('\n'.join(
+                f'{name},{recipient},{from_wei(int(amount), "ether")},'
+                f'{buckets_reverse[bucket]},'
+                f'https://{subdomain}etherscan.io/tx/{txid},{success}'
+                for name, recipient, amount, bucket, txid, success in chunk
+            ))
 
 if __name__ == '__main__':
     cli()
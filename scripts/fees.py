@@ -0,0 +1,108 @@
+import math
+import time
+from collections import deque
+from decimal import Decimal
+
+import web3
+
+from rpc import RPCError, batch_request, to_int
+
+
+def gwei_to_wei(amount) -> int:
+    """ Convert a gas price in gwei ('1.5') into integer wei."""
+    return int(Decimal(str(amount)).scaleb(9))
+
+def percentile(values, p: float):
+    """ Nearest-rank percentile of a non-empty list, for 0 <= p <= 1."""
+    values = sorted(values)
+    rank = max(1, math.ceil(p * len(values)))
+    return values[rank - 1]
+
+
+class FeeEngine:
+    def __init__(self,
+                 w3: web3.Web3,
+                 confirm_within=3,
+                 confidence=0.9,
+                 sample_blocks=20,
+                 max_gas_price=None,
+                 gas_price=None,
+                 bump=1.125,
+                 refresh_interval=5.0):
+        """ Pick gas prices from the prices recently accepted by miners.
+
+        Every sampled block contributes the lowest gas price it included.
+        A price at the p-th percentile of those would have made it into a
+        fraction p of recent blocks, so it is included within N blocks
+        with a probability of 1 - (1 - p)^N. The percentile is chosen to
+        reach `confidence` within `confirm_within` blocks.
+
+        Args:
+            w3: Web3 instance.
+            confirm_within: Target confirmation time, in blocks.
+            confidence: Probability of meeting the target.
+            sample_blocks: Number of recent blocks to sample.
+            max_gas_price: Upper bound for any price, in wei.
+            gas_price: A fixed price in wei, instead of sampling blocks.
+            bump: Minimum price increase of a replacement transaction.
+                Nodes reject replacements below +10% (geth)
+                or +12.5% (parity).
+            refresh_interval: Minimum seconds between sampling new blocks.
+        """
+        self.w3 = w3
+        self.percentile = 1 - (1 - confidence) ** (1 / confirm_within)
+        self.max_gas_price = max_gas_price
+        self.fixed_gas_price = gas_price
+        self.bump_factor = bump
+        self.refresh_interval = refresh_interval
+
+        self.samples = deque(maxlen=sample_blocks)
+        self.last_block = None
+        self.last_refresh = 0
+
+    def refresh(self):
+        """ Sample the blocks mined since the last refresh."""
+        if time.time() - self.last_refresh < self.refresh_interval:
+            return
+        self.last_refresh = time.time()
+
+        head = self.w3.eth.blockNumber
+        first = head - self.samples.maxlen + 1
+        if self.last_block is not None:
+            first = max(first, self.last_block + 1)
+        numbers = range(max(first, 0), head + 1)
+
+        blocks = batch_request(
+            self.w3, 'eth_getBlockByNumber', ([hex(x), True] for x in numbers))
+        for block in blocks:
+            if isinstance(block, RPCError) or not block:
+                continue
+            prices = [to_int(x['gasPrice']) for x in block['transactions']]
+            if prices:
+                self.samples.append(min(prices))
+        self.last_block = head
+
+    def gas_price(self) -> int:
+        """ The gas price for a new transaction, in wei."""
+        if self.fixed_gas_price:
+            return self.fixed_gas_price
+        self.refresh()
+        if self.samples:
+            price = percentile(self.samples, self.percentile)
+        else:
+            price = self.w3.eth.gasPrice
+        if self.max_gas_price:
+            price = min(price, self.max_gas_price)
+        return price
+
+    def bump(self, gas_price: int) -> int:
+        """ The gas price for replacing a transaction priced at `gas_price`.
+
+        Returns:
+            The new price, or None if it would exceed `max_gas_price`.
+        """
+        price = max(self.gas_price(), math.ceil(gas_price * self.bump_factor))
+        if self.max_gas_price and price > self.max_gas_price:
+            return None
+        return price
+
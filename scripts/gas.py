@@ -0,0 +1,106 @@
+import json
+import math
+import os
+import threading
+from collections import namedtuple
+from typing import Callable
+
+from utils import load_json
+
+# A gas profile is kept per (contract address, function, bucket, first mint).
+# Minting to a recipient without a balance costs an extra 15k gas
+# for the zero to non-zero balance SSTORE.
+GasKey = namedtuple('GasKey', ['address', 'function', 'bucket', 'first_mint'])
+
+
+def key_to_str(key: GasKey) -> str:
+    first_mint = 'first' if key.first_mint else 'repeat'
+    return f'{key.address.lower()}:{key.function}:{key.bucket}:{first_mint}'
+
+def key_from_str(key: str) -> GasKey:
+    address, function, bucket, first_mint = key.split(':')
+    return GasKey(address, function, int(bucket), first_mint == 'first')
+
+
+class GasCache:
+    def __init__(self, samples=3, margin=1.2, drift=0.1, smoothing=0.2):
+        """ Gas limits for repeated contract calls, learned from a few
+        `estimateGas` calls instead of estimating every single one.
+
+        A profile is calibrated from the highest of its first `samples`
+        estimates. Once calibrated, it is kept up to date from the `gasUsed`
+        of receipts. Receipts report gas after refunds, so the estimate to
+        `gasUsed` ratio of the first receipt is used to convert observed
+        usage back into a gas limit.
+
+        A profile is evicted, and calibrated again, when a receipt drifts
+        more than `drift` from its expected usage, or runs out of gas.
+
+        Args:
+            samples: Number of estimates to calibrate a profile from.
+            margin: Headroom added on top of the expected gas.
+            drift: Relative change in `gasUsed` that invalidates a profile.
+            smoothing: Weight of the latest receipt in the moving average.
+        """
+        self.samples = samples
+        self.margin = margin
+        self.drift = drift
+        self.smoothing = smoothing
+        self.profiles = {}
+        self.lock = threading.Lock()
+
+    def gas_limit(self, key: GasKey, estimate: Callable[[], int]) -> int:
+        """ Return the gas limit of a call, or calibrate its profile by
+        calling `estimate()` if it doesn't have enough samples yet.
+        """
+        with self.lock:
+            profile = self.profiles.get(key)
+            if profile and profile['samples'] >= self.samples:
+                return self._limit(profile)
+
+        gas = estimate()
+        with self.lock:
+            profile = self.profiles.setdefault(
+                key, {'estimate': 0, 'samples': 0, 'gas_used': None, 'ratio': None})
+            profile['estimate'] = max(profile['estimate'], gas)
+            profile['samples'] += 1
+        return math.ceil(gas * self.margin)
+
+    def _limit(self, profile: dict) -> int:
+        if profile['gas_used'] is None:
+            return math.ceil(profile['estimate'] * self.margin)
+        return math.ceil(profile['gas_used'] * profile['ratio'] * self.margin)
+
+    def observe(self, key: GasKey, gas_used: int, gas_limit: int = None):
+        """ Refresh a profile from the receipt of a mined call."""
+        with self.lock:
+            profile = self.profiles.get(key)
+            if not profile or profile['samples'] < self.samples:
+                return
+            if gas_limit and gas_used >= gas_limit:
+                # out of gas, the profile is too low
+                del self.profiles[key]
+                return
+            if profile['gas_used'] is None:
+                profile['gas_used'] = gas_used
+                profile['ratio'] = profile['estimate'] / gas_used
+                return
+
+            expected = profile['gas_used']
+            if abs(gas_used - expected) > self.drift * expected:
+                del self.profiles[key]
+                return
+            profile['gas_used'] = expected + self.smoothing * (gas_used - expected)
+
+    def load(self, filename: str):
+        """ Load profiles saved by `save`, if the file exists."""
+        if os.path.exists(filename):
+            for key, profile in load_json(filename).items():
+                self.profiles[key_from_str(key)] = profile
+
+    def save(self, filename: str):
+        with self.lock:
+            profiles = {key_to_str(k): v for k, v in self.profiles.items()}
+        with open(f'{filename}.tmp', 'w') as f:
+            json.dump(profiles, f, indent=2, sort_keys=True)
+        os.replace(f'{filename}.tmp', filename)
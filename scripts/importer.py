@@ -0,0 +1,221 @@
+import csv
+import json
+import os
+import re
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from functools import partial
+from typing import Callable, Iterator, Tuple
+
+from toolz import keymap, partition_all
+from web3.utils.validation import validate_address
+
+from db import TxStore
+from utils import ether_to_wei
+
+roles = 'Team Supporters Creators Bounties SeedSale MainSale'.split(' ')
+buckets = dict(zip(roles, range(len(roles))))
+
+
+def iter_csv(filename: str) -> Iterator[Tuple[int, dict]]:
+    """ Stream (line number, row) pairs from a .csv payout sheet."""
+    with open(filename, 'rt') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, dict(row)
+
+def iter_json(filename: str, buffer_size=1 << 16) -> Iterator[Tuple[int, dict]]:
+    """ Stream (item number, row) pairs from a .json payout sheet,
+    which holds a single array of objects.
+
+    The array is decoded incrementally, one object at a time,
+    so the file never has to fit in memory.
+    """
+    decoder = json.JSONDecoder(parse_float=Decimal)
+    separator = re.compile(r'[\s,]*')
+    with open(filename, 'rt') as f:
+        buffer = f.read(buffer_size).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f'{filename} does not hold a JSON array')
+
+        pos, item_no, eof = 1, 0, False
+        while True:
+            pos = separator.match(buffer, pos).end()
+            if buffer.startswith(']', pos):
+                return
+            try:
+                item, pos = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                if eof:
+                    raise
+                chunk = f.read(buffer_size)
+                eof = not chunk
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+            item_no += 1
+            yield item_no, item
+
+def iter_payout_sheet(filename: str) -> Iterator[Tuple[int, dict]]:
+    """ Stream the rows of a payout sheet that adheres to Google Sheet
+    csv or the standardized json input.
+    """
+    extension = filename.split('.')[-1]
+    if extension == 'json':
+        return iter_json(filename)
+    elif extension == 'csv':
+        return iter_csv(filename)
+    else:
+        raise ValueError(f'Unsupported file type "{extension}"')
+
+
+def rename_field(field_name):
+    # these are the standard fields
+    if field_name.lower() in ['name', 'amount', 'recipient', 'bucket']:
+        return field_name.lower()
+
+    # these are here for compatibility with Speadsheet headers
+    rename = {
+        'Tokens': 'amount',
+        'Address': 'recipient',
+        'Bucket': 'bucket',
+        'Category': 'bucket',
+    }
+    return rename.get(field_name, '')
+
+def validated_payout(payout_in: dict) -> dict:
+    """
+    This method validates a single json transaction.
+    It ensures `recipient` is a valid ETH address,
+    expands the `bucket` alias into a proper bucket_id,
+    and converts `amount` into integer wei.
+    """
+    x = keymap(rename_field, payout_in)
+    payout = {
+        **x,
+        'bucket': buckets[x['bucket']],
+        'amount': ether_to_wei(x['amount']),
+    }
+    validate_address(payout['recipient'])
+    return payout
+
+
+def validate_chunk(validate: Callable[[dict], dict], chunk):
+    """ Validate a chunk of (line number, row) pairs in a worker process.
+
+    Returns:
+        (payouts, rejects) where payouts are (line number, payout)
+        and rejects are (line number, row, error).
+    """
+    payouts, rejects = [], []
+    for line_no, row in chunk:
+        try:
+            payouts.append((line_no, validate(row)))
+        except Exception as e:
+            rejects.append((line_no, row, repr(e)))
+    return payouts, rejects
+
+def bounded_map(pool, fn, iterable, ahead: int):
+    """ Like `pool.map`, but without submitting more than `ahead` tasks
+    in advance of the results being consumed.
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= ahead:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class SheetImporter:
+    def __init__(self,
+                 store: TxStore,
+                 validate: Callable[[dict], dict],
+                 reject_file: str,
+                 chunk_size=5000,
+                 workers=None,
+                 progress_interval=5.0):
+        """ Import a payout sheet in chunks, validating rows in parallel.
+
+        Rows that fail validation, or would duplicate an existing payout,
+        are written to `reject_file` instead of aborting the import.
+
+        Args:
+            store: Payouts database to import into.
+            validate: Turns a raw sheet row into a payout, or raises.
+                Must be a module level function of an importable module
+                (not `__main__`), so workers can unpickle it with any
+                start method.
+            reject_file: Path of the .csv file rejected rows are written to.
+            chunk_size: Rows per validation task and database transaction.
+            workers: Number of validation processes (defaults to CPU count).
+            progress_interval: Seconds between progress reports.
+        """
+        self.store = store
+        self.validate = validate
+        self.reject_file = reject_file
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.progress_interval = progress_interval
+
+        self.imported = 0
+        self.rejected = 0
+        self.totals = {}
+
+    def run(self, rows: Iterator[Tuple[int, dict]]):
+        """ Import (line number, row) pairs, see `iter_payout_sheet`."""
+        started = last_report = time.time()
+        with open(self.reject_file, 'w', newline='') as f, \
+                ProcessPoolExecutor(self.workers) as pool:
+            rejects_writer = csv.writer(f)
+            rejects_writer.writerow(['Line', 'Error', 'Row'])
+
+            chunks = partition_all(self.chunk_size, rows)
+            validate = partial(validate_chunk, self.validate)
+            ahead = 2 * (self.workers or os.cpu_count())
+            for payouts, rejects in bounded_map(pool, validate, chunks, ahead):
+                rejects += self.write(payouts)
+                for line_no, row, error in rejects:
+                    rejects_writer.writerow(
+                        [line_no, error, json.dumps(row, default=str)])
+                self.rejected += len(rejects)
+
+                if time.time() - last_report >= self.progress_interval:
+                    last_report = time.time()
+                    self.report(started)
+        self.report(started)
+
+    def write(self, payouts) -> list:
+        """ Insert a chunk of payouts in a single transaction.
+
+        Returns:
+            Rejects for payouts that violate a database constraint.
+        """
+        try:
+            self.store.import_txs(x for _, x in payouts)
+            accepted, rejects = payouts, []
+        except sqlite3.IntegrityError:
+            # find the offending rows one by one
+            self.store.conn.rollback()
+            accepted, rejects = [], []
+            for line_no, payout in payouts:
+                try:
+                    self.store.import_txs([payout])
+                    accepted.append((line_no, payout))
+                except sqlite3.IntegrityError as e:
+                    self.store.conn.rollback()
+                    rejects.append((line_no, payout, repr(e)))
+
+        for _, payout in accepted:
+            bucket = payout['bucket']
+            self.totals[bucket] = self.totals.get(bucket, 0) + payout['amount']
+        self.imported += len(accepted)
+        return rejects
+
+    def report(self, started):
+        elapsed = max(time.time() - started, 1e-9)
+        print(f'Imported {self.imported} rows, rejected {self.rejected} '
+              f'({self.imported / elapsed:.0f} rows/sec)')
@@ -0,0 +1,82 @@
+from typing import Iterator, List, Tuple, Union
+
+import web3
+from eth_utils import encode_hex, event_abi_to_log_topic
+from web3.utils.events import get_event_data
+
+# Errors nodes return when a single eth_getLogs query matches too many logs
+# (Infura, parity and geth all word it differently). They have to be specific:
+# rate limits ("too many requests", "request rate exceeded", Infura's -32005)
+# must raise rather than shrink the range.
+RESULT_LIMIT_ERRORS = [
+    'query returned more than',
+    'response size exceeded',
+    'exceed maximum block range',
+    'block range is too',
+]
+
+
+def is_result_limit_error(error: Exception) -> bool:
+    message = str(error).lower()
+    return any(x in message for x in RESULT_LIMIT_ERRORS)
+
+
+def event_abi(instance: web3.eth.Contract, event_name: str) -> dict:
+    return next(
+        x for x in instance.abi
+        if x['type'] == 'event' and x['name'] == event_name
+    )
+
+
+def scan_events(
+    w3: web3.Web3,
+    instance: web3.eth.Contract,
+    event_name: Union[str, List[str]],
+    from_block: int,
+    to_block: int,
+    span=10_000,
+    max_span=100_000) -> Iterator[Tuple[int, list]]:
+    """ Pull all `event_name` logs of a contract between two blocks.
+
+    `event_name` can also be a list of event names, which are pulled
+    together, in a single query per range.
+
+    Block ranges adapt to the node's result limit. A range that hits the
+    limit is split in half and retried, and the span grows again after
+    each successful query.
+
+    Yields:
+        (last_block, events) for every scanned range, in block order.
+        `last_block` is safe to checkpoint once its events are processed.
+    """
+    names = [event_name] if isinstance(event_name, str) else event_name
+    abis = {
+        encode_hex(event_abi_to_log_topic(abi)): abi
+        for abi in (event_abi(instance, x) for x in names)
+    }
+
+    def decode(log):
+        topic = log['topics'][0]
+        if not isinstance(topic, str):
+            topic = encode_hex(topic)
+        return get_event_data(abis[topic], log)
+
+    start = from_block
+    while start <= to_block:
+        end = min(start + span - 1, to_block)
+        try:
+            logs = w3.eth.getLogs({
+                'fromBlock': start,
+                'toBlock': end,
+                'address': instance.address,
+                'topics': [list(abis)],
+            })
+        except ValueError as e:
+            if not is_result_limit_error(e) or start == end:
+                raise
+            span = max(1, span // 2)
+            continue
+
+        yield end, [decode(x) for x in logs]
+        start = end + 1
+        span = min(span * 2, max_span)
@@ -0,0 +1,265 @@
+import asyncio
+import bisect
+import json
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# Upper bounds of histogram buckets, in seconds.
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, registry, name: str, help_: str, labels=()):
+        self.registry = registry
+        self.name = name
+        self.help = help_
+        self.label_names = tuple(labels)
+        self.values = {}
+
+    def key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(x, '')) for x in self.label_names)
+
+    def format_labels(self, key: tuple, extra=()) -> str:
+        pairs = list(zip(self.label_names, key)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        with self.registry.lock:
+            key = self.key(labels)
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name + '_total' + self.format_labels(key), value
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self.registry.lock:
+            self.values[self.key(labels)] = value
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name + self.format_labels(key), value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help_, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, help_, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        with self.registry.lock:
+            key = self.key(labels)
+            if key not in self.values:
+                self.values[key] = [[0] * len(self.buckets), 0, 0.0]
+            counts, _, _ = state = self.values[key]
+            i = bisect.bisect_left(self.buckets, value)
+            if i < len(counts):
+                counts[i] += 1
+            state[1] += 1
+            state[2] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        for key, (counts, count, total) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield self.name + '_bucket' + \
+                    self.format_labels(key, [('le', bound)]), cumulative
+            yield self.name + '_bucket' + \
+                self.format_labels(key, [('le', '+Inf')]), count
+            yield self.name + '_count' + self.format_labels(key), count
+            yield self.name + '_sum' + self.format_labels(key), total
+
+
+class Registry:
+    def __init__(self):
+        """ A set of metrics, exported in the Prometheus text format
+        or as JSON snapshots.
+        """
+        self.metrics = []
+        self.lock = threading.RLock()
+        self.last_snapshot = None
+
+    def add(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_, labels=()) -> Counter:
+        return self.add(Counter(self, name, help_, labels))
+
+    def gauge(self, name, help_, labels=()) -> Gauge:
+        return self.add(Gauge(self, name, help_, labels))
+
+    def histogram(self, name, help_, labels=(), **kwargs) -> Histogram:
+        return self.add(Histogram(self, name, help_, labels, **kwargs))
+
+    def prometheus(self) -> str:
+        lines = []
+        with self.lock:
+            for metric in self.metrics:
+                lines.append(f'# HELP {metric.name} {metric.help}')
+                lines.append(f'# TYPE {metric.name} {metric.kind}')
+                lines.extend(f'{name} {value}' for name, value in metric.samples())
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> dict:
+        """ All current samples, plus the per-minute rate of each counter
+        since the previous snapshot.
+        """
+        now = time.time()
+        with self.lock:
+            samples = {
+                name: value
+                for metric in self.metrics
+                for name, value in metric.samples()
+            }
+            counters = {
+                name: value
+                for metric in self.metrics if metric.kind == 'counter'
+                for name, value in metric.samples()
+            }
+        rates = {}
+        if self.last_snapshot:
+            then, previous = self.last_snapshot
+            minutes = (now - then) / 60
+            rates = {
+                name: (value - previous.get(name, 0)) / minutes
+                for name, value in counters.items()
+            } if minutes else {}
+        self.last_snapshot = now, counters
+        return {'time': now, 'samples': samples, 'per_minute': rates}
+
+
+registry = Registry()
+
+phase_seconds = registry.histogram(
+    'distribute_phase_seconds',
+    'Time spent per phase (estimate_gas, sign, mint, verify...)', ['phase'])
+rpc_seconds = registry.histogram(
+    'distribute_rpc_seconds', 'JSON-RPC request latency', ['method'])
+db_seconds = registry.histogram(
+    'distribute_db_seconds', 'Time spent in payouts database calls', ['call'])
+rpc_errors = registry.counter(
+    'distribute_rpc_errors', 'Failed JSON-RPC requests', ['method'])
+in_flight = registry.gauge(
+    'distribute_in_flight_transactions',
+    'Broadcast, but not yet mined transactions', ['owner'])
+broadcasts = registry.counter(
+    'distribute_broadcasts', 'Transactions broadcast, including replacements')
+confirmations = registry.counter(
+    'distribute_confirmations', 'Payouts verified as successful (final)')
+retries = registry.counter(
+    'distribute_retries', 'Payouts queued for another broadcast', ['reason'])
+nonce_gaps = registry.counter(
+    'distribute_nonce_gaps', 'Nonces rebroadcast to fill a gap')
+reorged = registry.counter(
+    'distribute_reorged', 'Mined payouts moved back to unconfirmed by a reorg')
+
+
+def timed(histogram: Histogram, **labels):
+    """ Decorate a function (or coroutine function) to observe
+    its duration in `histogram`.
+    """
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with histogram.time(**labels):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def rpc_middleware(make_request, web3):
+    """ web3 middleware that times every request, by method."""
+    def middleware(method, params):
+        try:
+            with rpc_seconds.time(method=method):
+                response = make_request(method, params)
+        except Exception:
+            rpc_errors.inc(method=method)
+            raise
+        if 'error' in response:
+            rpc_errors.inc(method=method)
+        return response
+    return middleware
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = registry.prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def serve(port: int, host='127.0.0.1') -> HTTPServer:
+    """ Serve the metrics in the Prometheus text format,
+    from a background thread.
+    """
+    server = HTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class SnapshotWriter:
+    def __init__(self, filename: str, interval=10.0):
+        """ Periodically append JSON snapshots of the metrics to
+        `filename`, one per line, from a background thread.
+        """
+        self.filename = filename
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def write(self):
+        with open(self.filename, 'a') as f:
+            f.write(json.dumps(registry.snapshot()) + '\n')
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.write()
@@ -0,0 +1,493 @@
+import click
+import json
+import sqlite3
+import time
+import web3
+
+from eth_utils import from_wei
+from typing import Dict, Iterator, List, Tuple
+
+from utils import get_chain
+from artifacts import load_abi
+from db import migrate
+from logscan import scan_events
+import metrics
+
+# ViewTokenMintage.categories is a Category[6], one per CategoryId.
+CATEGORY_COUNT = 6
+
+# The DSToken events that move balances. Only the event signatures matter
+# for matching logs, the argument names are the ones used in the mirror.
+TOKEN_EVENTS_ABI = [
+    {
+        'type': 'event', 'name': 'Transfer', 'anonymous': False,
+        'inputs': [
+            {'name': 'src', 'type': 'address', 'indexed': True},
+            {'name': 'dst', 'type': 'address', 'indexed': True},
+            {'name': 'wad', 'type': 'uint256', 'indexed': False},
+        ],
+    },
+    {
+        'type': 'event', 'name': 'Mint', 'anonymous': False,
+        'inputs': [
+            {'name': 'guy', 'type': 'address', 'indexed': True},
+            {'name': 'wad', 'type': 'uint256', 'indexed': False},
+        ],
+    },
+    {
+        'type': 'event', 'name': 'Burn', 'anonymous': False,
+        'inputs': [
+            {'name': 'guy', 'type': 'address', 'indexed': True},
+            {'name': 'wad', 'type': 'uint256', 'indexed': False},
+        ],
+    },
+]
+
+
+def event_deltas(address: str, event: str, args: dict) -> List[Tuple[str, str, object, int]]:
+    """ The changes an event makes to the mirrored state.
+
+    Returns:
+        (table, contract, key, delta) tuples, where `table` is 'balances'
+        (keyed by holder) or 'categories' (keyed by category id).
+    """
+    if event == 'TokensMinted':
+        return [('categories', address, args['category'], args['tokens'])]
+    if event == 'Mint':
+        return [('balances', address, args['guy'].lower(), args['wad'])]
+    if event == 'Burn':
+        return [('balances', address, args['guy'].lower(), -args['wad'])]
+    if event == 'Transfer':
+        return [
+            ('balances', address, args['src'].lower(), -args['wad']),
+            ('balances', address, args['dst'].lower(), args['wad']),
+        ]
+    return []
+
+
+class MirrorStore:
+    def __init__(self, db_path, synchronous='NORMAL'):
+        """ A local SQLite mirror of ViewTokenMintage and VIEW token state:
+        per-category minted totals, per-holder balances, and the events
+        they were built from.
+
+        Each synced range of blocks is committed together with its
+        checkpoint, so the mirror always reflects a whole block.
+        """
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        migrate(self.conn, 'mirror')
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.execute(f'PRAGMA synchronous = {synchronous}')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+    def get_checkpoint(self, name) -> Tuple[int, str]:
+        """ Return the last synced (block, block_hash), or None."""
+        q = """
+        SELECT block, block_hash FROM checkpoints WHERE name = :name
+        """
+        return self.conn.execute(q, {'name': name}).fetchone()
+
+    def set_checkpoint(self, name, block, block_hash):
+        """ Record the last synced block, and commit along with it
+        all the events applied since the previous checkpoint.
+        """
+        q = """
+        INSERT OR REPLACE INTO checkpoints (name, block, block_hash)
+        VALUES (:name, :block, :block_hash)
+        """
+        self.conn.execute(q, {'name': name, 'block': block, 'block_hash': block_hash})
+        self.commit()
+
+    def _add(self, table, contract, key, delta):
+        if table == 'balances':
+            q = """
+            SELECT balance FROM balances WHERE token = :contract AND holder = :key
+            """
+            row = self.conn.execute(q, {'contract': contract, 'key': key}).fetchone()
+            q = """
+            INSERT OR REPLACE INTO balances (token, holder, balance)
+            VALUES (:contract, :key, :balance)
+            """
+            balance = int(row[0]) + delta if row else delta
+            self.conn.execute(
+                q, {'contract': contract, 'key': key, 'balance': str(balance)})
+        else:
+            # totals are seeded from the contract (see `Mirror.seed_categories`),
+            # events before that are already part of the seed
+            q = """
+            SELECT minted FROM categories WHERE mintage = :contract AND category = :key
+            """
+            row = self.conn.execute(q, {'contract': contract, 'key': key}).fetchone()
+            if not row:
+                return
+            q = """
+            UPDATE categories SET minted = :minted
+             WHERE mintage = :contract AND category = :key
+            """
+            self.conn.execute(
+                q, {'contract': contract, 'key': key, 'minted': str(int(row[0]) + delta)})
+
+    @metrics.timed(metrics.db_seconds, call='apply_event')
+    def apply_event(self, event: dict) -> bool:
+        """ Record a decoded event, and apply it to balances and totals.
+
+        Returns:
+            False if the event was already applied.
+        """
+        address = event['address'].lower()
+        args = dict(event['args'])
+        q = """
+        INSERT OR IGNORE INTO events
+            (address, event, block_number, block_hash, tx_hash, log_index, args)
+        VALUES
+            (:address, :event, :block_number, :block_hash, :tx_hash, :log_index, :args)
+        """
+        params = {
+            'address': address,
+            'event': event['event'],
+            'block_number': event['blockNumber'],
+            'block_hash': event['blockHash'],
+            'tx_hash': event['transactionHash'],
+            'log_index': event['logIndex'],
+            'args': json.dumps(args),
+        }
+        if not self.conn.execute(q, params).rowcount:
+            return False
+        for delta in event_deltas(address, event['event'], args):
+            self._add(*delta)
+        return True
+
+    def revert_events(self, after_block: int, addresses: List[str]) -> int:
+        """ Undo and delete all events of `addresses` mined after `after_block`.
+
+        Returns:
+            Number of reverted events.
+        """
+        addresses = [x.lower() for x in addresses]
+        q = f"""
+        SELECT id, address, event, args FROM events
+         WHERE block_number > ?
+           AND address IN ({','.join('?' * len(addresses))})
+         ORDER BY block_number DESC, log_index DESC
+        """
+        rows = self.conn.execute(q, [after_block, *addresses]).fetchall()
+        for id_, address, event, args in rows:
+            for table, contract, key, delta in event_deltas(address, event, json.loads(args)):
+                self._add(table, contract, key, -delta)
+        self.conn.executemany(
+            'DELETE FROM events WHERE id = ?', ((id_,) for id_, *_ in rows))
+        return len(rows)
+
+    def has_categories(self, mintage: str) -> bool:
+        q = """
+        SELECT 1 FROM categories WHERE mintage = :mintage LIMIT 1
+        """
+        return self.conn.execute(q, {'mintage': mintage.lower()}).fetchone() is not None
+
+    def set_category(self, mintage: str, category: int, mint_limit: int, minted: int):
+        q = """
+        INSERT OR REPLACE INTO categories (mintage, category, mint_limit, minted)
+        VALUES (:mintage, :category, :mint_limit, :minted)
+        """
+        self.conn.execute(q, {
+            'mintage': mintage.lower(),
+            'category': category,
+            'mint_limit': str(mint_limit),
+            'minted': str(minted),
+        })
+
+    def categories(self, mintage: str) -> Dict[int, Tuple[int, int]]:
+        """ Return the (mint_limit, minted) wei of every category."""
+        q = """
+        SELECT category, mint_limit, minted FROM categories WHERE mintage = :mintage
+        """
+        rows = self.conn.execute(q, {'mintage': mintage.lower()})
+        return {x: (int(limit), int(minted)) for x, limit, minted in rows}
+
+    def remaining_mint_limits(self, mintage: str) -> Dict[int, int]:
+        """ Local version of `distribute.remaining_mint_limits`."""
+        return {
+            x: limit - minted
+            for x, (limit, minted) in self.categories(mintage).items()
+        }
+
+    def balance_of(self, token: str, holder: str) -> int:
+        q = """
+        SELECT balance FROM balances WHERE token = :token AND holder = :holder
+        """
+        params = {'token': token.lower(), 'holder': holder.lower()}
+        row = self.conn.execute(q, params).fetchone()
+        return int(row[0]) if row else 0
+
+    def iter_events(self, address: str, event: str, to_block: int) -> Iterator[dict]:
+        """ Stream the mirrored events of a contract, up to `to_block`,
+        in the format of decoded web3 events.
+        """
+        q = """
+        SELECT block_number, block_hash, tx_hash, log_index, args FROM events
+         WHERE address = :address AND event = :event AND block_number <= :to_block
+         ORDER BY block_number, log_index
+        """
+        params = {'address': address.lower(), 'event': event, 'to_block': to_block}
+        for block_number, block_hash, tx_hash, log_index, args in \
+                self.conn.execute(q, params):
+            yield {
+                'event': event,
+                'address': address,
+                'blockNumber': block_number,
+                'blockHash': block_hash,
+                'transactionHash': tx_hash,
+                'logIndex': log_index,
+                'args': json.loads(args),
+            }
+
+
+class Mirror:
+    def __init__(
+        self,
+        w3: web3.Web3,
+        store: MirrorStore,
+        mintage: web3.eth.Contract,
+        reorg_depth=12,
+        span=10_000):
+        """ Follow the chain, and apply the mintage's `TokensMinted` events
+        and the VIEW token's `Transfer`, `Mint` and `Burn` events to a
+        `MirrorStore`.
+
+        Reorgs are detected by comparing the hash of the checkpointed block
+        with the chain's. On a mismatch, the last `reorg_depth` blocks are
+        rolled back and synced again. Reorgs deeper than that go unnoticed.
+
+        Args:
+            w3: Web3 instance.
+            store: The mirror database.
+            mintage: ViewTokenMintage instance. The token is its `viewToken`.
+            reorg_depth: Number of blocks to roll back on a reorg.
+            span: Number of blocks per checkpoint.
+        """
+        self.w3 = w3
+        self.store = store
+        self.mintage = mintage
+        self.token = w3.eth.contract(TOKEN_EVENTS_ABI, mintage.call().viewToken())
+        self.reorg_depth = reorg_depth
+        self.span = span
+        self.name = f'mirror:{mintage.address.lower()}'
+
+    def block_hash(self, number: int) -> str:
+        return self.w3.eth.getBlock(number)['hash']
+
+    def fetch(self, from_block: int, to_block: int) -> list:
+        """ Pull the events of both contracts, in the order they were emitted."""
+        events = []
+        for instance, names in [
+                (self.mintage, ['TokensMinted']),
+                (self.token, ['Transfer', 'Mint', 'Burn'])]:
+            for _, x in scan_events(
+                    self.w3, instance, names, from_block, to_block, span=self.span):
+                events.extend(x)
+        return sorted(events, key=lambda x: (x['blockNumber'], x['logIndex']))
+
+    def check_reorg(self) -> bool:
+        """ Roll back the last `reorg_depth` blocks if the checkpointed
+        block is no longer part of the chain.
+
+        Returns:
+            True if the mirror was rolled back.
+        """
+        checkpoint = self.store.get_checkpoint(self.name)
+        if not checkpoint:
+            return False
+        block, block_hash = checkpoint
+        if self.block_hash(block) == block_hash:
+            return False
+        self.rollback(block - self.reorg_depth)
+        return True
+
+    def rollback(self, to_block: int):
+        """ Revert all events after `to_block`, and resume syncing from there."""
+        to_block = max(to_block, 0)
+        reverted = self.store.revert_events(
+            to_block, [self.mintage.address, self.token.address])
+        self.store.set_checkpoint(self.name, to_block, self.block_hash(to_block))
+        print(f'Reorg: rolled back to block {to_block}, reverted {reverted} events')
+
+    def seed_categories(self, block: int):
+        """ Copy the category totals from the contract's storage at `block`.
+
+        Totals set by the constructor (Bounties, SeedSale) have no event,
+        so they can't be rebuilt from logs.
+        """
+        for category in range(CATEGORY_COUNT):
+            result = self.w3.eth.call({
+                'to': self.mintage.address,
+                'data': self.mintage.encodeABI('categories', [category]),
+            }, block)
+            result = result[2:] if result.startswith('0x') else result
+            mint_limit, minted = int(result[:64], 16), int(result[64:128], 16)
+            self.store.set_category(self.mintage.address, category, mint_limit, minted)
+
+    def sync(self, from_block=0, to_block=None) -> int:
+        """ Apply all new events up to `to_block` (the head by default),
+        resuming from the checkpoint. Every synced range has to extend
+        the checkpointed block, or the mirror is rolled back first.
+
+        Returns:
+            The last synced block.
+        """
+        self.check_reorg()
+        checkpoint = self.store.get_checkpoint(self.name)
+        parent_hash = None
+        if checkpoint:
+            from_block, parent_hash = checkpoint[0] + 1, checkpoint[1]
+        if to_block is None:
+            to_block = self.w3.eth.blockNumber
+
+        last_block = from_block - 1
+        start = from_block
+        while start <= to_block:
+            end = min(start + self.span - 1, to_block)
+            end_hash = self.block_hash(end)
+            if parent_hash and \
+                    self.w3.eth.getBlock(start)['parentHash'] != parent_hash:
+                # the checkpointed block was reorganized away since `check_reorg`
+                self.rollback(start - 1 - self.reorg_depth)
+                last_block, parent_hash = self.store.get_checkpoint(self.name)
+                start = last_block + 1
+                continue
+            events = self.fetch(start, end)
+            if self.block_hash(end) != end_hash:
+                # the range was reorganized while its logs were being pulled
+                continue
+            for event in events:
+                self.store.apply_event(event)
+            if end == to_block and not self.store.has_categories(self.mintage.address):
+                # seeded at the head, where any node still has the state
+                self.seed_categories(end)
+            self.store.set_checkpoint(self.name, end, end_hash)
+            print(f'Synced up to block {end} ({len(events)} events)')
+            last_block, start, parent_hash = end, end + 1, end_hash
+        return last_block
+
+    def follow(self, from_block=0, poll_interval=5.0):
+        """ Keep syncing as new blocks come in, until interrupted."""
+        last_block = None
+        while True:
+            head = self.w3.eth.blockNumber
+            if head != last_block:
+                last_block = self.sync(from_block, head)
+            time.sleep(poll_interval)
+
+
+def get_mirror(chain_provider, chain_name, abi_path, contract_address, db_file, **kwargs):
+    w3 = get_chain(chain_provider, chain_name)
+    mintage = w3.eth.contract(load_abi(abi_path), contract_address)
+    return Mirror(w3, MirrorStore(db_file), mintage, **kwargs)
+
+
+# CLI
+# ---
+context_settings = dict(help_option_names=['-h', '--help'])
+@click.group(context_settings=context_settings)
+def cli():
+    pass
+
+@cli.command(name='sync')
+@click.option('--provider', 'chain_provider', default='parity', type=str,
+              help='Chain Provider (parity, geth, tester...), or a comma separated pool')
+@click.option('--chain', 'chain_name', default='mainnet', type=str,
+              help='Name of ETH Chain (mainnet, kovan, rinkeby...)')
+@click.option('--contract-address', prompt=True, type=str,
+              help='Address of ViewTokenMintage contract')
+@click.option('--abi-path', default='build/view_token_mintage.abi.json',
+              type=click.Path(),
+              help='ABI of the token minting contract')
+@click.option('--from-block', default=0, type=int,
+              help='First block to sync (the token deployment), unless resuming')
+@click.option('--reorg-depth', default=12, type=int,
+              help='Number of blocks to roll back on a reorg')
+@click.option('--span', default=10_000, type=int,
+              help='Number of blocks per checkpoint')
+@click.argument('mirror-db', type=click.Path())
+def cli_sync(
+    chain_provider,
+    chain_name,
+    contract_address,
+    abi_path,
+    from_block,
+    reorg_depth,
+    span,
+    mirror_db):
+    """Sync the mirror database up to the latest block."""
+    mirror = get_mirror(
+        chain_provider, chain_name, abi_path, contract_address, mirror_db,
+        reorg_depth=reorg_depth, span=span)
+    with mirror.store:
+        mirror.sync(from_block)
+
+@cli.command(name='follow')
+@click.option('--provider', 'chain_provider', default='parity', type=str,
+              help='Chain Provider (parity, geth, tester...), or a comma separated pool')
+@click.option('--chain', 'chain_name', default='mainnet', type=str,
+              help='Name of ETH Chain (mainnet, kovan, rinkeby...)')
+@click.option('--contract-address', prompt=True, type=str,
+              help='Address of ViewTokenMintage contract')
+@click.option('--abi-path', default='build/view_token_mintage.abi.json',
+              type=click.Path(),
+              help='ABI of the token minting contract')
+@click.option('--from-block', default=0, type=int,
+              help='First block to sync (the token deployment), unless resuming')
+@click.option('--reorg-depth', default=12, type=int,
+              help='Number of blocks to roll back on a reorg')
+@click.option('--poll-interval', default=5.0, type=float,
+              help='Seconds between checks for a new block')
+@click.argument('mirror-db', type=click.Path())
+def cli_follow(
+    chain_provider,
+    chain_name,
+    contract_address,
+    abi_path,
+    from_block,
+    reorg_depth,
+    poll_interval,
+    mirror_db):
+    """Keep the mirror database in sync with new blocks."""
+    mirror = get_mirror(
+        chain_provider, chain_name, abi_path, contract_address, mirror_db,
+        reorg_depth=reorg_depth)
+    with mirror.store:
+        try:
+            mirror.follow(from_block, poll_interval)
+        except KeyboardInterrupt:
+            pass
+
+@cli.command(name='show')
+@click.option('--contract-address', prompt=True, type=str,
+              help='Address of ViewTokenMintage contract')
+@click.argument('mirror-db', type=click.Path(exists=True))
+def cli_show(contract_address, mirror_db):
+    """Print the mirrored category totals."""
+    with MirrorStore(mirror_db) as store:
+        checkpoint = store.get_checkpoint(f'mirror:{contract_address.lower()}')
+        if not checkpoint:
+            raise click.ClickException(f'{contract_address} is not mirrored')
+        print(f'Synced up to block {checkpoint[0]}')
+        for category, (limit, minted) in sorted(store.categories(contract_address).items()):
+            print(f'{category}: {from_wei(minted, "ether")} '
+                  f'of {from_wei(limit, "ether")} minted')
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,356 @@
+import time
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import web3
+from eth_utils import from_wei
+
+import metrics
+from db import TxStore
+
+InFlight = namedtuple('InFlight', [
+    'id_', 'txid', 'payout', 'gas_price', 'submitted_block', 'txids'])
+Prepared = namedtuple('Prepared', ['payout', 'nonce', 'gas_price', 'future'])
+
+# Error messages geth and parity return when the nonce we picked
+# collides with a transaction the node already knows about.
+NONCE_ERRORS = [
+    'nonce too low',
+    'nonce is too low',
+    'known transaction',
+    'already imported',
+    'replacement transaction underpriced',
+]
+
+
+def is_nonce_error(error: Exception) -> bool:
+    """ Check whether a failed broadcast was caused by a nonce collision."""
+    message = str(error).lower()
+    return any(x in message for x in NONCE_ERRORS)
+
+
+class NonceManager:
+    def __init__(self, w3: web3.Web3, owner: str):
+        """ Hand out sequential nonces for `owner` locally,
+        instead of letting the node pick one for every transaction.
+
+        Args:
+            w3: Web3 instance.
+            owner: Account whose nonces are being managed.
+        """
+        self.w3 = w3
+        self.owner = owner
+        self.next_nonce = self.sync()
+
+    def pending(self) -> int:
+        """ The node's pending nonce, without touching the local counter."""
+        return self.w3.eth.getTransactionCount(self.owner, 'pending')
+
+    def sync(self) -> int:
+        """ Reset the local counter from the node's pending nonce."""
+        self.next_nonce = self.pending()
+        return self.next_nonce
+
+    def next(self) -> int:
+        nonce = self.next_nonce
+        self.next_nonce += 1
+        return nonce
+
+    def mined(self) -> int:
+        """ Number of `owner` transactions included in the latest block."""
+        return self.w3.eth.getTransactionCount(self.owner, 'latest')
+
+
+class NodeSender:
+    def __init__(self, send: Callable[[tuple, int, int], str]):
+        """ A `PayoutPipeline` sender that leaves signing to the node.
+
+        Args:
+            send: Broadcasts a payout row at the given nonce and gas price
+                (None for the node's default), returns the txid.
+        """
+        self.send = send
+
+    def prepare(self, payout, nonce: int, gas_price: int = None):
+        return payout, nonce, gas_price
+
+    def intent(self, prepared):
+        # the txid is only known once the node has signed the transaction
+        return None, None
+
+    def broadcast(self, prepared) -> str:
+        return self.send(*prepared)
+
+
+class PayoutPipeline:
+    def __init__(self,
+                 w3: web3.Web3,
+                 owner: str,
+                 store: TxStore,
+                 sender,
+                 window=64,
+                 poll_interval=1.0,
+                 max_attempts=3,
+                 on_mined: Callable[[tuple, dict], None] = None,
+                 fees=None,
+                 stuck_blocks=None):
+        """ Broadcast `mint` transactions with locally assigned nonces,
+        keeping up to `window` of them in flight at once.
+
+        Broadcasting is split in two steps. `sender.prepare(payout, nonce,
+        gas_price)` runs on a background thread, up to `window` transactions ahead, so
+        that signing the next window overlaps broadcasting the current one.
+        `sender.broadcast(prepared)` then returns the txid.
+
+        Every broadcast is preceded by an intent committed to the store,
+        holding the nonce, row id and (when signed locally) the signed
+        transaction, so that `recovery.recover_intents` can reconcile an
+        interrupted run with the chain, however many transactions it
+        had in flight.
+
+        Args:
+            w3: Web3 instance.
+            owner: An authorized Ethereum account to call the minting contract from.
+            store: Payouts database the txid's are written into.
+            sender: A `NodeSender` or `signer.LocalSender`.
+            window: Maximum number of broadcast, but not yet mined transactions.
+            poll_interval: Seconds to sleep when waiting on a new block.
+            max_attempts: Broadcast attempts per row on nonce collisions.
+            on_mined: Called with the payout row and receipt of every
+                mined transaction.
+            fees: A `fees.FeeEngine` to price transactions with,
+                or None for the node's default gas price.
+            stuck_blocks: Replace transactions that are still pending this
+                many blocks after their broadcast, at the same nonce and
+                a bumped gas price (requires `fees`).
+        """
+        self.w3 = w3
+        self.owner = owner
+        self.store = store
+        self.sender = sender
+        self.window = window
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.on_mined = on_mined
+        self.fees = fees
+        self.stuck_blocks = stuck_blocks
+
+        self.nonces = NonceManager(w3, owner)
+        self.head = w3.eth.blockNumber
+        self.in_flight = OrderedDict()
+        self.prepared = deque()
+        self.retries = deque()
+        self.attempts = {}
+        self.payouts = iter([])
+        self.pool = None
+
+    def run(self, payouts):
+        """ Mint all `payouts` rows (id, recipient, amount, bucket)."""
+        self.payouts = iter(payouts)
+        with ThreadPoolExecutor(1) as self.pool:
+            while True:
+                self.prepare_ahead()
+                if self.prepared:
+                    self.wait_for_slot()
+                    if self.prepared:
+                        self.submit(self.prepared.popleft())
+                elif self.in_flight:
+                    if not self.reap():
+                        time.sleep(self.poll_interval)
+                else:
+                    break
+
+    def next_payout(self):
+        if self.retries:
+            return self.retries.popleft()
+        return next(self.payouts, None)
+
+    def prepare_ahead(self):
+        """ Assign nonces to the next window of payouts,
+        and queue them up for preparation.
+        """
+        while len(self.prepared) < self.window:
+            payout = self.next_payout()
+            if payout is None:
+                break
+            nonce = self.nonces.next()
+            gas_price = self.fees.gas_price() if self.fees else None
+            future = self.pool.submit(
+                self.sender.prepare, payout, nonce, gas_price)
+            self.prepared.append(Prepared(payout, nonce, gas_price, future))
+
+    def discard_prepared(self):
+        """ Drop prepared transactions, whose nonces are no longer valid.
+        Their rows go back to the front of the queue, in order.
+        """
+        while self.prepared:
+            payout, _, _, future = self.prepared.pop()
+            future.cancel()
+            self.retries.appendleft(payout)
+
+    def wait_for_slot(self):
+        while len(self.in_flight) >= self.window:
+            if not self.reap():
+                time.sleep(self.poll_interval)
+
+    def submit(self, prepared: Prepared):
+        payout, nonce, gas_price, future = prepared
+        id_, recipient, amount, bucket = payout
+        try:
+            prepared = future.result()
+            self.log_intent(payout, nonce, gas_price, prepared)
+            txid = self.sender.broadcast(prepared)
+        except ValueError as e:
+            # the nonce was never used, the counter has to be rewound
+            self.store.drop_intents(self.owner, nonce)
+            self.recover()
+            self.retries.appendleft(payout)
+            self.attempts[id_] = self.attempts.get(id_, 1) + 1
+            if is_nonce_error(e) and self.attempts[id_] <= self.max_attempts:
+                metrics.retries.inc(reason='nonce')
+                return
+            raise
+
+        self.attempts.pop(id_, None)
+        self.store.update_txid(
+            id_, txid,
+            nonce=nonce, gas_price=gas_price, submitted_block=self.head,
+            owner=self.owner,
+        )
+        self.in_flight[nonce] = InFlight(
+            id_, txid, payout, gas_price, self.head, (txid,))
+        metrics.broadcasts.inc()
+        metrics.in_flight.set(len(self.in_flight), owner=self.owner)
+        print(f'Minted {from_wei(amount, "ether")} tokens '
+              f'to {recipient} (nonce {nonce})')
+
+    def log_intent(self, payout, nonce: int, gas_price: int, prepared):
+        txid, raw_tx = self.sender.intent(prepared)
+        self.store.log_intent(
+            [payout[0]], self.owner, nonce,
+            txid=txid, raw_tx=raw_tx,
+            gas_price=gas_price, submitted_block=self.head,
+        )
+
+    def reap(self) -> int:
+        """ Release the window slots of all mined transactions.
+
+        A mined nonce without a receipt for any of our txid's means that
+        our transaction was replaced by another one with the same nonce,
+        in which case the row is reset and queued for another attempt.
+
+        Returns:
+            Number of released slots.
+        """
+        self.head = self.w3.eth.blockNumber
+        mined = self.nonces.mined()
+        released = 0
+        for nonce in [x for x in self.in_flight if x < mined]:
+            tx = self.in_flight[nonce]
+            txid, receipt = self.find_receipt(tx)
+            if not receipt:
+                if any(self.w3.eth.getTransaction(x) for x in tx.txids):
+                    # receipt not indexed yet, check again on the next poll
+                    continue
+                print(f'{tx.txid} (nonce {nonce}) was replaced, retrying')
+                self.store.mark_tx_for_retry(tx.id_)
+                self.retries.append(tx.payout)
+                metrics.retries.inc(reason='replaced')
+            else:
+                if txid != tx.txid:
+                    # an earlier broadcast was mined before its replacement
+                    self.store.set_mined_txid(tx.id_, txid)
+                if self.on_mined:
+                    self.on_mined(tx.payout, receipt)
+            del self.in_flight[nonce]
+            released += 1
+        metrics.in_flight.set(len(self.in_flight), owner=self.owner)
+
+        if not released and self.in_flight and \
+                self.nonces.pending() <= max(self.in_flight):
+            self.recover()
+        elif self.fees and self.stuck_blocks:
+            self.replace_stuck(mined)
+        return released
+
+    def find_receipt(self, tx: InFlight):
+        """ Return the (txid, receipt) of whichever broadcast of `tx`
+        was mined, latest first, or (None, None).
+        """
+        for txid in reversed(tx.txids):
+            receipt = self.w3.eth.getTransactionReceipt(txid)
+            if receipt:
+                return txid, receipt
+        return None, None
+
+    def replace_stuck(self, mined: int):
+        """ Rebroadcast transactions pending for `stuck_blocks` or more
+        at the same nonce, with a bumped gas price.
+        """
+        for nonce, tx in list(self.in_flight.items()):
+            if nonce < mined or \
+                    self.head - tx.submitted_block < self.stuck_blocks:
+                continue
+            gas_price = self.fees.bump(tx.gas_price or self.w3.eth.gasPrice)
+            if not gas_price:
+                continue
+
+            prepared = self.sender.prepare(tx.payout, nonce, gas_price)
+            self.log_intent(tx.payout, nonce, gas_price, prepared)
+            try:
+                txid = self.sender.broadcast(prepared)
+            except ValueError as e:
+                # mined in the meantime, or the bump was not enough,
+                # in which case the next one starts from the higher price
+                self.store.drop_intents(self.owner, nonce)
+                print(f'Unable to replace {tx.txid} (nonce {nonce}): {e}')
+                self.in_flight[nonce] = tx._replace(
+                    gas_price=gas_price, submitted_block=self.head)
+                continue
+
+            self.store.replace_txid(
+                tx.id_, txid,
+                nonce=nonce, gas_price=gas_price, submitted_block=self.head)
+            metrics.broadcasts.inc()
+            self.in_flight[nonce] = tx._replace(
+                txid=txid,
+                gas_price=gas_price,
+                submitted_block=self.head,
+                txids=tx.txids + (txid,),
+            )
+            print(f'Replaced stuck {tx.txid} with {txid} '
+                  f'at {from_wei(gas_price, "gwei")} gwei (nonce {nonce})')
+
+    def recover(self):
+        """ Fill nonce gaps left by failed or dropped broadcasts.
+
+        The local counter is re-synced from the node. Any in-flight
+        transaction at or above the node's pending nonce is no longer known
+        to the node, and gets rebroadcast at its original nonce so the
+        transactions queued behind it can be mined. Prepared transactions
+        are discarded, and prepared again with fresh nonces.
+        """
+        self.discard_prepared()
+        pending = self.nonces.sync()
+        for nonce in [x for x in self.in_flight if x >= pending]:
+            tx = self.in_flight[nonce]
+            if self.w3.eth.getTransaction(tx.txid):
+                continue
+
+            prepared = self.sender.prepare(tx.payout, nonce, tx.gas_price)
+            self.log_intent(tx.payout, nonce, tx.gas_price, prepared)
+            txid = self.sender.broadcast(prepared)
+            props = dict(
+                nonce=nonce, gas_price=tx.gas_price, submitted_block=self.head)
+            if txid == tx.txid:
+                self.store.update_txid(tx.id_, txid, **props)
+            else:
+                self.store.replace_txid(tx.id_, txid, **props)
+                tx = tx._replace(txid=txid, txids=tx.txids + (txid,))
+            self.in_flight[nonce] = tx._replace(submitted_block=self.head)
+            metrics.broadcasts.inc()
+            metrics.nonce_gaps.inc()
+            print(f'Rebroadcast {txid} (nonce {nonce})')
+
+        self.nonces.next_nonce = max([pending, *[x + 1 for x in self.in_flight]])
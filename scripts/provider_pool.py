@@ -0,0 +1,184 @@
+import threading
+import time
+from collections import deque
+from typing import List
+
+import requests
+from web3.exceptions import CannotHandleRequest
+from web3.providers.base import BaseProvider
+
+# Requests that only make sense on the node holding the owner account,
+# or that depend on state kept by one particular node (filters).
+PRIMARY_ONLY = {
+    'eth_accounts',
+    'eth_coinbase',
+    'eth_sendTransaction',
+    'eth_sign',
+    'eth_newFilter',
+    'eth_newBlockFilter',
+    'eth_newPendingTransactionFilter',
+    'eth_getFilterChanges',
+    'eth_getFilterLogs',
+    'eth_uninstallFilter',
+}
+
+# Requests that go to the primary while it is up, because they depend on
+# its transaction pool, but are safe to send to any node otherwise.
+PRIMARY_FIRST = {
+    'eth_sendRawTransaction',
+    'eth_getTransactionByHash',
+}
+
+# Errors of a node being unavailable, rather than of the request itself.
+FAILOVER_ERRORS = (requests.RequestException, OSError, CannotHandleRequest)
+
+
+class Endpoint:
+    def __init__(self, provider: BaseProvider, name: str, samples=20):
+        """ Rolling health statistics of a single node.
+
+        Args:
+            provider: web3 provider of the node.
+            name: Name used in log messages.
+            samples: Number of recent requests the statistics cover.
+        """
+        self.provider = provider
+        self.name = name
+        self.latencies = deque(maxlen=samples)
+        self.errors = deque(maxlen=samples)
+        self.head = None
+
+    def record(self, latency: float, ok: bool):
+        self.errors.append(0 if ok else 1)
+        if ok:
+            self.latencies.append(latency)
+
+    @property
+    def error_rate(self) -> float:
+        return sum(self.errors) / len(self.errors) if self.errors else 0.0
+
+    @property
+    def latency(self) -> float:
+        return sum(self.latencies) / len(self.latencies) if self.latencies else 0.0
+
+    def score(self, head: int, max_lag: int) -> float:
+        """ Lower is healthier. Mean latency is scaled up by the error rate,
+        and nodes lagging more than `max_lag` blocks behind `head`
+        (the highest block seen on any node) are ranked last.
+        """
+        score = self.latency * (1 + 10 * self.error_rate)
+        if self.error_rate >= 0.5:
+            score += 1_000
+        if head is not None and self.head is not None and \
+                head - self.head > max_lag:
+            score += 10_000
+        return score
+
+
+class PooledProvider(BaseProvider):
+    def __init__(self,
+                 providers: List[BaseProvider],
+                 names: List[str] = None,
+                 primary=0,
+                 max_lag=3,
+                 probe_interval=30.0):
+        """ A web3 provider spread over several nodes of the same chain.
+
+        Reads (receipts, logs, blockNumber...) go to the healthiest node,
+        going by its rolling latency, error rate and block lag. Writes go to
+        the `primary` node. A request that fails because a node is
+        unreachable is retried on the next healthiest node, where that is
+        safe to do.
+
+        Args:
+            providers: web3 providers, one per node.
+            names: Names of the nodes, for log messages.
+            primary: Index of the node transactions are sent through.
+            max_lag: Blocks a node may fall behind before it is avoided.
+            probe_interval: Seconds between checking on all nodes.
+        """
+        names = names or [str(x) for x in providers]
+        self.endpoints = [Endpoint(p, n) for p, n in zip(providers, names)]
+        self.primary = self.endpoints[primary]
+        self.max_lag = max_lag
+        self.probe_interval = probe_interval
+
+        self.web3 = None
+        self.lock = threading.Lock()
+        self.last_probe = 0
+
+    def request_func(self, web3, outer_middlewares):
+        # keep web3 around, to run requests through each node's middlewares
+        self.web3 = web3
+        return super().request_func(web3, outer_middlewares)
+
+    @property
+    def head(self):
+        heads = [x.head for x in self.endpoints if x.head is not None]
+        return max(heads) if heads else None
+
+    def ranked(self) -> List[Endpoint]:
+        """ All nodes, the healthiest first."""
+        with self.lock:
+            head = self.head
+            return sorted(
+                self.endpoints, key=lambda x: x.score(head, self.max_lag))
+
+    def best(self) -> BaseProvider:
+        """ The provider of the healthiest node."""
+        self.maybe_probe()
+        return self.ranked()[0].provider
+
+    def route(self, method: str, params) -> List[Endpoint]:
+        """ The nodes to try for a request, in order."""
+        if method in PRIMARY_ONLY or method.startswith('personal_'):
+            return [self.primary]
+        if method in PRIMARY_FIRST or (
+                method == 'eth_getTransactionCount' and 'pending' in params):
+            return [self.primary] + [x for x in self.ranked() if x is not self.primary]
+        return self.ranked()
+
+    def _request(self, endpoint: Endpoint, method: str, params):
+        request = endpoint.provider.request_func(self.web3, ())
+        started = time.time()
+        try:
+            response = request(method, params)
+        except FAILOVER_ERRORS:
+            with self.lock:
+                endpoint.record(time.time() - started, ok=False)
+            raise
+
+        with self.lock:
+            endpoint.record(time.time() - started, ok=True)
+            if method == 'eth_blockNumber' and 'result' in response:
+                head = response['result']
+                endpoint.head = int(head, 16) if isinstance(head, str) else head
+        return response
+
+    def maybe_probe(self):
+        """ Check the latency and head block of all nodes, so that nodes
+        which are not being used get a chance to recover.
+        """
+        if time.time() - self.last_probe < self.probe_interval:
+            return
+        self.last_probe = time.time()
+        for endpoint in self.endpoints:
+            try:
+                self._request(endpoint, 'eth_blockNumber', [])
+            except FAILOVER_ERRORS:
+                pass
+
+    def make_request(self, method, params):
+        self.maybe_probe()
+        endpoints = self.route(method, params)
+        for i, endpoint in enumerate(endpoints):
+            try:
+                return self._request(endpoint, method, params)
+            except FAILOVER_ERRORS as e:
+                if i == len(endpoints) - 1:
+                    raise
+                print(f'{endpoint.name} failed on {method} ({e!r}), '
+                      f'failing over to {endpoints[i + 1].name}')
+
+    def isConnected(self):
+        return any(x.provider.isConnected() for x in self.endpoints)
@@ -0,0 +1,68 @@
+from typing import Dict, Iterable
+
+import aio
+from rpc import RPCError
+from utils import PROJECT_DIR  # noqa: F401 (puts the deploy package on sys.path)
+from deploy.receipts import ReceiptScan
+
+
+class ReceiptWaiter:
+    def __init__(self, rpc: aio.AsyncRPC, batch_size=100):
+        """ Wait for the receipts of many transactions at once, on the
+        asyncio runtime. The async counterpart of `deploy/receipts.py`,
+        sharing its `ReceiptScan` bookkeeping.
+
+        Each poll fetches the blocks mined since the previous one, in a
+        single batch, and only fetches the receipts of the pending
+        transactions they include. Waiting for N transactions costs
+        O(blocks) requests, rather than a receipt lookup per transaction
+        per poll. Transactions are looked up once when first tracked, in
+        case they were mined before.
+
+        Args:
+            rpc: Async JSON-RPC client.
+            batch_size: Requests per JSON-RPC batch.
+        """
+        self.rpc = rpc
+        self.batch_size = batch_size
+        self.scan = ReceiptScan()
+
+    def track(self, txids: Iterable[str]):
+        """ Wait for exactly these transactions, from now on."""
+        self.scan.track(txids)
+
+    async def poll(self, head: int = None) -> Dict[str, dict]:
+        """ Look for the pending transactions in the blocks mined since
+        the last poll, up to `head`.
+
+        Returns:
+            Receipts of the transactions found, which are no longer pending.
+        """
+        if head is None:
+            head = await aio.block_number(self.rpc)
+        kwargs = dict(batch_size=self.batch_size)
+        new = set(self.scan.new)
+        receipts = await aio.get_receipts(self.rpc, list(new), **kwargs) \
+            if new else {}
+        found = {k: v for k, v in receipts.items() if isinstance(v, dict)}
+        # failed lookups are retried on the next poll
+        retry = {k for k, v in receipts.items() if isinstance(v, RPCError)}
+
+        numbers = self.scan.blocks(head)
+        blocks = await self.rpc.batch(
+            'eth_getBlockByNumber', [[hex(x), False] for x in numbers],
+            self.batch_size) if numbers else []
+        included, next_block = self.scan.scan(blocks)
+
+        included -= set(found)
+        if included:
+            receipts = await aio.get_receipts(self.rpc, list(included), **kwargs)
+            for txid, receipt in receipts.items():
+                if isinstance(receipt, dict):
+                    found[txid] = receipt
+                else:
+                    # failed, or reorganized away since
+                    retry.add(txid)
+
+        self.scan.resolve(new | included, set(found), retry, next_block)
+        return found
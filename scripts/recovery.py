@@ -0,0 +1,102 @@
+from typing import Callable, List
+
+import web3
+
+from db import TxStore
+from rpc import RPCError, batch_request, to_int
+
+
+def find_transaction_by_nonce(
+    w3: web3.Web3,
+    owner: str,
+    nonce: int,
+    from_block: int,
+    chunk_size=100) -> dict:
+    """ Find the mined transaction of `owner` with the given nonce,
+    by scanning blocks from `from_block` up to the head.
+
+    Returns:
+        The raw transaction, or None.
+    """
+    owner = owner.lower()
+    head = w3.eth.blockNumber
+    for start in range(max(from_block, 0), head + 1, chunk_size):
+        numbers = range(start, min(start + chunk_size, head + 1))
+        blocks = batch_request(
+            w3, 'eth_getBlockByNumber', ([hex(x), True] for x in numbers))
+        for block in blocks:
+            if isinstance(block, RPCError) or not block:
+                continue
+            for tx in block['transactions']:
+                if tx['from'].lower() == owner and to_int(tx['nonce']) == nonce:
+                    return tx
+    return None
+
+
+def recover_intents(
+    w3: web3.Web3,
+    store: TxStore,
+    expected_input: Callable[[List[int]], str]):
+    """ Reconcile the intents left behind by an interrupted payout
+    with the chain, before any new transaction is broadcast.
+
+    For an intent with a known txid (signed locally):
+        - a mined or pending transaction is recorded on its rows,
+        - an unknown one is rebroadcast from its raw transaction while
+          its nonce is unused (the same hash, so it can't mint twice),
+        - and dropped once its nonce was used by another transaction.
+
+    For an intent without a txid (signed by the node), the transaction
+    at its nonce is looked up:
+        - a mined one is recorded if it carries the intent's call data,
+        - a pending one keeps the intent, and its rows are held back until
+          a later run finds it mined,
+        - an unused nonce means the intent was never broadcast.
+
+    Args:
+        w3: Web3 instance.
+        store: Payouts database.
+        expected_input: Returns the call data of the transaction paying
+            out the given row ids.
+
+    Returns:
+        Number of intents still unresolved.
+    """
+    unresolved = 0
+    for owner, nonce, txid, raw_tx, gas_price, submitted_block, ids \
+            in store.open_intents():
+        account = web3.Web3.toChecksumAddress(owner)
+        mined = w3.eth.getTransactionCount(account, 'latest')
+        pending = w3.eth.getTransactionCount(account, 'pending')
+        props = dict(
+            nonce=nonce, gas_price=gas_price, submitted_block=submitted_block,
+            owner=owner)
+
+        if txid:
+            if not w3.eth.getTransaction(txid) and nonce >= mined and raw_tx:
+                try:
+                    w3.eth.sendRawTransaction(raw_tx)
+                    print(f'Rebroadcast {txid} (nonce {nonce})')
+                except ValueError as e:
+                    print(f'Unable to rebroadcast {txid} (nonce {nonce}): {e}')
+            found = txid if w3.eth.getTransaction(txid) else None
+        elif nonce < mined:
+            tx = find_transaction_by_nonce(w3, owner, nonce, submitted_block or 0)
+            found = tx['hash'] if tx and tx['input'] == expected_input(ids) else None
+        elif nonce < pending:
+            print(f'Nonce {nonce} of {owner} is still pending, '
+                  f'holding back rows {ids}')
+            unresolved += 1
+            continue
+        else:
+            found = None
+
+        if found:
+            # a row that already has a txid was being replaced
+            for id_ in ids:
+                store.replace_txid(id_, found, **props)
+            print(f'Recovered {found} (nonce {nonce}) for rows {ids}')
+        else:
+            store.drop_intents(owner, nonce)
+            print(f'Nonce {nonce} of {owner} was not broadcast for rows {ids}')
+    return unresolved
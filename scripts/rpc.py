@@ -0,0 +1,182 @@
+import json
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, Iterable, List
+
+import requests
+import web3
+from requests.adapters import HTTPAdapter
+from toolz import partition_all
+from web3.middleware.pythonic import receipt_formatter, transaction_formatter
+from web3.providers.ipc import IPCProvider, get_ipc_socket
+from web3.providers.rpc import HTTPProvider
+from web3.providers.tester import TestRPCProvider
+
+import metrics
+from provider_pool import PooledProvider
+
+
+class RPCError(ValueError):
+    """ A JSON-RPC error returned for a single request."""
+
+def to_int(value) -> int:
+    """ A quantity of a raw JSON-RPC result, which is hex encoded
+    by nodes but may already be an int (eth-tester).
+    """
+    return int(value, 16) if isinstance(value, str) else value
+
+
+# errors sending a whole request or batch, rather than returned for one
+SEND_ERRORS = (requests.RequestException, OSError)
+
+def batch_payload(method: str, batch: Iterable[tuple]) -> list:
+    """ A JSON-RPC batch calling `method`, from (id, params) pairs."""
+    return [
+        {'jsonrpc': '2.0', 'id': id_, 'method': method, 'params': params}
+        for id_, params in batch
+    ]
+
+def batch_results(batch: List[tuple], responses) -> list:
+    """ Match the responses to a batch back to its (id, params) pairs.
+
+    Args:
+        responses: The node's response, or the exception raised sending it.
+
+    Returns:
+        Raw results in the order of `batch`, or `RPCError`s.
+    """
+    if isinstance(responses, Exception):
+        return [RPCError(responses)] * len(batch)
+    if not isinstance(responses, list):
+        # the node rejected the batch as a whole
+        return [RPCError(responses.get('error'))] * len(batch)
+
+    by_id = {x.get('id'): x for x in responses}
+    results = []
+    for id_, _ in batch:
+        response = by_id.get(id_, {'error': 'Missing response'})
+        if 'error' in response:
+            results.append(RPCError(response['error']))
+        else:
+            results.append(response['result'])
+    return results
+
+def by_txid(txids: List[str], results: list, formatter) -> Dict[str, dict]:
+    """ Map the results of a request per txid back to them, formatted."""
+    return {
+        txid: formatter(result) if isinstance(result, Mapping) else result
+        for txid, result in zip(txids, results)
+    }
+
+
+def _post_http(session: requests.Session, endpoint_uri: str, payload):
+    response = session.post(endpoint_uri, json=payload, timeout=60)
+    response.raise_for_status()
+    return response.json()
+
+def _post_ipc(ipc_path: str, payload):
+    sock = get_ipc_socket(ipc_path, timeout=60)
+    try:
+        sock.sendall(json.dumps(payload).encode())
+        raw_response = b''
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                raise ConnectionError(f'IPC socket {ipc_path} closed')
+            raw_response += chunk
+            try:
+                return json.loads(raw_response)
+            except ValueError:
+                continue
+    finally:
+        sock.close()
+
+def batch_sender(w3: web3.Web3, workers: int):
+    """ Return a function that posts a JSON-RPC batch payload
+    to the node behind `w3` (the healthiest one of a `PooledProvider`),
+    or None if the provider can't batch.
+    """
+    provider = w3.providers[0]
+    if isinstance(provider, PooledProvider):
+        provider = provider.best()
+    if isinstance(provider, TestRPCProvider):
+        return None
+    if isinstance(provider, HTTPProvider):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=workers)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return partial(_post_http, session, provider.endpoint_uri)
+    if isinstance(provider, IPCProvider):
+        return partial(_post_ipc, provider.ipc_path)
+    return None
+
+
+def batch_request(
+    w3: web3.Web3,
+    method: str,
+    params_list: Iterable[list],
+    batch_size=100,
+    workers=8) -> list:
+    """ Call the same JSON-RPC method with many sets of params.
+
+    HTTP and IPC nodes receive JSON-RPC batches of `batch_size` requests,
+    up to `workers` batches at a time. Other providers (tester, testrpc)
+    fall back to one request per call on a thread pool.
+
+    Returns:
+        Raw results in the order of `params_list`. Requests that failed
+        are returned as `RPCError` instances instead of raising.
+    """
+    params_list = list(params_list)
+    send = batch_sender(w3, workers)
+
+    if not send:
+        def call(params):
+            try:
+                return w3.manager.request_blocking(method, params)
+            except ValueError as e:
+                return RPCError(e)
+
+        with ThreadPoolExecutor(workers) as pool:
+            return list(pool.map(call, params_list))
+
+    def call_batch(batch):
+        try:
+            with metrics.rpc_seconds.time(method=f'{method} (batch)'):
+                responses = send(batch_payload(method, batch))
+        except SEND_ERRORS as e:
+            metrics.rpc_errors.inc(method=f'{method} (batch)')
+            responses = e
+        return batch_results(batch, responses)
+
+    batches = partition_all(batch_size, enumerate(params_list))
+    with ThreadPoolExecutor(workers) as pool:
+        return [x for results in pool.map(call_batch, batches) for x in results]
+
+
+def _by_txid(
+    w3: web3.Web3,
+    method: str,
+    formatter,
+    txids: Iterable[str],
+    **kwargs) -> Dict[str, dict]:
+    txids = list(set(txids))
+    return by_txid(
+        txids, batch_request(w3, method, ([x] for x in txids), **kwargs), formatter)
+
+def get_receipts(w3: web3.Web3, txids: List[str], **kwargs) -> Dict[str, dict]:
+    """ Fetch many transaction receipts at once.
+
+    Returns:
+        A mapping of txid to its receipt, None (not mined yet)
+        or an `RPCError`.
+    """
+    return _by_txid(
+        w3, 'eth_getTransactionReceipt', receipt_formatter, txids, **kwargs)
+
+def get_transactions(w3: web3.Web3, txids: List[str], **kwargs) -> Dict[str, dict]:
+    """ Fetch many transactions at once, see `get_receipts`."""
+    return _by_txid(
+        w3, 'eth_getTransactionByHash', transaction_formatter, txids, **kwargs)
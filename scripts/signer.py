@@ -0,0 +1,111 @@
+import os
+from getpass import getpass
+from typing import Callable, Tuple
+
+import rlp
+import web3
+from eth_keyfile import extract_key_from_keyfile
+from eth_keys import keys
+from eth_utils import decode_hex, encode_hex, keccak
+
+import metrics
+
+# Decrypted keys, by absolute keyfile path. Decrypting a keystore is
+# deliberately slow (scrypt/pbkdf2), so it happens once per session.
+_keys = {}
+
+
+def load_key(keyfile: str, password: str = None) -> keys.PrivateKey:
+    """ Decrypt a JSON keystore file, or return the cached key.
+
+    The password is read from the KEYFILE_PASSWORD environment variable,
+    or prompted for once, unless passed in.
+    """
+    path = os.path.abspath(keyfile)
+    if path not in _keys:
+        if password is None:
+            password = os.environ.get('KEYFILE_PASSWORD') or \
+                getpass(f'Password to decrypt {keyfile}: ')
+        private_key = extract_key_from_keyfile(path, password.encode())
+        _keys[path] = keys.PrivateKey(private_key)
+    return _keys[path]
+
+
+class LocalSigner:
+    def __init__(self, keyfile: str, chain_id: int = None, password: str = None):
+        """ Sign transactions locally with a keystore account,
+        instead of unlocking the account on the node.
+
+        Args:
+            keyfile: Path to a JSON keystore (UTC--...) file.
+            chain_id: EIP-155 chain id. Without it, signatures are not
+                replay protected (needed by the tester chain).
+            password: Keystore password, see `load_key`.
+        """
+        self.key = load_key(keyfile, password)
+        self.address = self.key.public_key.to_checksum_address()
+        self.chain_id = chain_id
+
+    @metrics.timed(metrics.phase_seconds, phase='sign')
+    def sign(self, tx: dict) -> Tuple[str, str]:
+        """ Sign a transaction dict with nonce, gasPrice, gas, to,
+        value and data fields.
+
+        Returns:
+            (txid, raw_tx) as hex strings.
+        """
+        fields = [
+            tx['nonce'],
+            tx['gasPrice'],
+            tx['gas'],
+            decode_hex(tx['to']),
+            tx.get('value', 0),
+            decode_hex(tx.get('data', '0x')),
+        ]
+        if self.chain_id:
+            unsigned = fields + [self.chain_id, 0, 0]
+            v_offset = 35 + 2 * self.chain_id
+        else:
+            unsigned = fields
+            v_offset = 27
+
+        signature = self.key.sign_msg_hash(keccak(rlp.encode(unsigned)))
+        raw_tx = rlp.encode(
+            fields + [signature.v + v_offset, signature.r, signature.s])
+        return encode_hex(keccak(raw_tx)), encode_hex(raw_tx)
+
+
+class LocalSender:
+    def __init__(self,
+                 w3: web3.Web3,
+                 signer: LocalSigner,
+                 build: Callable[[tuple], dict]):
+        """ A `PayoutPipeline` sender that signs locally and broadcasts
+        raw transactions with `eth_sendRawTransaction`.
+
+        Args:
+            w3: Web3 instance.
+            signer: Signs the transactions.
+            build: Turns a payout row into an unsigned transaction dict
+                (everything but the nonce and gas price).
+        """
+        self.w3 = w3
+        self.signer = signer
+        self.build = build
+
+    def prepare(self, payout, nonce: int, gas_price: int = None) -> Tuple[str, str]:
+        tx = {
+            **self.build(payout),
+            'nonce': nonce,
+            'gasPrice': gas_price or self.w3.eth.gasPrice,
+        }
+        return self.signer.sign(tx)
+
+    def intent(self, prepared) -> Tuple[str, str]:
+        """ The (txid, raw_tx) to log before broadcasting."""
+        return prepared
+
+    @metrics.timed(metrics.phase_seconds, phase='broadcast')
+    def broadcast(self, prepared) -> str:
+        _, raw_tx = prepared
+        return self.w3.eth.sendRawTransaction(raw_tx)
@@ -1,6 +1,4 @@
-DROP TABLE IF EXISTS txs;
-
-CREATE TABLE txs (
+CREATE TABLE IF NOT EXISTS txs (
     id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
     name CHAR(100),
     recipient CHAR(42) NOT NULL,
@@ -10,4 +8,7 @@ CREATE TABLE txs (
     success Boolean DEFAULT 0
 );
 
--- CREATE UNIQUE INDEX unique_payment ON txs (recipient, amount, bucket);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    name CHAR(100) PRIMARY KEY NOT NULL,
+    block INTEGER NOT NULL
+);
@@ -0,0 +1,33 @@
+-- Store amounts as integer wei and track broadcast details.
+-- Amounts are kept as decimal TEXT, since wei values overflow
+-- SQLite's 64-bit INTEGER.
+--
+-- Databases holding duplicate (recipient, amount, bucket) payouts
+-- fail this migration, and have to be de-duplicated first.
+
+CREATE TABLE txs_new (
+    id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    name CHAR(100),
+    recipient CHAR(42) NOT NULL,
+    amount TEXT NOT NULL CHECK (amount != '' AND amount NOT GLOB '*[^0-9]*'),
+    bucket INTEGER NOT NULL,
+    txid CHAR(66) DEFAULT NULL,
+    success Boolean DEFAULT 0,
+    nonce INTEGER DEFAULT NULL,
+    gas_price INTEGER DEFAULT NULL,
+    submitted_block INTEGER DEFAULT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT INTO txs_new (id, name, recipient, amount, bucket, txid, success, attempts)
+SELECT id, name, lower(recipient), ether_to_wei(amount), bucket, txid, success,
+       txid IS NOT NULL
+  FROM txs;
+
+DROP TABLE txs;
+ALTER TABLE txs_new RENAME TO txs;
+
+CREATE INDEX txs_pending ON txs (bucket, id) WHERE txid IS NULL AND success = 0;
+CREATE INDEX txs_unverified ON txs (id) WHERE txid IS NOT NULL AND success = 0;
+CREATE INDEX txs_txid ON txs (txid) WHERE txid IS NOT NULL;
+CREATE UNIQUE INDEX unique_payment ON txs (recipient, amount, bucket);
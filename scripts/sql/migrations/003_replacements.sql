@@ -0,0 +1,15 @@
+-- Keep the txid's of broadcasts that were replaced at the same nonce
+-- (e.g. with a higher gas price). `txs.txid` always holds the latest
+-- broadcast, and any of a row's txid's may end up being mined.
+
+CREATE TABLE IF NOT EXISTS replacements (
+    id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    tx_id INTEGER NOT NULL REFERENCES txs (id),
+    txid CHAR(66) NOT NULL,
+    nonce INTEGER DEFAULT NULL,
+    gas_price INTEGER DEFAULT NULL,
+    submitted_block INTEGER DEFAULT NULL
+);
+
+CREATE INDEX replacements_tx_id ON replacements (tx_id);
+CREATE INDEX replacements_txid ON replacements (txid);
@@ -0,0 +1,18 @@
+-- Write-ahead log of broadcasts. An intent is committed before a
+-- transaction is broadcast, and deleted in the same commit that records
+-- its txid on the row. Intents left behind by a crash are reconciled
+-- against the chain before the next payout.
+
+CREATE TABLE IF NOT EXISTS intents (
+    id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    tx_id INTEGER NOT NULL REFERENCES txs (id),
+    owner CHAR(42) NOT NULL,
+    nonce INTEGER NOT NULL,
+    txid CHAR(66) DEFAULT NULL,
+    raw_tx TEXT DEFAULT NULL,
+    gas_price INTEGER DEFAULT NULL,
+    submitted_block INTEGER DEFAULT NULL
+);
+
+CREATE INDEX intents_tx_id ON intents (tx_id);
+CREATE INDEX intents_nonce ON intents (owner, nonce);
@@ -0,0 +1,6 @@
+-- Record which owner account broadcast each payout, for payouts
+-- sharded across several authorized owners.
+
+ALTER TABLE txs ADD COLUMN owner CHAR(42) DEFAULT NULL;
+
+CREATE INDEX txs_owner ON txs (owner);
@@ -0,0 +1,18 @@
+-- Track the block each payout was mined in, and its depth. A row only
+-- becomes `success = 1` (final) once it is deep enough. Rows whose block
+-- is reorganized away go back to unconfirmed.
+--
+-- `headers` keeps the recent block headers seen by the confirmation
+-- tracker, to detect reorgs without fetching receipts again.
+
+ALTER TABLE txs ADD COLUMN block_number INTEGER DEFAULT NULL;
+ALTER TABLE txs ADD COLUMN block_hash CHAR(66) DEFAULT NULL;
+ALTER TABLE txs ADD COLUMN confirmations INTEGER NOT NULL DEFAULT 0;
+
+CREATE INDEX txs_unconfirmed ON txs (block_number) WHERE success = 0;
+
+CREATE TABLE IF NOT EXISTS headers (
+    number INTEGER PRIMARY KEY NOT NULL,
+    hash CHAR(66) NOT NULL,
+    parent_hash CHAR(66) NOT NULL
+);
@@ -0,0 +1,37 @@
+CREATE TABLE IF NOT EXISTS checkpoints (
+    name CHAR(100) PRIMARY KEY NOT NULL,
+    block INTEGER NOT NULL,
+    block_hash CHAR(66) NOT NULL
+);
+
+-- every applied event, so that it can be reverted on a reorg
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    address CHAR(42) NOT NULL,
+    event CHAR(32) NOT NULL,
+    block_number INTEGER NOT NULL,
+    block_hash CHAR(66) NOT NULL,
+    tx_hash CHAR(66) NOT NULL,
+    log_index INTEGER NOT NULL,
+    args TEXT NOT NULL,
+    UNIQUE (tx_hash, log_index)
+);
+
+CREATE INDEX IF NOT EXISTS events_block_number ON events (block_number);
+CREATE INDEX IF NOT EXISTS events_address_event ON events (address, event);
+
+-- amounts are integer wei, stored as text (they overflow SQLite integers)
+CREATE TABLE IF NOT EXISTS balances (
+    token CHAR(42) NOT NULL,
+    holder CHAR(42) NOT NULL,
+    balance TEXT NOT NULL,
+    PRIMARY KEY (token, holder)
+);
+
+CREATE TABLE IF NOT EXISTS categories (
+    mintage CHAR(42) NOT NULL,
+    category INTEGER NOT NULL,
+    mint_limit TEXT NOT NULL,
+    minted TEXT NOT NULL,
+    PRIMARY KEY (mintage, category)
+);
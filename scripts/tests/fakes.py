@@ -0,0 +1,157 @@
+import itertools
+
+import aio
+
+TXID_A = '0x' + 'aa' * 32
+TXID_B = '0x' + 'bb' * 32
+TXID_C = '0x' + 'cc' * 32
+
+
+def block_hash(number, fork=0):
+    return '0x' + f'{fork:032x}{number:032x}'
+
+def raw_block(number, transactions=(), fork=0, parent_fork=None):
+    return {
+        'number': hex(number),
+        'hash': block_hash(number, fork),
+        'parentHash': block_hash(
+            number - 1, fork if parent_fork is None else parent_fork),
+        'transactions': list(transactions),
+    }
+
+def raw_receipt(txid, block_number, status=1, gas_used=50_000, fork=0):
+    return {
+        'transactionHash': txid,
+        'blockNumber': hex(block_number),
+        'blockHash': block_hash(block_number, fork),
+        'status': hex(status),
+        'gasUsed': hex(gas_used),
+        'cumulativeGasUsed': hex(gas_used),
+        'transactionIndex': '0x0',
+        'logs': [],
+    }
+
+
+class FakeRPC(aio.AsyncRPC):
+    """ An `AsyncRPC` that answers from dicts of raw JSON-RPC results."""
+
+    def __init__(self, head=0, receipts=None, txs=None, blocks=None):
+        super().__init__(limit=1)
+        self.head = head
+        self.receipts = receipts or {}
+        self.txs = txs or {}
+        self.blocks = blocks or {}
+        self.calls = []
+
+    def result(self, method, params):
+        self.calls.append((method, params))
+        if method == 'eth_blockNumber':
+            return hex(self.head)
+        if method == 'eth_getTransactionReceipt':
+            return self.receipts.get(params[0])
+        if method == 'eth_getTransactionByHash':
+            return self.txs.get(params[0])
+        if method == 'eth_getBlockByNumber':
+            return self.blocks.get(int(params[0], 16))
+        raise NotImplementedError(method)
+
+    async def _send(self, payload):
+        if isinstance(payload, list):
+            return [await self._send(x) for x in payload]
+        result = self.result(payload['method'], payload['params'])
+        return {'jsonrpc': '2.0', 'id': payload['id'], 'result': result}
+
+
+class FakeChain:
+    """ The `w3.eth` of a node that only keeps transactions, without
+    executing them. Pending transactions are mined on `mine()`, or right
+    away with `automine`, in nonce order per account.
+    """
+
+    def __init__(self, automine=True):
+        self.automine = automine
+        self.blockNumber = 0
+        self.gasPrice = 10 ** 9
+        self.blocks = {0: []}
+        self.txs = {}
+        self.pool = {}
+        self.mined = {}
+        self.receipts = {}
+        self.txids = (f'0x{x:064x}' for x in itertools.count(1))
+
+    def getTransactionCount(self, owner, block='latest'):
+        owner = owner.lower()
+        count = sum(1 for x, _ in self.mined if x == owner)
+        if block == 'pending':
+            while (owner, count) in self.pool:
+                count += 1
+        return count
+
+    def send(self, owner, nonce, data='0x', gas_price=None, txid=None) -> str:
+        """ Broadcast a transaction, as a node would accept it."""
+        key = owner.lower(), nonce
+        gas_price = gas_price or self.gasPrice
+        if key in self.mined or nonce < self.getTransactionCount(owner):
+            raise ValueError('nonce too low')
+        if key in self.pool:
+            if txid == self.pool[key]:
+                raise ValueError('known transaction')
+            if gas_price <= self.txs[self.pool[key]]['gasPrice']:
+                raise ValueError('replacement transaction underpriced')
+            del self.txs[self.pool[key]]
+        txid = txid or next(self.txids)
+        self.txs[txid] = {
+            'hash': txid, 'from': owner.lower(), 'nonce': nonce, 'input': data,
+            'gas': 100_000, 'gasPrice': gas_price, 'blockNumber': None,
+        }
+        self.pool[key] = txid
+        if self.automine:
+            self.mine()
+        return txid
+
+    def sendRawTransaction(self, raw_tx: str) -> str:
+        # raw transactions of the tests are `owner:nonce:data:txid`
+        owner, nonce, data, txid = raw_tx.split(':')
+        return self.send(owner, int(nonce), data, txid=txid)
+
+    def mine(self):
+        """ Mine a block with every pending transaction that can be."""
+        self.blockNumber += 1
+        self.blocks[self.blockNumber] = []
+        for owner in sorted({x for x, _ in self.pool}):
+            nonce = self.getTransactionCount(owner)
+            while (owner, nonce) in self.pool:
+                txid = self.pool.pop((owner, nonce))
+                self.mined[owner, nonce] = txid
+                self.txs[txid]['blockNumber'] = self.blockNumber
+                self.blocks[self.blockNumber].append(txid)
+                self.receipts[txid] = {
+                    'transactionHash': txid, 'blockNumber': self.blockNumber,
+                    'status': 1, 'gasUsed': 50_000,
+                }
+                nonce += 1
+
+    def getTransaction(self, txid):
+        return self.txs.get(txid)
+
+    def getTransactionReceipt(self, txid):
+        return self.receipts.get(txid)
+
+    def batch_request(self, w3, method, params_list):
+        """ Stands in for `rpc.batch_request`, with raw (hex) results."""
+        assert method == 'eth_getBlockByNumber'
+        return [
+            {
+                'number': number,
+                'transactions': [
+                    {**self.txs[x], 'nonce': hex(self.txs[x]['nonce'])}
+                    for x in self.blocks.get(int(number, 16), [])
+                ],
+            } if int(number, 16) in self.blocks else None
+            for number, _ in params_list
+        ]
+
+
+class FakeWeb3:
+    def __init__(self, eth):
+        self.eth = eth
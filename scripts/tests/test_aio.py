@@ -0,0 +1,24 @@
+import pytest
+
+import aio
+from rpc import to_int
+from utils import get_chain
+
+
+def test_async_rpc_is_abstract():
+    with pytest.raises(TypeError):
+        aio.AsyncRPC(1)
+
+def test_provider_rpc_has_its_own_provider():
+    w3 = get_chain('tester')
+    w3.eth.blockNumber
+
+    async def main():
+        rpc = aio.connect(w3)
+        try:
+            assert isinstance(rpc, aio.AsyncProviderRPC)
+            assert rpc.w3.providers[0] is not w3.providers[0]
+            return to_int(await rpc.request('eth_blockNumber', []))
+        finally:
+            await rpc.close()
+    assert aio.run(main) == w3.eth.blockNumber
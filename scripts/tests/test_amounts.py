@@ -0,0 +1,48 @@
+import json
+from decimal import Decimal
+from types import SimpleNamespace
+
+import click
+import pytest
+
+from distribute import bucket_totals, buckets, check_mint_limits
+from utils import ether_to_wei
+
+WEI = 10 ** 18
+
+
+@pytest.mark.parametrize('amount, wei', [
+    ('1,000.5', 1000 * WEI + WEI // 2),
+    ('0.000000000000000001', 1),
+    (json.loads('0.1', parse_float=Decimal), WEI // 10),
+    (3, 3 * WEI),
+])
+def test_amounts_are_exact_wei(amount, wei):
+    assert ether_to_wei(amount) == wei
+
+def test_amounts_with_more_than_18_decimals_are_rejected():
+    with pytest.raises(ValueError):
+        ether_to_wei('0.0000000000000000001')
+
+class Categories:
+    """ Stands in for a ViewTokenMintage instance."""
+    def __init__(self, limits):
+        self.limits = limits
+
+    def call(self):
+        return SimpleNamespace(categories=lambda bucket: self.limits[bucket])
+
+def test_mint_limits_are_checked_per_bucket():
+    instance = Categories({x: (10 * WEI, 4 * WEI) for x in buckets.values()})
+    totals = bucket_totals([
+        (buckets['Team'], 5 * WEI), (buckets['Team'], WEI),
+        (buckets['Bounties'], 4 * WEI), (buckets['Bounties'], 3 * WEI),
+    ])
+    assert totals == {buckets['Team']: 6 * WEI, buckets['Bounties']: 7 * WEI}
+
+    with pytest.raises(click.ClickException) as e:
+        check_mint_limits(instance, totals)
+    assert e.value.message.splitlines() == [
+        'Mint limit exceeded:',
+        'Bounties payouts total 7, but only 6 can still be minted',
+    ]
@@ -0,0 +1,62 @@
+import json
+
+import web3
+from click.testing import CliRunner
+from eth_tester import EthereumTester
+from web3.providers.eth_tester import EthereumTesterProvider
+
+import aio
+import bench
+from db import TxStore
+
+
+def report(rows_per_sec):
+    return {'results': [
+        {'rows': 100, 'commands': {
+            name: {'rows_per_sec': x} for name, x in rows_per_sec.items()}},
+    ]}
+
+def compare(tmpdir, baseline, results):
+    files = []
+    for name, rows_per_sec in [('baseline', baseline), ('results', results)]:
+        files.append(str(tmpdir / f'{name}.json'))
+        with open(files[-1], 'w') as f:
+            json.dump(report(rows_per_sec), f)
+    return CliRunner().invoke(bench.cli, ['compare', *files])
+
+def test_payout_sheet_is_spread_over_buckets(tmpdir):
+    sheet = str(tmpdir / 'sheet.json')
+    bench.write_payout_sheet(sheet, 12)
+    with open(sheet) as f:
+        payouts = json.load(f)
+
+    assert len(payouts) == 12
+    assert len({x['recipient'] for x in payouts}) == 12
+    assert {x['bucket'] for x in payouts} == set(bench.bench_buckets)
+    assert 'SeedSale' not in bench.bench_buckets
+
+def test_compare_flags_regressions(tmpdir):
+    result = compare(tmpdir, {'payout': 100, 'verify': 100}, {'payout': 95, 'verify': 50})
+    assert result.exit_code == 1
+    # printed once, and once more as a regression
+    assert result.output.count('verify') == 2
+    assert result.output.count('payout') == 1
+
+    assert compare(tmpdir, {'payout': 100}, {'payout': 120}).exit_code == 0
+
+def test_counters_count_rpc_calls_and_commits(tmpdir, monkeypatch):
+    # attach() patches these for the whole process
+    for cls, name in [
+            (TxStore, 'commit'), (aio.AsyncHTTPRPC, '_send'), (aio.AsyncIPCRPC, '_send')]:
+        monkeypatch.setattr(cls, name, getattr(cls, name))
+    w3 = web3.Web3(EthereumTesterProvider(EthereumTester()))
+    counters = bench.Counters()
+    counters.attach(w3)
+
+    w3.eth.blockNumber
+    with TxStore(str(tmpdir / 'payouts.db')) as store:
+        store.commit()
+        store.import_txs([
+            {'name': 'alice', 'recipient': '0x' + '11' * 20, 'amount': 1, 'bucket': 0}])
+    assert counters.rpc_calls == 1
+    assert counters.commits == 1
@@ -0,0 +1,64 @@
+import pytest
+
+import aio
+from confirmations import ConfirmationTracker
+from db import TxStore
+from fakes import FakeRPC, TXID_A, TXID_B, block_hash, raw_block
+
+
+@pytest.fixture
+def store(tmpdir):
+    with TxStore(str(tmpdir / 'payouts.db')) as store:
+        store.import_txs([
+            {'name': f'r{x}', 'recipient': '0x' + f'{x:040x}', 'amount': x, 'bucket': 0}
+            for x in range(1, 3)
+        ])
+        store.update_txid(1, TXID_A)
+        store.update_txid(2, TXID_B)
+        yield store
+
+def chain(head, fork_at=None):
+    """ Blocks up to `head`, on another fork after block `fork_at`."""
+    return {
+        x: raw_block(x, fork=int(fork_at is not None and x > fork_at),
+                     parent_fork=int(fork_at is not None and x - 1 > fork_at))
+        for x in range(head + 1)
+    }
+
+def advance(tracker, blocks, head):
+    async def main():
+        return await tracker.advance(FakeRPC(head=head, blocks=blocks), head)
+    return aio.run(main)
+
+def rows(store):
+    return store.query_all(
+        'SELECT block_number, confirmations, success FROM txs ORDER BY id')
+
+def test_confirmations_up_to_depth(store):
+    tracker = ConfirmationTracker(store, depth=3)
+    store.mark_txs_as_mined([(1, 4, block_hash(4)), (2, 5, block_hash(5))])
+
+    assert advance(tracker, chain(5), 5) == (0, 0)
+    assert rows(store) == [(4, 2, 0), (5, 1, 0)]
+
+    assert advance(tracker, chain(6), 6) == (0, 1)
+    assert rows(store) == [(4, 3, 1), (5, 2, 0)]
+
+def test_reorg_unconfirms_orphaned_rows(store):
+    tracker = ConfirmationTracker(store, depth=3)
+    store.mark_txs_as_mined([(1, 3, block_hash(3)), (2, 5, block_hash(5))])
+    assert advance(tracker, chain(5), 5) == (0, 1)
+
+    # blocks 5 and later are replaced
+    assert advance(tracker, chain(6, fork_at=4), 6) == (1, 0)
+    assert rows(store) == [(3, 3, 1), (None, 0, 0)]
+    assert store.header_hash(5) == block_hash(5, fork=1)
+    assert store.last_header() == (6, block_hash(6, fork=1))
+
+def test_reorg_of_the_head_without_new_blocks(store):
+    tracker = ConfirmationTracker(store, depth=3)
+    store.mark_txs_as_mined([(2, 5, block_hash(5))])
+    advance(tracker, chain(5), 5)
+
+    assert advance(tracker, chain(5, fork_at=4), 5) == (1, 0)
+    assert rows(store)[1] == (None, 0, 0)
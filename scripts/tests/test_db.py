@@ -0,0 +1,65 @@
+import sqlite3
+
+import pytest
+
+from db import TxStore, init_db
+
+
+@pytest.fixture
+def db_file(tmpdir):
+    db_file = str(tmpdir / 'payouts.db')
+    init_db(db_file)
+    with TxStore(db_file) as store:
+        store.import_txs([
+            {'name': f'r{x}', 'recipient': '0x' + f'{x:040x}', 'amount': x, 'bucket': 0}
+            for x in range(1, 6)
+        ])
+    return db_file
+
+def committed(db_file, query):
+    # as seen by another process
+    with sqlite3.connect(db_file) as conn:
+        return conn.execute(query).fetchall()
+
+def test_store_runs_in_wal_mode(db_file):
+    with TxStore(db_file) as store:
+        assert store.query_all('PRAGMA journal_mode') == [('wal',)]
+
+def test_broadcasts_are_committed_right_away(db_file):
+    with TxStore(db_file) as store:
+        store.update_txid(1, '0x01')
+        store.update_batch_txid([2, 3], '0x02')
+        assert committed(db_file, 'SELECT id, txid FROM txs WHERE txid IS NOT NULL') \
+            == [(1, '0x01'), (2, '0x02'), (3, '0x02')]
+
+        store.mark_tx_for_retry(1)
+        assert committed(db_file, 'SELECT txid FROM txs WHERE id = 1') == [(None,)]
+
+def test_status_updates_are_buffered(db_file):
+    q = 'SELECT id FROM txs WHERE success = 1'
+    with TxStore(db_file, commit_every=3) as store:
+        store.mark_txs_as_successful([1, 2])
+        assert committed(db_file, q) == []
+        store.mark_tx_as_successful(3)
+        assert committed(db_file, q) == [(1,), (2,), (3,)]
+
+        store.mark_tx_as_successful(4)
+        assert committed(db_file, q) == [(1,), (2,), (3,)]
+    # and the rest are committed on close
+    assert committed(db_file, q) == [(1,), (2,), (3,), (4,)]
+
+def test_rows_are_streamed_in_chunks(db_file):
+    with TxStore(db_file) as store:
+        chunks = store.iter_chunks('SELECT id FROM txs ORDER BY id', chunk_size=2)
+        assert list(chunks) == [[(1,), (2,)], [(3,), (4,)], [(5,)]]
+
+def test_stream_reads_a_snapshot_while_rows_are_updated(db_file):
+    q = 'SELECT id FROM txs WHERE txid IS NULL ORDER BY id'
+    with TxStore(db_file) as store:
+        streamed = []
+        for id_, in store.iter_rows(q, chunk_size=1):
+            streamed.append(id_)
+            store.update_txid(id_, f'0x{id_:02x}')
+            store.mark_tx_for_retry(1)
+        assert streamed == [1, 2, 3, 4, 5]
+        assert store.query_all(q) == [(1,)]
@@ -0,0 +1,35 @@
+import pytest
+
+import fees
+from fees import FeeEngine, gwei_to_wei
+
+
+class FakeEth:
+    blockNumber = 2
+    gasPrice = 1
+
+
+class FakeWeb3:
+    eth = FakeEth()
+
+
+@pytest.mark.parametrize('encode', [hex, int])
+def test_samples_hex_or_int_gas_prices(monkeypatch, encode):
+    # nodes return hex quantities, eth-tester returns ints
+    blocks = {
+        0: [gwei_to_wei(3), gwei_to_wei(1)],
+        1: [gwei_to_wei(2)],
+        2: [],
+    }
+    def batch_request(w3, method, params):
+        assert method == 'eth_getBlockByNumber'
+        return [
+            {'transactions': [{'gasPrice': encode(x)} for x in blocks[int(number, 16)]]}
+            for number, _ in params
+        ]
+    monkeypatch.setattr(fees, 'batch_request', batch_request)
+
+    engine = FeeEngine(FakeWeb3(), confirm_within=1, confidence=1.0)
+    assert list(engine.samples) == []
+    assert engine.gas_price() == gwei_to_wei(2)
+    assert list(engine.samples) == [gwei_to_wei(1), gwei_to_wei(2)]
@@ -0,0 +1,49 @@
+from gas import GasCache, GasKey, key_from_str, key_to_str
+
+KEY = GasKey('0x' + 'AB' * 20, 'mint', 0, True)
+
+
+def calibrated(estimates=(50_000, 52_000, 51_000)):
+    cache = GasCache(samples=len(estimates), margin=1.2)
+    for x in estimates:
+        cache.gas_limit(KEY, lambda: x)
+    return cache
+
+def never():
+    raise AssertionError('estimated a calibrated profile')
+
+def test_profiles_are_calibrated_from_a_few_estimates():
+    cache = GasCache(samples=2, margin=1.2)
+    assert cache.gas_limit(KEY, lambda: 50_000) == 60_000
+    assert cache.gas_limit(KEY, lambda: 55_000) == 66_000
+    # the highest estimate, from now on without calling the node
+    assert cache.gas_limit(KEY, never) == 66_000
+    assert cache.gas_limit(KEY._replace(first_mint=False), lambda: 35_000) == 42_000
+
+def test_receipts_refresh_the_profile():
+    cache = calibrated()
+    # estimates run 4% above the gas used, after refunds
+    cache.observe(KEY, 50_000, 62_400)
+    assert cache.gas_limit(KEY, never) == 62_400
+    cache.observe(KEY, 52_500, 62_400)
+    assert cache.gas_limit(KEY, never) == 63_024
+
+def test_drifting_or_out_of_gas_receipts_evict_the_profile():
+    cache = calibrated()
+    cache.observe(KEY, 50_000, 62_400)
+    cache.observe(KEY, 60_000, 62_400)
+    assert KEY not in cache.profiles
+
+    cache = calibrated()
+    cache.observe(KEY, 62_400, 62_400)
+    assert KEY not in cache.profiles
+
+def test_profiles_are_saved_between_runs(tmpdir):
+    path = str(tmpdir / 'gas.json')
+    cache = calibrated()
+    cache.observe(KEY, 50_000, 62_400)
+    cache.save(path)
+
+    loaded = GasCache(samples=3, margin=1.2)
+    loaded.load(path)
+    assert loaded.gas_limit(key_from_str(key_to_str(KEY)), never) == 62_400
@@ -0,0 +1,48 @@
+import csv
+import multiprocessing
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import pytest
+
+import importer
+from db import TxStore
+from importer import SheetImporter, iter_csv, validated_payout
+
+RECIPIENT = '0x' + '11' * 20
+
+
+def write_sheet(path, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, ['Name', 'Tokens', 'Address', 'Category'])
+        writer.writeheader()
+        writer.writerows(rows)
+
+def test_validated_payout():
+    payout = validated_payout({
+        'Name': 'alice', 'Tokens': '1.5', 'Address': RECIPIENT, 'Category': 'Team'})
+    assert payout == {
+        'name': 'alice', 'amount': 1_500_000_000_000_000_000,
+        'recipient': RECIPIENT, 'bucket': 0}
+
+@pytest.mark.skipif(sys.version_info < (3, 7),
+                    reason='ProcessPoolExecutor takes mp_context since 3.7')
+def test_import_with_spawned_workers(tmpdir, monkeypatch):
+    # spawned workers unpickle `validate` by importing its module
+    monkeypatch.setattr(importer, 'ProcessPoolExecutor', partial(
+        ProcessPoolExecutor, mp_context=multiprocessing.get_context('spawn')))
+    sheet = str(tmpdir / 'payouts.csv')
+    write_sheet(sheet, [
+        {'Name': 'alice', 'Tokens': '1', 'Address': RECIPIENT, 'Category': 'Team'},
+        {'Name': 'bob', 'Tokens': '2', 'Address': '0x1234', 'Category': 'Team'},
+    ])
+
+    with TxStore(str(tmpdir / 'payouts.db')) as store:
+        sheet_importer = SheetImporter(
+            store, validated_payout, str(tmpdir / 'rejects.csv'), workers=1)
+        sheet_importer.run(iter_csv(sheet))
+
+    assert sheet_importer.imported == 1
+    assert sheet_importer.rejected == 1
+    assert sheet_importer.totals == {0: 10 ** 18}
@@ -0,0 +1,66 @@
+import pytest
+
+from logscan import is_result_limit_error, scan_events
+
+
+@pytest.mark.parametrize('message', [
+    'query returned more than 10000 results',
+    'Log response size exceeded. You can make eth_getLogs requests with up to a 2K block range',
+    'exceed maximum block range: 5000',
+    'block range is too wide',
+])
+def test_result_limit_errors(message):
+    assert is_result_limit_error(ValueError({'code': -32005, 'message': message}))
+
+@pytest.mark.parametrize('message', [
+    'too many requests',
+    'project ID request rate exceeded',
+    'daily request count exceeded, request rate limited',
+    'rate limit exceeded',
+])
+def test_rate_limits_are_not_result_limits(message):
+    assert not is_result_limit_error(ValueError({'code': -32005, 'message': message}))
+
+
+class FakeEth:
+    def __init__(self, limit, error):
+        self.limit = limit
+        self.error = error
+        self.queries = []
+
+    def getLogs(self, params):
+        self.queries.append((params['fromBlock'], params['toBlock']))
+        if params['toBlock'] - params['fromBlock'] + 1 > self.limit:
+            raise ValueError({'code': -32005, 'message': self.error})
+        return []
+
+class FakeWeb3:
+    def __init__(self, limit, error):
+        self.eth = FakeEth(limit, error)
+
+class FakeContract:
+    address = '0x' + '1' * 40
+    abi = [{
+        'type': 'event',
+        'name': 'TokensMinted',
+        'anonymous': False,
+        'inputs': [{'name': 'recipient', 'type': 'address', 'indexed': True}],
+    }]
+
+
+def test_scan_splits_ranges_over_the_result_limit():
+    w3 = FakeWeb3(limit=100, error='query returned more than 10000 results')
+    ends = [x for x, _ in scan_events(
+        w3, FakeContract(), 'TokensMinted', 0, 999, span=1000)]
+
+    # every block is scanned once, in order
+    scanned = [(a, b) for a, b in w3.eth.queries if b - a + 1 <= 100]
+    assert [b for _, b in scanned] == ends
+    assert scanned[0][0] == 0 and ends[-1] == 999
+    assert all(x[1] + 1 == y[0] for x, y in zip(scanned, scanned[1:]))
+
+def test_scan_raises_on_rate_limits():
+    w3 = FakeWeb3(limit=100, error='too many requests')
+    with pytest.raises(ValueError):
+        list(scan_events(w3, FakeContract(), 'TokensMinted', 0, 999, span=1000))
+    assert w3.eth.queries == [(0, 999)]
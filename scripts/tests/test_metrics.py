@@ -0,0 +1,73 @@
+import pytest
+
+import aio
+import metrics
+
+
+@pytest.fixture
+def registry():
+    return metrics.Registry()
+
+def test_prometheus_text(registry):
+    sends = registry.counter('sends', 'Sends', ['kind'])
+    seconds = registry.histogram('seconds', 'Seconds', buckets=(0.1, 1.0))
+    sends.inc(kind='raw')
+    sends.inc(2, kind='raw')
+    seconds.observe(0.5)
+    seconds.observe(5.0)
+
+    assert registry.prometheus().splitlines() == [
+        '# HELP sends Sends',
+        '# TYPE sends counter',
+        'sends_total{kind="raw"} 3',
+        '# HELP seconds Seconds',
+        '# TYPE seconds histogram',
+        'seconds_bucket{le="0.1"} 0',
+        'seconds_bucket{le="1.0"} 1',
+        'seconds_bucket{le="+Inf"} 2',
+        'seconds_count 2',
+        'seconds_sum 5.5',
+    ]
+
+def test_snapshot_counter_rates(registry, monkeypatch):
+    sends = registry.counter('sends', 'Sends')
+    now = [0.0]
+    monkeypatch.setattr(metrics.time, 'time', lambda: now[0])
+
+    assert registry.snapshot()['per_minute'] == {}
+    sends.inc(10)
+    now[0] = 30.0
+    snapshot = registry.snapshot()
+    assert snapshot['samples'] == {'sends_total': 10}
+    assert snapshot['per_minute'] == {'sends_total': 20.0}
+
+def test_timed_functions_and_coroutines(registry):
+    seconds = registry.histogram('seconds', 'Seconds', ['phase'])
+
+    @metrics.timed(seconds, phase='sync')
+    def sync():
+        return 1
+
+    @metrics.timed(seconds, phase='async')
+    async def async_():
+        return 2
+
+    assert sync() == 1
+    assert aio.run(async_) == 2
+    assert {key: state[1] for key, state in seconds.values.items()} == {
+        ('sync',): 1, ('async',): 1}
+
+def test_rpc_middleware_counts_errors():
+    def make_request(method, params):
+        if method == 'fails':
+            raise OSError('down')
+        return {'error': 'Failed'} if params else {'result': 1}
+    middleware = metrics.rpc_middleware(make_request, None)
+    errors = lambda method: metrics.rpc_errors.values.get((method,), 0)
+    before = errors('call'), errors('fails')
+
+    assert middleware('call', []) == {'result': 1}
+    middleware('call', ['x'])
+    with pytest.raises(OSError):
+        middleware('fails', [])
+    assert (errors('call'), errors('fails')) == (before[0] + 1, before[1] + 1)
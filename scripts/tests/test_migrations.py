@@ -0,0 +1,52 @@
+import sqlite3
+
+import pytest
+
+from db import TxStore, migrate
+from utils import script_source_dir
+
+MIGRATIONS = sorted((script_source_dir() / 'sql' / 'migrations').glob('*.sql'))
+
+
+@pytest.fixture
+def legacy_db(tmpdir):
+    """ A payouts database of the unversioned schema, with FLOAT amounts."""
+    db_file = str(tmpdir / 'payouts.db')
+    with sqlite3.connect(db_file) as conn:
+        conn.executescript(MIGRATIONS[0].read_text())
+        conn.executemany(
+            'INSERT INTO txs (name, recipient, amount, bucket, txid) VALUES (?, ?, ?, ?, ?)',
+            [('alice', '0x' + 'AB' * 20, 0.1, 0, '0x01'),
+             ('bob', '0x' + 'cd' * 20, 1234.5, 1, None)])
+    return db_file
+
+def test_legacy_database_is_migrated(legacy_db):
+    with TxStore(legacy_db) as store:
+        assert store.query_all('PRAGMA user_version') == [(len(MIGRATIONS),)]
+        assert store.query_all(
+            'SELECT recipient, amount, txid, attempts FROM txs ORDER BY id') == [
+            ('0x' + 'ab' * 20, str(10 ** 17), '0x01', 1),
+            ('0x' + 'cd' * 20, str(12345 * 10 ** 17), None, 0),
+        ]
+
+def test_migrations_are_applied_once(legacy_db):
+    with TxStore(legacy_db):
+        pass
+    with sqlite3.connect(legacy_db) as conn:
+        assert migrate(conn) == len(MIGRATIONS)
+        assert conn.execute('SELECT count(*) FROM txs').fetchone() == (2,)
+
+def test_failed_migration_is_rolled_back(tmpdir):
+    db_file = str(tmpdir / 'payouts.db')
+    with sqlite3.connect(db_file) as conn:
+        conn.executescript(MIGRATIONS[0].read_text())
+        # the unique (recipient, amount, bucket) index can't be created
+        conn.executemany(
+            'INSERT INTO txs (name, recipient, amount, bucket) VALUES (?, ?, ?, ?)',
+            [('alice', '0x' + 'ab' * 20, 1, 0), ('alice', '0x' + 'AB' * 20, 1, 0)])
+
+    with pytest.raises(sqlite3.IntegrityError):
+        TxStore(db_file)
+    with sqlite3.connect(db_file) as conn:
+        assert conn.execute('PRAGMA user_version').fetchone() == (1,)
+        assert conn.execute('SELECT amount FROM txs').fetchall() == [(1.0,), (1.0,)]
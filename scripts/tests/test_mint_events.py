@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+import pytest
+
+import distribute
+from db import TxStore, init_db
+
+ALICE = '0x' + '11' * 20
+BOB = '0x' + '22' * 20
+WEI = 10 ** 18
+TXID_A = '0x' + 'aa' * 32
+TXID_B = '0x' + 'bb' * 32
+INSTANCE = SimpleNamespace(address='0x' + '33' * 20)
+
+
+@pytest.fixture
+def store(tmpdir):
+    db_file = str(tmpdir / 'payouts.db')
+    init_db(db_file)
+    with TxStore(db_file) as store:
+        store.import_txs([
+            {'name': 'alice', 'recipient': ALICE, 'amount': 10 * WEI, 'bucket': 0},
+            {'name': 'bob', 'recipient': BOB, 'amount': 20 * WEI, 'bucket': 0},
+        ])
+        yield store
+
+def successful(store):
+    return store.query_all('SELECT id, txid FROM txs WHERE success = 1 ORDER BY id')
+
+def test_batch_txid_matches_each_row(store):
+    store.update_txids([(1, TXID_A), (2, TXID_A)])
+
+    assert store.mark_minted(TXID_A, ALICE, 10 * WEI, 0) == 'txid'
+    assert successful(store) == [(1, TXID_A)]
+    assert store.mark_minted(TXID_A, BOB, 20 * WEI, 0) == 'txid'
+    assert successful(store) == [(1, TXID_A), (2, TXID_A)]
+
+def test_payout_match_only_takes_over_rows_without_txid(store):
+    store.update_txid(1, TXID_A)
+
+    assert store.mark_minted(TXID_B, ALICE, 10 * WEI, 0) is None
+    assert store.mark_minted(TXID_B, BOB, 20 * WEI, 0) == 'payout'
+    assert successful(store) == [(2, TXID_B)]
+
+@pytest.mark.parametrize('from_block, scanned_from', [(None, 43), (7, 7)])
+def test_explicit_from_block_wins_over_checkpoint(
+        store, monkeypatch, from_block, scanned_from):
+    store.set_checkpoint(f'TokensMinted:{INSTANCE.address}', 42)
+    scans = []
+
+    def scan_events(w3, instance, event_name, from_block, to_block):
+        scans.append((from_block, to_block))
+        return iter([])
+    monkeypatch.setattr(distribute, 'scan_events', scan_events)
+
+    distribute.verify_from_logs(None, INSTANCE, store, from_block, 100)
+    assert scans == [(scanned_from, 100)]
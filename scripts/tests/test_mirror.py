@@ -0,0 +1,194 @@
+from types import SimpleNamespace
+
+import click
+import pytest
+
+from distribute import remaining_mint_limits, sync_mirror
+from fakes import block_hash
+from mirror import CATEGORY_COUNT, Mirror, MirrorStore
+
+MINTAGE = '0x' + '0c' * 20
+TOKEN = '0x' + '0d' * 20
+ALICE = '0x' + '0a' * 20
+BOB = '0x' + '0b' * 20
+
+
+def event(name, args, block, log_index=0, address=TOKEN, fork=0):
+    return {
+        'address': address,
+        'event': name,
+        'args': args,
+        'blockNumber': block,
+        'blockHash': block_hash(block, fork),
+        'transactionHash': '0x' + f'{fork:032x}{block:024x}{log_index:08x}',
+        'logIndex': log_index,
+    }
+
+def mint(guy, wad, block, **kwargs):
+    return event('Mint', {'guy': guy, 'wad': wad}, block, **kwargs)
+
+def transfer(src, dst, wad, block, **kwargs):
+    return event('Transfer', {'src': src, 'dst': dst, 'wad': wad}, block, **kwargs)
+
+def tokens_minted(category, tokens, block, **kwargs):
+    return event(
+        'TokensMinted', {'recipient': ALICE, 'tokens': tokens, 'category': category},
+        block, address=MINTAGE, **kwargs)
+
+
+@pytest.fixture
+def store(tmpdir):
+    with MirrorStore(str(tmpdir / 'mirror.db')) as store:
+        yield store
+
+def test_apply_event(store):
+    assert store.apply_event(mint(ALICE, 10, 1))
+    assert store.apply_event(transfer(ALICE, BOB, 3, 2))
+    assert store.apply_event(event('Burn', {'guy': BOB, 'wad': 1}, 3))
+    assert store.balance_of(TOKEN, ALICE) == 7
+    assert store.balance_of(TOKEN, BOB) == 2
+
+    # applied only once
+    assert not store.apply_event(transfer(ALICE, BOB, 3, 2))
+    assert store.balance_of(TOKEN, BOB) == 2
+
+def test_apply_event_to_seeded_categories(store):
+    # events before the categories were seeded are part of the seed
+    assert store.apply_event(tokens_minted(0, 5, 1))
+    assert store.categories(MINTAGE) == {}
+
+    store.set_category(MINTAGE, 0, 100, 5)
+    assert store.apply_event(tokens_minted(0, 20, 2))
+    assert store.categories(MINTAGE) == {0: (100, 25)}
+    assert store.remaining_mint_limits(MINTAGE) == {0: 75}
+
+def test_revert_events(store):
+    store.set_category(MINTAGE, 1, 100, 0)
+    for x in [mint(ALICE, 10, 1), tokens_minted(1, 10, 1, log_index=1),
+              transfer(ALICE, BOB, 4, 2), mint(BOB, 5, 3),
+              tokens_minted(1, 5, 3, log_index=1)]:
+        store.apply_event(x)
+
+    assert store.revert_events(1, [MINTAGE, TOKEN]) == 3
+    assert store.balance_of(TOKEN, ALICE) == 10
+    assert store.balance_of(TOKEN, BOB) == 0
+    assert store.categories(MINTAGE) == {1: (100, 10)}
+    assert [x['blockNumber'] for x in store.iter_events(MINTAGE, 'TokensMinted', 10)] == [1]
+
+    # reverted events can be applied again, from another fork
+    assert store.apply_event(transfer(ALICE, BOB, 4, 2, fork=1))
+    assert store.balance_of(TOKEN, BOB) == 4
+
+def test_revert_events_of_other_contracts(store):
+    other = '0x' + '0e' * 20
+    store.apply_event(mint(ALICE, 10, 2))
+    store.apply_event(mint(ALICE, 10, 2, log_index=1, address=other))
+    assert store.revert_events(1, [other]) == 1
+    assert store.balance_of(TOKEN, ALICE) == 10
+    assert store.balance_of(other, ALICE) == 0
+
+
+class FakeMirrorChain:
+    """ Blocks and token events of a chain that can switch forks."""
+
+    def __init__(self, head, events):
+        self.blockNumber = head
+        self.events = events
+        self.fork_at = None
+
+    def fork(self, number):
+        return int(self.fork_at is not None and number > self.fork_at)
+
+    def getBlock(self, number):
+        return {
+            'hash': block_hash(number, self.fork(number)),
+            'parentHash': block_hash(number - 1, self.fork(number - 1)),
+        }
+
+    def contract(self, abi, address):
+        return SimpleNamespace(address=address)
+
+    def call(self, transaction, block):
+        return '0x' + f'{100:064x}{0:064x}'
+
+    def fetch(self, from_block, to_block):
+        return [
+            x for x in self.events
+            if from_block <= x['blockNumber'] <= to_block and
+            x['blockHash'] == block_hash(x['blockNumber'], self.fork(x['blockNumber']))
+        ]
+
+@pytest.fixture
+def chain():
+    return FakeMirrorChain(head=6, events=[
+        mint(ALICE, 10, 2),
+        transfer(ALICE, BOB, 4, 5),
+        transfer(ALICE, BOB, 1, 5, fork=1),
+        mint(BOB, 2, 6, fork=1),
+    ])
+
+@pytest.fixture
+def mirror(chain, store, monkeypatch):
+    mintage = SimpleNamespace(
+        address=MINTAGE,
+        call=lambda: SimpleNamespace(viewToken=lambda: TOKEN),
+        encodeABI=lambda fn, args: '0x',
+        web3=SimpleNamespace(eth=chain),
+    )
+    mirror = Mirror(SimpleNamespace(eth=chain), store, mintage, reorg_depth=2, span=2)
+    monkeypatch.setattr(mirror, 'fetch', chain.fetch)
+    return mirror
+
+def test_sync(chain, store, mirror):
+    assert mirror.sync(from_block=1) == 6
+    assert store.get_checkpoint(mirror.name) == (6, block_hash(6))
+    assert store.balance_of(TOKEN, BOB) == 4
+    assert store.categories(MINTAGE) == {x: (100, 0) for x in range(CATEGORY_COUNT)}
+
+def test_sync_rolls_back_reorgs(chain, store, mirror):
+    mirror.sync(from_block=1, to_block=5)
+    chain.fork_at = 4
+    assert mirror.sync() == 6
+    assert store.get_checkpoint(mirror.name) == (6, block_hash(6, fork=1))
+    assert store.balance_of(TOKEN, ALICE) == 9
+    assert store.balance_of(TOKEN, BOB) == 3
+
+def test_sync_checks_the_parent_of_new_blocks(chain, store, mirror, monkeypatch):
+    mirror.sync(from_block=1, to_block=5)
+
+    # the chain reorganizes right after the checkpoint was found unchanged
+    check_reorg = mirror.check_reorg
+    def reorg_after_check():
+        result = check_reorg()
+        chain.fork_at = 4
+        return result
+    monkeypatch.setattr(mirror, 'check_reorg', reorg_after_check)
+
+    assert mirror.sync() == 6
+    assert store.get_checkpoint(mirror.name) == (6, block_hash(6, fork=1))
+    assert store.balance_of(TOKEN, ALICE) == 9
+    assert store.balance_of(TOKEN, BOB) == 3
+
+def test_remaining_mint_limits_of_a_stale_mirror(chain, store, mirror):
+    mirror.sync(from_block=1)
+    assert remaining_mint_limits(mirror.mintage, store) == \
+        {x: 100 for x in range(CATEGORY_COUNT)}
+
+    chain.blockNumber += 1
+    with pytest.raises(click.ClickException, match='behind the head block 7'):
+        remaining_mint_limits(mirror.mintage, store)
+
+def test_sync_mirror_checks_limits_as_of_the_synced_block(chain, store, mirror):
+    mirror.sync(from_block=1, to_block=5)
+    head = sync_mirror(mirror)
+    assert head == 6
+
+    # a block mined since doesn't make the mirror stale
+    chain.blockNumber += 1
+    assert remaining_mint_limits(mirror.mintage, store, head) == \
+        {x: 100 for x in range(CATEGORY_COUNT)}
+
+def test_sync_mirror_requires_an_initialised_mirror(chain, store, mirror):
+    with pytest.raises(click.ClickException, match='mirror.py sync'):
+        sync_mirror(mirror)
+    assert store.get_checkpoint(mirror.name) is None
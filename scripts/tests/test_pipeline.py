@@ -0,0 +1,112 @@
+import pytest
+
+from db import TxStore, init_db
+from fakes import FakeChain, FakeWeb3
+from pipeline import NodeSender, NonceManager, PayoutPipeline
+
+OWNER = '0x' + '0a' * 20
+
+
+@pytest.fixture
+def store(tmpdir):
+    db_file = str(tmpdir / 'payouts.db')
+    init_db(db_file)
+    with TxStore(db_file) as store:
+        store.import_txs([
+            {'name': f'r{x}', 'recipient': '0x' + f'{x:040x}', 'amount': x, 'bucket': 0}
+            for x in range(1, 6)
+        ])
+        yield store
+
+def payouts(store):
+    q = """
+    SELECT id, recipient, amount, bucket FROM txs WHERE txid IS NULL ORDER BY id
+    """
+    return [(id_, recipient, int(amount), bucket)
+            for id_, recipient, amount, bucket in store.query_all(q)]
+
+def txids(store):
+    return store.query_all('SELECT id, txid FROM txs ORDER BY id')
+
+def node_sender(eth, send=None):
+    def broadcast(payout, nonce, gas_price):
+        return eth.send(OWNER, nonce, f'mint {payout[0]}', gas_price)
+    return NodeSender(send or broadcast)
+
+def mined_rows(eth):
+    # row ids of the mined payouts, by nonce
+    return {
+        nonce: int(eth.txs[txid]['input'].split()[1])
+        for (owner, nonce), txid in eth.mined.items()
+        if owner == OWNER and eth.txs[txid]['input'].startswith('mint ')
+    }
+
+def test_nonce_manager_counts_locally():
+    eth = FakeChain()
+    eth.send(OWNER, 0)
+    nonces = NonceManager(FakeWeb3(eth), OWNER)
+    assert [nonces.next() for _ in range(3)] == [1, 2, 3]
+    assert nonces.mined() == 1
+    assert nonces.sync() == 1
+
+def test_pipeline_mints_every_row(store):
+    eth = FakeChain()
+    PayoutPipeline(
+        FakeWeb3(eth), OWNER, store, node_sender(eth), window=2, poll_interval=0,
+    ).run(payouts(store))
+
+    assert mined_rows(eth) == {0: 1, 1: 2, 2: 3, 3: 4, 4: 5}
+    assert txids(store) == [(id_, eth.mined[OWNER, id_ - 1]) for id_ in range(1, 6)]
+
+def test_pipeline_retries_nonce_collisions(store):
+    eth = FakeChain()
+    pipeline = PayoutPipeline(
+        FakeWeb3(eth), OWNER, store, node_sender(eth), poll_interval=0)
+    # another process takes nonce 0 once the pipeline has synced its nonces
+    eth.send(OWNER, 0, 'elsewhere')
+    pipeline.run(payouts(store))
+
+    assert mined_rows(eth) == {1: 1, 2: 2, 3: 3, 4: 4, 5: 5}
+
+def test_pipeline_gives_up_after_max_attempts(store):
+    eth = FakeChain()
+    def send(payout, nonce, gas_price):
+        raise ValueError('nonce too low')
+    pipeline = PayoutPipeline(
+        FakeWeb3(eth), OWNER, store, node_sender(eth, send),
+        poll_interval=0, max_attempts=2)
+    with pytest.raises(ValueError):
+        pipeline.run(payouts(store))
+    assert pipeline.attempts == {1: 3}
+
+def test_pipeline_retries_replaced_rows(store):
+    eth = FakeChain(automine=False)
+    def send(payout, nonce, gas_price):
+        txid = eth.send(OWNER, nonce, f'mint {payout[0]}', gas_price)
+        if payout[0] == 2 and nonce == 1:
+            # replaced at the same nonce, by a higher priced transaction
+            eth.send(OWNER, nonce, 'elsewhere', 2 * eth.gasPrice)
+        eth.mine()
+        return txid
+
+    PayoutPipeline(
+        FakeWeb3(eth), OWNER, store, node_sender(eth, send),
+        window=1, poll_interval=0,
+    ).run(payouts(store))
+
+    # row 2 goes ahead of the rows not prepared yet
+    assert mined_rows(eth) == {0: 1, 2: 3, 3: 2, 4: 4, 5: 5}
+    assert txids(store)[1] == (2, eth.mined[OWNER, 3])
+    # the replaced broadcast is still matched, should it be mined after all
+    assert len(store.replaced_txids([2])[2]) == 1
+
+def test_pipeline_records_the_owner(store):
+    eth = FakeChain()
+    PayoutPipeline(
+        FakeWeb3(eth), OWNER, store, node_sender(eth), poll_interval=0,
+    ).run(payouts(store))
+    assert store.query_all('SELECT DISTINCT owner FROM txs') == [(OWNER,)]
+
+    # cleared on retry, as another owner may broadcast the row next
+    store.mark_tx_for_retry(1)
+    assert store.query_all('SELECT owner FROM txs WHERE id = 1') == [(None,)]
@@ -0,0 +1,87 @@
+import pytest
+from eth_tester import EthereumTester
+from web3 import Web3
+from web3.providers.eth_tester import EthereumTesterProvider
+
+from provider_pool import PooledProvider
+
+
+class FlakyProvider(EthereumTesterProvider):
+    """ A node of its own, which can be taken down."""
+
+    def __init__(self):
+        super().__init__(EthereumTester())
+        self.down = False
+        self.methods = []
+
+    def make_request(self, method, params):
+        self.methods.append(method)
+        if self.down:
+            raise ConnectionError('node is down')
+        return super().make_request(method, params)
+
+
+@pytest.fixture
+def nodes():
+    return [FlakyProvider() for _ in range(3)]
+
+@pytest.fixture
+def pool(nodes):
+    return PooledProvider(nodes, names=['a', 'b', 'c'], probe_interval=3600)
+
+@pytest.fixture
+def w3(pool):
+    return Web3(pool)
+
+def names(pool):
+    return [x.name for x in pool.ranked()]
+
+def test_probe_tracks_heads(w3, pool, nodes):
+    nodes[1].ethereum_tester.mine_blocks(2)
+    assert w3.eth.blockNumber in (0, 2)
+    assert [x.head for x in pool.endpoints] == [0, 2, 0]
+    assert pool.head == 2
+
+def test_lagging_node_ranked_last(w3, pool, nodes):
+    for node in nodes[1:]:
+        node.ethereum_tester.mine_blocks(5)
+    w3.eth.blockNumber
+    assert names(pool)[-1] == 'a'
+    assert w3.eth.blockNumber == 5
+
+def test_failing_node_ranked_last(w3, pool, nodes):
+    w3.eth.blockNumber
+    for _ in range(3):
+        pool.endpoints[0].record(0.0, ok=False)
+    assert names(pool)[-1] == 'a'
+
+def test_reads_fail_over(w3, pool, nodes):
+    w3.eth.blockNumber
+    best = pool.ranked()[0]
+    best.provider.down = True
+    del nodes[0].methods[:], nodes[1].methods[:], nodes[2].methods[:]
+
+    assert w3.eth.getBlock('latest')['number'] == 0
+    assert best.provider.methods == ['eth_getBlockByNumber']
+    assert best.errors[-1] == 1
+    assert sum(x.methods == ['eth_getBlockByNumber'] for x in nodes) == 2
+
+def test_accounts_only_from_primary(w3, pool, nodes):
+    w3.eth.blockNumber
+    assert w3.eth.accounts == list(nodes[0].ethereum_tester.get_accounts())
+    assert 'eth_accounts' not in nodes[1].methods + nodes[2].methods
+
+    nodes[0].down = True
+    with pytest.raises(ConnectionError):
+        w3.eth.accounts
+    assert 'eth_accounts' not in nodes[1].methods + nodes[2].methods
+
+def test_transactions_through_primary_first(w3, pool, nodes):
+    w3.eth.blockNumber
+    # a faster node is still not asked before the primary
+    pool.endpoints[0].latencies.append(1.0)
+    pool.endpoints[1].latencies.append(0.01)
+    txid = '0x' + '00' * 32
+    assert w3.eth.getTransaction(txid) is None
+    assert 'eth_getTransactionByHash' in nodes[0].methods
+    assert 'eth_getTransactionByHash' not in nodes[1].methods
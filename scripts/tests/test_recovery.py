@@ -0,0 +1,108 @@
+import pytest
+
+import recovery
+from db import TxStore
+from fakes import FakeChain, FakeWeb3
+from recovery import find_transaction_by_nonce, recover_intents
+
+OWNER = '0x' + '0a' * 20
+
+
+@pytest.fixture
+def eth(monkeypatch):
+    eth = FakeChain()
+    monkeypatch.setattr(recovery, 'batch_request', eth.batch_request)
+    return eth
+
+@pytest.fixture
+def store(tmpdir):
+    with TxStore(str(tmpdir / 'payouts.db')) as store:
+        store.import_txs([
+            {'name': f'r{x}', 'recipient': '0x' + f'{x:040x}', 'amount': x, 'bucket': 0}
+            for x in range(1, 4)
+        ])
+        yield store
+
+def expected_input(ids):
+    return 'mint ' + ','.join(map(str, ids))
+
+def recover(eth, store):
+    return recover_intents(FakeWeb3(eth), store, expected_input)
+
+def txids(store):
+    return [x for x, in store.query_all('SELECT txid FROM txs ORDER BY id')]
+
+def test_find_transaction_by_nonce(eth):
+    for nonce in range(3):
+        eth.send(OWNER, nonce, f'mint {nonce}')
+    tx = find_transaction_by_nonce(FakeWeb3(eth), OWNER, 1, 0, chunk_size=2)
+    assert tx['input'] == 'mint 1'
+    assert find_transaction_by_nonce(FakeWeb3(eth), OWNER, 3, 0) is None
+
+def test_node_signed_intent_mined(eth, store):
+    store.log_intent([1, 2], OWNER, 0)
+    txid = eth.send(OWNER, 0, expected_input([1, 2]))
+
+    assert recover(eth, store) == 0
+    assert txids(store) == [txid, txid, None]
+    assert store.open_intents() == []
+
+def test_node_signed_intent_mined_with_other_input(eth, store):
+    # the nonce was used by another transaction
+    store.log_intent([1], OWNER, 0)
+    eth.send(OWNER, 0, expected_input([2]))
+
+    assert recover(eth, store) == 0
+    assert txids(store) == [None, None, None]
+    assert store.open_intents() == []
+
+def test_node_signed_intent_pending(eth, store):
+    eth.automine = False
+    store.log_intent([1], OWNER, 0)
+    eth.send(OWNER, 0, expected_input([1]))
+
+    # held back, until a later run finds it mined
+    assert recover(eth, store) == 1
+    assert txids(store) == [None, None, None]
+    assert len(store.open_intents()) == 1
+
+    eth.mine()
+    assert recover(eth, store) == 0
+    assert txids(store)[0] == eth.mined[OWNER, 0]
+
+def test_node_signed_intent_not_broadcast(eth, store):
+    store.log_intent([1], OWNER, 0)
+    assert recover(eth, store) == 0
+    assert txids(store) == [None, None, None]
+    assert store.open_intents() == []
+
+def test_locally_signed_intent_rebroadcast(eth, store):
+    txid = '0x' + 'ab' * 32
+    raw_tx = f'{OWNER}:0:{expected_input([3])}:{txid}'
+    store.log_intent([3], OWNER, 0, txid=txid, raw_tx=raw_tx)
+
+    assert recover(eth, store) == 0
+    assert eth.mined[OWNER, 0] == txid
+    assert txids(store) == [None, None, txid]
+
+def test_locally_signed_intent_nonce_used(eth, store):
+    txid = '0x' + 'ab' * 32
+    raw_tx = f'{OWNER}:0:{expected_input([3])}:{txid}'
+    store.log_intent([3], OWNER, 0, txid=txid, raw_tx=raw_tx)
+    eth.send(OWNER, 0, 'elsewhere')
+
+    # not rebroadcast, so it can't mint twice
+    assert recover(eth, store) == 0
+    assert txid not in eth.txs
+    assert txids(store) == [None, None, None]
+    assert store.open_intents() == []
+
+def test_intent_of_a_replacement(eth, store):
+    # a row that has a txid already keeps it as a replaced one
+    store.update_txid(1, '0x' + 'cd' * 32, nonce=0)
+    store.log_intent([1], OWNER, 0)
+    txid = eth.send(OWNER, 0, expected_input([1]))
+
+    assert recover(eth, store) == 0
+    assert txids(store)[0] == txid
+    assert store.replaced_txids([1]) == {1: ['0x' + 'cd' * 32]}
@@ -0,0 +1,72 @@
+import requests
+
+import aio
+import rpc
+from utils import get_chain
+
+
+def respond(payload):
+    """ A node answering `echo` batches: params [x] return x, except for
+    'error' (an error), 'missing' (no response) and 'reject' (the batch).
+    """
+    if any(x['params'] == ['reject'] for x in payload):
+        return {'jsonrpc': '2.0', 'id': None, 'error': 'Batch rejected'}
+    if any(x['params'] == ['down'] for x in payload):
+        raise requests.ConnectionError('down')
+    responses = []
+    for x in reversed(payload):
+        if x['params'] == ['error']:
+            responses.append({'id': x['id'], 'error': 'Failed'})
+        elif x['params'] != ['missing']:
+            responses.append({'id': x['id'], 'result': x['params'][0]})
+    return responses
+
+class EchoRPC(aio.AsyncRPC):
+    async def _send(self, payload):
+        return respond(payload)
+
+def describe(results):
+    return [str(x) if isinstance(x, rpc.RPCError) else x for x in results]
+
+
+PARAMS = [['a'], ['error'], ['b'], ['missing'], ['reject'], ['c'], ['down']]
+EXPECTED = [
+    'a', 'Failed', 'b', 'Missing response', 'Batch rejected', 'Batch rejected', 'down',
+]
+
+def test_batches_fail_per_request(monkeypatch):
+    batches = []
+    def send(payload):
+        batches.append(len(payload))
+        return respond(payload)
+    monkeypatch.setattr(rpc, 'batch_sender', lambda w3, workers: send)
+
+    results = rpc.batch_request(get_chain('tester'), 'echo', PARAMS, batch_size=2)
+    assert describe(results) == EXPECTED
+    assert sorted(batches) == [1, 2, 2, 2]
+
+def test_providers_without_batches_are_called_per_request():
+    w3 = get_chain('tester')
+    txid = '0x' + 'aa' * 32
+    assert rpc.get_receipts(w3, [txid, txid]) == {txid: None}
+    assert rpc.batch_request(w3, 'eth_blockNumber', [[], []]) == [0, 0]
+
+def test_batch_results_in_request_order():
+    batch = [(3, ['a']), (1, ['error']), (2, ['missing'])]
+    assert describe(rpc.batch_results(batch, respond(rpc.batch_payload('echo', batch)))) \
+        == ['a', 'Failed', 'Missing response']
+    assert describe(rpc.batch_results(batch, OSError('down'))) == ['down'] * 3
+
+def test_sync_and_async_batches_agree(monkeypatch):
+    monkeypatch.setattr(rpc, 'batch_sender', lambda w3, workers: respond)
+    results = rpc.batch_request(get_chain('tester'), 'echo', PARAMS, batch_size=2)
+    assert describe(results) == EXPECTED
+
+    async def main():
+        return await EchoRPC(1).batch('echo', PARAMS, batch_size=2)
+    assert describe(aio.run(main)) == EXPECTED
+
+def test_by_txid_formats_found_results():
+    found = {'blockNumber': '0x1'}
+    results = rpc.by_txid(['0x1', '0x2'], [found, None], lambda x: dict(x, found=True))
+    assert results == {'0x1': {'blockNumber': '0x1', 'found': True}, '0x2': None}
@@ -0,0 +1,81 @@
+import json
+
+import pytest
+import rlp
+from eth_keyfile import create_keyfile_json
+from eth_keys import keys
+from eth_utils import decode_hex, encode_hex, keccak
+
+from db import TxStore
+from fakes import FakeChain, FakeWeb3
+from pipeline import PayoutPipeline
+from signer import LocalSender, LocalSigner, load_key
+
+PRIVATE_KEY = b'\x01' * 32
+RECIPIENT = '0x' + '22' * 20
+
+
+@pytest.fixture
+def keyfile(tmpdir):
+    path = tmpdir / 'UTC--test'
+    path.write(json.dumps(
+        create_keyfile_json(PRIVATE_KEY, b'secret', kdf='pbkdf2', iterations=2)))
+    return str(path)
+
+def signer_of(raw_tx, chain_id=None):
+    nonce, gas_price, gas, to, value, data, v, r, s = rlp.decode(decode_hex(raw_tx))
+    v = int.from_bytes(v, 'big')
+    if chain_id:
+        unsigned = [nonce, gas_price, gas, to, value, data, chain_id, 0, 0]
+        v -= 35 + 2 * chain_id
+    else:
+        unsigned = [nonce, gas_price, gas, to, value, data]
+        v -= 27
+    signature = keys.Signature(vrs=(
+        v, int.from_bytes(r, 'big'), int.from_bytes(s, 'big')))
+    return signature.recover_public_key_from_msg_hash(keccak(rlp.encode(unsigned)))
+
+TX = {'nonce': 3, 'gasPrice': 10 ** 9, 'gas': 21_000, 'to': RECIPIENT, 'value': 1}
+
+@pytest.mark.parametrize('chain_id', [None, 1])
+def test_transactions_are_signed_by_the_keyfile_account(keyfile, chain_id):
+    signer = LocalSigner(keyfile, chain_id=chain_id, password='secret')
+    assert signer.address == keys.PrivateKey(PRIVATE_KEY).public_key.to_checksum_address()
+
+    txid, raw_tx = signer.sign(TX)
+    assert txid == encode_hex(keccak(decode_hex(raw_tx)))
+    assert signer_of(raw_tx, chain_id).to_checksum_address() == signer.address
+
+def test_keys_are_decrypted_once(keyfile):
+    assert load_key(keyfile, 'secret') is load_key(keyfile)
+
+class RawChain(FakeChain):
+    def sendRawTransaction(self, raw_tx):
+        fields = rlp.decode(decode_hex(raw_tx))
+        return self.send(
+            signer_of(raw_tx).to_checksum_address(),
+            int.from_bytes(fields[0], 'big'),
+            encode_hex(fields[5]),
+            txid=encode_hex(keccak(decode_hex(raw_tx))))
+
+def test_pipeline_broadcasts_signed_transactions(keyfile, tmpdir):
+    eth = RawChain()
+    signer = LocalSigner(keyfile, password='secret')
+    def build(payout):
+        return {'to': RECIPIENT, 'data': f'0x{payout[0]:02x}', 'gas': 21_000, 'gasPrice': 1}
+
+    with TxStore(str(tmpdir / 'payouts.db')) as store:
+        store.import_txs([
+            {'name': f'r{x}', 'recipient': RECIPIENT, 'amount': x, 'bucket': 0}
+            for x in range(1, 4)
+        ])
+        w3 = FakeWeb3(eth)
+        PayoutPipeline(
+            w3, signer.address, store, LocalSender(w3, signer, build), poll_interval=0,
+        ).run([(x, RECIPIENT, x, 0) for x in range(1, 4)])
+        txids = store.query_all('SELECT id, txid FROM txs ORDER BY id')
+
+    owner = signer.address.lower()
+    assert [eth.txs[eth.mined[owner, x]]['input'] for x in range(3)] == \
+        ['0x01', '0x02', '0x03']
+    assert txids == [(x + 1, eth.mined[owner, x]) for x in range(3)]
@@ -0,0 +1,68 @@
+import pytest
+
+import aio
+from db import TxStore
+from distribute import verify_chunk, watch_txs
+from fakes import FakeRPC, TXID_A, TXID_B, raw_block, raw_receipt
+
+RECIPIENT = '0x' + '11' * 20
+
+
+@pytest.fixture
+def store(tmpdir):
+    with TxStore(str(tmpdir / 'payouts.db')) as store:
+        store.import_txs([
+            {'name': 'alice', 'recipient': RECIPIENT, 'amount': 10 ** 18, 'bucket': 0}])
+        yield store
+
+def row(store):
+    return store.query_all('SELECT id, txid, block_number FROM txs')[0]
+
+def verify(store, rpc_kwargs):
+    async def main():
+        rpc = FakeRPC(**rpc_kwargs)
+        id_, txid, _ = row(store)
+        return await verify_chunk(rpc, store, [(id_, txid)], verbose=False)
+    return aio.run(main)
+
+def test_replaced_txid_mined_instead(store):
+    store.update_txid(1, TXID_A, nonce=0)
+    store.replace_txid(1, TXID_B, nonce=0)
+
+    assert verify(store, dict(receipts={TXID_A: raw_receipt(TXID_A, 5)})) == []
+    assert row(store) == (1, TXID_A, 5)
+    # the replacement is still looked for, in case of a reorg
+    assert store.replaced_txids([1]) == {1: [TXID_A, TXID_B]}
+
+def test_failed_txid_of_an_earlier_attempt(store):
+    store.update_txid(1, TXID_A, nonce=0)
+    store.mark_tx_for_retry(1)
+    store.update_txid(1, TXID_B, nonce=1)
+
+    receipts = {TXID_A: raw_receipt(TXID_A, 5, status=0)}
+    assert verify(store, dict(receipts=receipts)) == []
+    assert row(store) == (1, TXID_B, None)
+
+def test_failed_txid_is_reported(store):
+    store.update_txid(1, TXID_A, nonce=0)
+
+    receipts = {TXID_A: raw_receipt(TXID_A, 5, status=0)}
+    assert verify(store, dict(receipts=receipts)) == [(1, TXID_A, 'Fail')]
+    assert row(store) == (1, TXID_A, None)
+
+def test_watch_reports_receipts(store):
+    store.update_txid(1, TXID_A, nonce=0)
+    receipts = {TXID_A: raw_receipt(TXID_A, 5, gas_used=42_000)}
+    blocks = {x: raw_block(x) for x in range(6)}
+    blocks[5]['transactions'] = [TXID_A]
+    seen = []
+
+    async def main():
+        rpc = FakeRPC(head=5, receipts=receipts, blocks=blocks)
+        await watch_txs(
+            rpc, store, poll_interval=0, finality_depth=1,
+            on_receipt=lambda txid, receipt: seen.append((txid, receipt['gasUsed'])))
+    aio.run(main)
+
+    assert seen == [(TXID_A, 42_000)]
+    assert store.query_all('SELECT success FROM txs') == [(1,)]
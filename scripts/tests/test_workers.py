@@ -0,0 +1,33 @@
+import threading
+
+import pytest
+
+from distribute import run_workers, until_stopped
+
+OWNERS = ['0x' + f'{x:02x}' * 20 for x in range(1, 4)]
+
+
+def test_every_owner_takes_its_shard():
+    shards = {}
+    def worker(owner, shard, stopped):
+        shards[owner] = shard
+    run_workers(OWNERS, worker)
+    assert shards == dict(zip(OWNERS, range(3)))
+
+def test_failed_worker_stops_the_others():
+    taken = []
+    failed = threading.Event()
+
+    def worker(owner, shard, stopped):
+        if shard == 0:
+            failed.set()
+            raise ValueError('insufficient funds')
+        failed.wait()
+        for payout in until_stopped(range(100), stopped):
+            taken.append(payout)
+            stopped.wait(0.01)
+
+    with pytest.raises(ValueError):
+        run_workers(OWNERS, worker)
+    # each worker finished the payout it had taken, and no more
+    assert len(taken) < 10
@@ -2,12 +2,17 @@ from inspect import getsourcefile
 from os.path import abspath
 from pathlib import Path
 from typing import List
+from decimal import Decimal, localcontext
 import pathlib
 import json
 import csv
 import sys
 import web3
 
+# In-process chains (tester, testrpc), shared by every `get_chain` call,
+# so that commands run from the same process see the same chain.
+_local_chains = {}
+
 def geth_ipc(chain_name: str) -> str:
     """ Get the geth IPC path for any chain.
 
@@ -36,10 +41,18 @@ def parity_ipc() -> str:
     return str(Path.home() / parity_path / 'jsonrpc.ipc')
 
 def get_chain(provider: str, chain_name='mainnet', infura_key='') -> web3.Web3:
-    """ A convenient wrapper for most common web3 backend sources."""
+    """ A convenient wrapper for most common web3 backend sources.
+
+    Args:
+        provider: tester, testrpc, http, parity, geth, infura, an http(s)://
+            endpoint or a .ipc path. A comma separated list of these pools
+            all of them in a `PooledProvider`, with the first as primary.
+    """
     from web3 import Web3, HTTPProvider, IPCProvider, TestRPCProvider
     from web3.providers.eth_tester import EthereumTesterProvider
     from eth_tester import EthereumTester
+    from provider_pool import PooledProvider
+    import metrics
 
     infura_url = f'https://{chain_name}.infura.io/{infura_key}'
     providers = {
@@ -50,7 +63,27 @@ def get_chain(provider: str, chain_name='mainnet', infura_key='') -> web3.Web3:
         'geth': lambda: IPCProvider(geth_ipc(chain_name)),
         'infura': lambda: HTTPProvider(infura_url)
     }
-    return Web3(providers[provider]())
+
+    def make_provider(name):
+        if name in ['tester', 'testrpc']:
+            if name not in _local_chains:
+                _local_chains[name] = providers[name]()
+            return _local_chains[name]
+        if name in providers:
+            return providers[name]()
+        if name.startswith(('http://', 'https://')):
+            return HTTPProvider(name)
+        if name.endswith('.ipc'):
+            return IPCProvider(name)
+        raise ValueError(f'Unknown provider "{name}"')
+
+    names = [x.strip() for x in provider.split(',')]
+    if len(names) == 1:
+        w3 = Web3(make_provider(names[0]))
+    else:
+        w3 = Web3(PooledProvider([make_provider(x) for x in names], names=names))
+    w3.middleware_stack.add(metrics.rpc_middleware, name='metrics')
+    return w3
 
 def script_source_dir() -> pathlib.Path:
     """ Return the absolute path of *this* python file,
@@ -59,9 +92,28 @@ def script_source_dir() -> pathlib.Path:
     executed_file = Path(abspath(getsourcefile(lambda:0)))
     return executed_file.parent
 
-def load_json(filename):
+PROJECT_DIR = script_source_dir().parent
+# code shared with the deploy scripts is imported from the deploy package
+# (`from deploy.artifacts import ...`)
+if str(PROJECT_DIR) not in sys.path:
+    sys.path.append(str(PROJECT_DIR))
+
+def ether_to_wei(amount) -> int:
+    """ Convert an amount of ether (or VIEW) into integer wei, exactly.
+
+    Args:
+        amount: A decimal string ('1,000.5'), int or Decimal.
+    """
+    with localcontext() as ctx:
+        ctx.prec = 100
+        wei = Decimal(str(amount).replace(',', '')).scaleb(18)
+    if wei != wei.to_integral_value():
+        raise ValueError(f'{amount} has more than 18 decimals')
+    return int(wei)
+
+def load_json(filename, **kwargs):
     with open(filename, 'r') as f:
-        return json.loads(f.read())
+        return json.loads(f.read(), **kwargs)
 
 def load_csv_to_dict(csv_file: str) -> List[dict]:
     """
@@ -0,0 +1,41 @@
+import pytest
+
+from populus.chain.base import BaseChain
+
+from deploy.artifacts import CachedProject
+from helpers import snapshot
+
+
+@pytest.fixture(scope='session')
+def session_chain(request) -> BaseChain:
+    """ A tester chain shared by the whole test session.
+
+    Under pytest-xdist (`pytest -n auto`), every worker process runs its
+    own session, and so owns its own chain. Compiled contracts are loaded
+    from the artifact cache, so solc only runs again once the sources or
+    the compiler settings have changed.
+    """
+    project = CachedProject(str(request.config.rootdir))
+    with project.get_chain('tester') as chain:
+        yield chain
+
+@pytest.fixture(scope='module')
+def module_chain(session_chain: BaseChain) -> BaseChain:
+    """ The session's tester chain, reverted after each test module.
+
+    Module-scoped fixtures deploy their contracts on it. Every module
+    starts from the same pristine chain, so contract addresses and
+    account balances don't depend on which modules a worker ran before.
+    """
+    with snapshot(session_chain):
+        yield session_chain
+
+@pytest.fixture(autouse=True)
+def chain(session_chain: BaseChain) -> BaseChain:
+    """ The session's tester chain, reverted after each test.
+
+    pytest (3.5 and later) sets up higher-scoped fixtures first, so the
+    module's contracts are deployed before this snapshot is taken.
+    """
+    with snapshot(session_chain):
+        yield session_chain
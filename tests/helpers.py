@@ -1,9 +1,12 @@
+from contextlib import contextmanager
+
 from web3.contract import Contract
 from populus.chain.base import BaseChain
 
 def deploy_contract(chain: BaseChain, contract_name: str, args=[]) -> Contract:
-    # deploy contract on chain with coinbase and optional init args
-    contract, _ = chain.provider.get_or_deploy_contract(
+    # deploy contract on chain with coinbase and optional init args,
+    # always a new instance, since the chain is shared by the whole session
+    contract, _ = chain.provider.deploy_contract(
         contract_name,
         deploy_args=args,
     )
@@ -16,3 +19,19 @@ def send_eth(chain, from_address, to_address, eth_to_send):
         'value': eth_to_send,
         'gas': 250000,
     })
+
+@contextmanager
+def snapshot(chain: BaseChain):
+    # revert the tester chain to its current state on exit
+    snapshot_id = chain.web3.testing.snapshot()
+    try:
+        yield chain
+    finally:
+        chain.web3.testing.revert(snapshot_id)
+
+def mine_until(chain: BaseChain, block_number: int):
+    # fast-forward the tester chain to `block_number` in a single request,
+    # instead of waiting for every block like `chain.wait.for_block`
+    blocks = block_number - chain.web3.eth.blockNumber
+    if blocks > 0:
+        chain.web3.testing.mine(blocks)
@@ -0,0 +1,42 @@
+import json
+
+import pytest
+
+from deploy import artifacts
+from deploy.artifacts import artifact_key, load_artifact
+
+
+@pytest.fixture
+def project_dir(tmpdir, monkeypatch):
+    # a build hash of its own, so solc isn't needed
+    monkeypatch.setattr(
+        artifacts, 'build_hash', lambda compilation: compilation['settings'])
+    tmpdir.join('contracts', 'Token.sol').write('contract Token {}', ensure=True)
+    tmpdir.join('project.json').write(json.dumps({'compilation': {
+        'contract_source_dirs': ['./contracts'], 'settings': 'optimize'}}))
+    return tmpdir
+
+def write_artifact(project_dir, key, contracts):
+    project_dir.join(artifacts.ARTIFACTS_DIR, f'{key}.json').write(
+        json.dumps(contracts), ensure=True)
+
+def test_load_artifact_of_the_current_build(project_dir):
+    key = artifact_key(str(project_dir))
+    assert key.endswith('-optimize')
+    assert load_artifact('Token', str(project_dir)) is None
+
+    write_artifact(project_dir, key, {'Token': {'bytecode': '0x01'}})
+    assert load_artifact('Token', str(project_dir)) == {'bytecode': '0x01'}
+    assert load_artifact('Other', str(project_dir)) is None
+
+def test_load_artifact_ignores_other_builds(project_dir):
+    sources = artifact_key(str(project_dir)).split('-')[0]
+    write_artifact(project_dir, f'{sources}-other', {'Token': {'bytecode': '0x02'}})
+    assert load_artifact('Token', str(project_dir)) is None
+
+def test_load_artifact_ignores_other_sources(project_dir):
+    key = artifact_key(str(project_dir))
+    write_artifact(project_dir, key, {'Token': {'bytecode': '0x01'}})
+    project_dir.join('contracts', 'Token.sol').write('contract Token { }')
+    assert artifact_key(str(project_dir)) != key
+    assert load_artifact('Token', str(project_dir)) is None
@@ -1,6 +1,10 @@
 import pytest
 
-from eth_utils import to_wei, is_same_address
+from eth_utils import (
+    function_signature_to_4byte_selector,
+    is_same_address,
+    to_wei,
+)
 from web3.contract import Contract
 from populus.chain.base import BaseChain
 from ethereum.tester import TransactionFailed
@@ -9,6 +13,12 @@ from helpers import deploy_contract
 
 contract_name = 'ViewTokenMintage'
 
+# `mint` and `mintBatch` as DSGuard signatures (left aligned selectors)
+mint_signatures = [
+    function_signature_to_4byte_selector(x).ljust(32, b'\0')
+    for x in ['mint(address,uint256,uint8)', 'mintBatch(address[],uint256[],uint8)']
+]
+
 class CategoryId:
     Team       = 0
     Supporters = 1
@@ -23,15 +33,15 @@ def assert_last_tokens_minted(contract: Contract, recipient, tokens):
     assert event['tokens'] == tokens
 
 
-@pytest.fixture()
-def token(chain: BaseChain) -> Contract:
+@pytest.fixture(scope='module')
+def token(module_chain: BaseChain) -> Contract:
     """ The VIEW ERC-20 Token contract. """
-    return deploy_contract(chain, 'DSToken', args=['VIEW'])
+    return deploy_contract(module_chain, 'DSToken', args=['VIEW'])
 
-@pytest.fixture()
-def instance(chain: BaseChain, token: Contract) -> Contract:
+@pytest.fixture(scope='module')
+def instance(module_chain: BaseChain, token: Contract) -> Contract:
     contract = deploy_contract(
-        chain, contract_name, args=[token.address])
+        module_chain, contract_name, args=[token.address])
     token.transact().setOwner(contract.address)
     return contract
 
@@ -103,6 +113,111 @@ def test_mint_fails_when_not_authorized(chain, instance, token, recipient):
         instance.transact(
             {"from": recipient}).mint(recipient, 1, CategoryId.Team)
 
+def test_mint_permitted_by_authority(chain, instance, token, recipient, recipient2):
+    # extra minters are permitted through a DSGuard authority,
+    # as `TokenMintage.permit_minters` does
+    minter = recipient
+    authority = deploy_contract(chain, 'DSGuard')
+    instance.transact().setAuthority(authority.address)
+    for sig in mint_signatures:
+        authority.transact().permit(minter, instance.address, sig)
+
+    instance.transact({'from': minter}).mint(recipient2, 1, CategoryId.Team)
+    instance.transact({'from': minter}).mintBatch([recipient2], [2], CategoryId.Team)
+    assert token.call().balanceOf(recipient2) == 3
+
+    # only minting is permitted
+    with pytest.raises(TransactionFailed):
+        instance.transact({'from': minter}).destruct(minter)
+
+    # and no longer, once forbidden again
+    for sig in mint_signatures:
+        authority.transact().forbid(minter, instance.address, sig)
+    with pytest.raises(TransactionFailed):
+        instance.transact({'from': minter}).mint(recipient2, 1, CategoryId.Team)
+    with pytest.raises(TransactionFailed):
+        instance.transact({'from': minter}).mintBatch([recipient2], [1], CategoryId.Team)
+    assert token.call().balanceOf(recipient2) == 3
+
+def test_mint_not_permitted_to_others(chain, instance, recipient, recipient2):
+    minter, other = recipient, recipient2
+    authority = deploy_contract(chain, 'DSGuard')
+    instance.transact().setAuthority(authority.address)
+    authority.transact().permit(minter, instance.address, mint_signatures[0])
+
+    with pytest.raises(TransactionFailed):
+        instance.transact({'from': other}).mint(other, 1, CategoryId.Team)
+    with pytest.raises(TransactionFailed):
+        instance.transact({'from': minter}).mintBatch([other], [1], CategoryId.Team)
+    # the owner still may
+    instance.transact().mint(other, 1, CategoryId.Team)
+
+def test_mint_batch(chain, instance, token, recipient, recipient2):
+    category = lambda category: instance.call().categories(category)
+
+    instance.transact().mintBatch(
+        [recipient, recipient2],
+        [to_wei(1, 'ether'), to_wei(2, 'ether')],
+        CategoryId.Creators)
+
+    events = instance.pastEvents('TokensMinted').get()[-2:]
+    assert [x['args']['recipient'] for x in events] == [recipient, recipient2]
+    assert [x['args']['tokens'] for x in events] == \
+        [to_wei(1, 'ether'), to_wei(2, 'ether')]
+    assert token.call().balanceOf(recipient) == to_wei(1, 'ether')
+    assert token.call().balanceOf(recipient2) == to_wei(2, 'ether')
+    assert token.call().balanceOf(instance.address) == 0
+    assert category(CategoryId.Creators)[1] == to_wei(3, 'ether')
+
+def test_mint_batch_fails_after_cap_reached(chain, instance, token, recipient, recipient2):
+    category = lambda category: instance.call().categories(category)
+
+    team_mint_max = category(CategoryId.Team)[0]
+    instance.transact().mint(recipient, team_mint_max - 1, CategoryId.Team)
+
+    # the whole batch fails if its total exceeds the cap
+    with pytest.raises(TransactionFailed):
+        instance.transact().mintBatch(
+            [recipient, recipient2], [1, 1], CategoryId.Team)
+    assert category(CategoryId.Team)[1] == team_mint_max - 1
+    assert token.call().balanceOf(recipient2) == 0
+
+    instance.transact().mintBatch([recipient2], [1], CategoryId.Team)
+    assert category(CategoryId.Team)[1] == team_mint_max
+
+def test_mint_batch_fails_when_input_invalid(chain, instance, token, recipient, recipient2):
+    with pytest.raises(TransactionFailed):
+        instance.transact().mintBatch([], [], CategoryId.Team)
+
+    with pytest.raises(TransactionFailed):
+        instance.transact().mintBatch(
+            [recipient, recipient2], [1], CategoryId.Team)
+
+    with pytest.raises(TransactionFailed):
+        instance.transact().mintBatch(
+            [recipient, recipient2], [1, 0], CategoryId.Team)
+
+def test_mint_batch_fails_when_not_authorized(chain, instance, token, recipient):
+    with pytest.raises(TransactionFailed):
+        instance.transact(
+            {"from": recipient}).mintBatch([recipient], [1], CategoryId.Team)
+
+def test_mint_batch_gas_per_recipient(chain, web3, instance, accounts):
+    gas_used = lambda txid: web3.eth.getTransactionReceipt(txid)['gasUsed']
+    single_recipients = accounts[1:5]
+    batch_recipients = accounts[5:9]
+
+    single_gas = sum(
+        gas_used(instance.transact().mint(x, 1, CategoryId.Team))
+        for x in single_recipients
+    )
+    batch_gas = gas_used(instance.transact().mintBatch(
+        batch_recipients, [1] * len(batch_recipients), CategoryId.Team))
+
+    # a batch must be cheaper per recipient than minting one by one
+    assert batch_gas / len(batch_recipients) < \
+        single_gas / len(single_recipients)
+
 def test_destruct(chain, instance, token, owner):
     instance.transact().mint(owner, 1, CategoryId.Team)
     instance.transact().destruct(owner)
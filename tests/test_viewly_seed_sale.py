@@ -6,7 +6,7 @@ from web3.contract import Contract
 from populus.chain.base import BaseChain
 from ethereum.tester import TransactionFailed
 
-from helpers import deploy_contract, send_eth
+from helpers import deploy_contract, send_eth, mine_until
 
 
 MAX_TOKENS      = to_wei(10000000, 'ether')
@@ -47,16 +47,16 @@ def assert_last_collect_eth_event(sale, collected, total_eth):
     assert event['ethCollected'] == collected
     assert event['totalEthDeposited'] == total_eth
 
-@pytest.fixture()
-def token(chain: BaseChain) -> Contract:
+@pytest.fixture(scope='module')
+def token(module_chain: BaseChain) -> Contract:
     """ A VIEW token contract. """
-    return deploy_contract(chain, 'DSToken', args=['VIEW'])
+    return deploy_contract(module_chain, 'DSToken', args=['VIEW'])
 
-@pytest.fixture()
-def sale(chain: BaseChain, token: Contract, beneficiary) -> Contract:
+@pytest.fixture(scope='module')
+def sale(module_chain: BaseChain, token: Contract, beneficiary) -> Contract:
     """ A blank ViewlySeedSale contract. """
     args = [token.address, beneficiary]
-    seed_sale = deploy_contract(chain, 'ViewlySeedSale', args=args)
+    seed_sale = deploy_contract(module_chain, 'ViewlySeedSale', args=args)
     token.transact().setOwner(seed_sale.address)
     return seed_sale
 
@@ -64,7 +64,7 @@ def sale(chain: BaseChain, token: Contract, beneficiary) -> Contract:
 def running_sale(chain: BaseChain, token: Contract, sale) -> Contract:
     """ A running ViewlySeedSale contract. """
     sale.transact().startSale(DURATION, BLOCK_OFFSET)
-    chain.wait.for_block(sale.call().startBlock())
+    mine_until(chain, sale.call().startBlock())
     return sale
 
 @pytest.fixture
@@ -79,9 +79,9 @@ def customer(accounts) -> str:
 def customer2(accounts) -> str:
     return accounts[2]
 
-@pytest.fixture
-def beneficiary(accounts) -> str:
-    return accounts[3]
+@pytest.fixture(scope='module')
+def beneficiary(module_chain) -> str:
+    return module_chain.web3.eth.accounts[3]
 
 
 def test_init(chain, token, beneficiary):
@@ -221,7 +221,7 @@ def test_extend_sale(chain: BaseChain, token, running_sale, customer):
     sale = running_sale
 
     # buying something on end block should not succeed
-    chain.wait.for_block(sale.call().endBlock())
+    mine_until(chain, sale.call().endBlock())
     with pytest.raises(TransactionFailed):
         send_eth(chain, customer, sale.address, to_wei(1, 'ether'))
 